@@ -0,0 +1,247 @@
+"""
+Semantic cache of `question_answering` replies, per document.
+
+Community users ask the same question about the same article in many
+wordings ("what's the main point?", "main takeaway?"). The exact-match
+response cache misses those, so answered questions are also kept here: each
+document (by content hash) gets a small NumPy matrix of question embeddings,
+and a new question whose closest cached question scores at least
+`threshold` (cosine) gets that answer without calling the model.
+
+`QuestionEmbedder` is local and offline: hashed word, word-pair and
+character n-gram features, after folding common paraphrases ("takeaway",
+"gist" -> "point") into one word. Questions that mention different numbers,
+differ in negation or ask "why" instead of "when" never match, whatever
+their score.
+
+A fraction (`audit_rate`) of hits is checked by answering the question
+anyway; a fresh answer that disagrees with the cached one counts as a false
+hit and replaces it for that wording.
+
+Metrics: `semantic_cache_lookups_total{result}`, `semantic_cache_similarity`
+(closest score per lookup) and `semantic_cache_audits_total{result}`.
+"""
+import random
+import re
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from metrics import SEMANTIC_CACHE_AUDITS, SEMANTIC_CACHE_LOOKUPS, SEMANTIC_CACHE_SIMILARITY
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Words that carry no meaning in a question about a known article
+FILLER = frozenset(
+    "a an the is are was were be been being am do does did of in on at to for from by with about into this that "
+    "these those it its there their they them me my i you your we our us can could would should will please "
+    "tell explain give say says said article post piece text blog story here during main get got s".split()
+)
+# Question words decide what is asked; "which" asks the same as "what"
+QUESTION_WORDS = {
+    "what": "what", "which": "what", "who": "who", "whom": "who", "whose": "who",
+    "when": "when", "where": "where", "why": "why", "how": "how",
+}
+NEGATIONS = frozenset("not no never none nothing without cannot".split())
+
+# Wordings that mean the same thing in questions about an article
+SYNONYMS = {
+    "takeaway": "point", "takeaways": "point", "gist": "point", "message": "point", "idea": "point",
+    "ideas": "point", "thesis": "point", "argument": "point", "points": "point", "crux": "point",
+    "key": "main", "central": "main", "primary": "main", "core": "main", "biggest": "main", "major": "main",
+    "started": "founded", "launched": "founded", "created": "founded", "began": "founded", "start": "founded",
+    "readers": "audience", "reader": "audience", "readership": "audience",
+    "wrote": "author", "written": "author", "write": "author", "writer": "author", "authors": "author",
+    "summary": "summarize", "summarise": "summarize", "overview": "summarize", "recap": "summarize",
+    "mentions": "mention", "mentioned": "mention", "discusses": "mention", "discussed": "mention", "discuss": "mention",
+    "conclusion": "conclude", "concludes": "conclude", "concluded": "conclude",
+    "suggests": "recommend", "suggest": "recommend", "recommends": "recommend", "recommended": "recommend",
+    "advice": "recommend", "advises": "recommend",
+}
+
+def _stem(token):
+    """Strips common English suffixes so "changed", "changes" and "change" compare equal."""
+    if len(token) > 5 and token.endswith("ing"):
+        token = token[:-3]
+    elif len(token) > 4 and token.endswith(("ed", "es")):
+        token = token[:-2]
+    elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return token[:-1] if len(token) > 4 and token.endswith("e") else token
+
+def question_terms(question):
+    """Content words of `question`, with paraphrases folded together and suffixes stripped."""
+    terms = []
+    text = question.lower().replace("’", "'").replace("can't", "can not").replace("n't", " not")
+    for token in _TOKEN_RE.findall(text):
+        token = SYNONYMS.get(token, token)
+        if token not in FILLER:
+            terms.append(token if token in NEGATIONS or token.isdigit() else _stem(token))
+    return terms
+
+def _signature(terms):
+    # Numbers, negation and the question word change what is asked, however similar the rest
+    return (
+        frozenset(t for t in terms if t.isdigit()),
+        any(t in NEGATIONS for t in terms),
+        frozenset(QUESTION_WORDS[t] for t in terms if t in QUESTION_WORDS),
+    )
+
+def _compatible(a, b):
+    """Whether two question signatures may share an answer. "main point?" has no question word and fits any."""
+    return a[:2] == b[:2] and (not a[2] or not b[2] or a[2] == b[2])
+
+class QuestionEmbedder:
+    """Hashing embedder for short questions; rows are L2-normalized."""
+    def __init__(self, dim=1024, ngram=4):
+        self.dim = dim
+        self.ngram = ngram
+
+    def _add(self, row, feature, weight):
+        h = zlib.crc32(feature.encode("utf-8"))
+        # The sign bit halves the damage done by hash collisions
+        row[h % self.dim] += weight if h & 0x80000000 else -weight
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            row = matrix[i]
+            # Question words are compared separately (see _signature)
+            terms = [t for t in question_terms(text) if t not in QUESTION_WORDS]
+            for term in terms:
+                self._add(row, term, 1.0)
+                padded = f"<{term}>"
+                # Character n-grams match inflections the synonym table does not list
+                for j in range(len(padded) - self.ngram + 1):
+                    self._add(row, "#" + padded[j:j + self.ngram], 0.25)
+            for first, second in zip(terms, terms[1:]):
+                self._add(row, f"{first} {second}", 0.5)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+Match = namedtuple("Match", "answer score question")
+
+class _DocumentEntries:
+    """Answered questions of one document: a growable embedding matrix with LRU slots."""
+    def __init__(self, dim, capacity):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(8, capacity), dim), dtype=np.float32)
+        self.questions = []
+        self.answers = []
+        self.signatures = []
+        self.last_used = []
+
+    def search(self, vector, threshold, signature, question):
+        """(slot, score) of the closest compatible question at or above `threshold` (slot None if there is none)."""
+        if not self.questions:
+            return None, 0.0
+        if question in self.questions:
+            # The same wording wins over paraphrases that embed identically, e.g. after an audit replaced its answer
+            slot = self.questions.index(question)
+            return slot, float(self.vectors[slot] @ vector)
+        scores = self.vectors[:len(self.questions)] @ vector
+        best = float(scores.max())
+        for slot in np.flatnonzero(scores >= threshold)[np.argsort(-scores[scores >= threshold])]:
+            if _compatible(self.signatures[slot], signature):
+                return int(slot), float(scores[slot])
+        return None, best
+
+    def put(self, vector, question, answer, signature, tick):
+        if question in self.questions:
+            slot = self.questions.index(question)
+        elif len(self.questions) < self.capacity:
+            slot = len(self.questions)
+            if slot == len(self.vectors):
+                grown = np.zeros((min(2 * slot, self.capacity), self.vectors.shape[1]), dtype=np.float32)
+                grown[:slot] = self.vectors
+                self.vectors = grown
+            self.questions.append(None)
+            self.answers.append(None)
+            self.signatures.append(None)
+            self.last_used.append(0)
+        else:
+            slot = int(np.argmin(self.last_used))
+        self.vectors[slot] = vector
+        self.questions[slot] = question
+        self.answers[slot] = answer
+        self.signatures[slot] = signature
+        self.last_used[slot] = tick
+
+class SemanticAnswerCache:
+    """
+    Answers by document key and question meaning.
+
+    At most `max_entries` questions are kept per document and `max_documents`
+    documents overall, each evicting the least recently used.
+    """
+    def __init__(self, embedder=None, threshold=0.85, max_entries=64, max_documents=256,
+                 audit_rate=0.0, audit_agreement=0.5):
+        self.embedder = embedder or QuestionEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_documents = max_documents
+        self.audit_rate = audit_rate
+        self.audit_agreement = audit_agreement
+        self._documents = OrderedDict()  # doc_key -> _DocumentEntries
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, question):
+        return self.embedder.embed([question])[0], _signature(question_terms(question))
+
+    def lookup(self, doc_key, question):
+        """A `Match` for a cached answer to `question` about `doc_key`, or None."""
+        vector, signature = self._embed(question)
+        with self._lock:
+            entries = self._documents.get(doc_key)
+            slot, score = entries.search(vector, self.threshold, signature, question) if entries else (None, 0.0)
+            hit = slot is not None
+            if hit:
+                self._documents.move_to_end(doc_key)
+                self._tick += 1
+                entries.last_used[slot] = self._tick
+                match = Match(entries.answers[slot], score, entries.questions[slot])
+        SEMANTIC_CACHE_SIMILARITY.observe(score)
+        SEMANTIC_CACHE_LOOKUPS.inc(result="hit" if hit else "miss")
+        return match if hit else None
+
+    def put(self, doc_key, question, answer):
+        vector, signature = self._embed(question)
+        with self._lock:
+            entries = self._documents.get(doc_key)
+            if entries is None:
+                entries = self._documents[doc_key] = _DocumentEntries(vector.shape[0], self.max_entries)
+            self._documents.move_to_end(doc_key)
+            self._tick += 1
+            entries.put(vector, question, answer, signature, self._tick)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def should_audit(self):
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def audit(self, doc_key, question, match, fresh_answer):
+        """
+        Compares a hit with a fresh answer to the same question. Returns True if they agree.
+
+        Answers are compared with the embedder, so rewordings of the same
+        answer agree. On disagreement the fresh answer is cached for this
+        wording, so the closest question for it is itself from then on.
+        """
+        vectors = self.embedder.embed([match.answer, fresh_answer])
+        agree = float(vectors[0] @ vectors[1]) >= self.audit_agreement
+        SEMANTIC_CACHE_AUDITS.inc(result="agree" if agree else "disagree")
+        if not agree:
+            self.put(doc_key, question, fresh_answer)
+        return agree
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "entries": sum(len(e.questions) for e in self._documents.values()),
+                "threshold": self.threshold,
+            }
@@ -1,57 +1,243 @@
+import asyncio
+
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from bson.errors import InvalidId
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict
+from typing import Optional
 
-from chatbot_logic import ArticleWriterModule, get_bot_response
+from chatbot_logic import (
+    ArticleWriterModule, get_bot_response_async, stream_bot_response_async, submit_bot_response_async,
+    load_session, save_session
+)
+from config import (
+    SESSION_BACKEND, SESSION_MAX_ENTRIES, SESSION_TTL, REDIS_URL,
+    DOCUMENT_BACKEND, DOCUMENT_MAX_BYTES, DOCUMENT_TTL, JOB_RETRY_AFTER
+)
+from document_registry import create_document_registry, fetch_article_text
+from jobs import QueueFull, create_job_queue, validate_callback_url
+from lazy import ProcessLocal
+from llm_scheduler import scope_fastapi, set_request
+from metrics import JOB_QUEUE_DEPTH, SESSIONS_ACTIVE, instrument_fastapi, stage
+from session_store import create_session_store
+from streaming import SSE_HEADERS, sse_event
 
-app = FastAPI(
-    title="Gemini Chatbot API",
-    description="An API for a multi-functional chatbot with summarization, Q&A, and an interactive article writer.",
-    version="1.0.0"
+# Chat routes, also mounted by server.py
+router = APIRouter(tags=["chat"])
+
+# Bounded, TTL-evicted session store; use SESSION_BACKEND=redis to share sessions across workers
+SESSIONS = ProcessLocal(
+    lambda: create_session_store(SESSION_BACKEND, max_entries=SESSION_MAX_ENTRIES, ttl=SESSION_TTL, redis_url=REDIS_URL)
+)
+# Documents registered once through /documents and referenced by doc_id on /chat
+DOCUMENTS = ProcessLocal(
+    lambda: create_document_registry(DOCUMENT_BACKEND, max_bytes=DOCUMENT_MAX_BYTES, ttl=DOCUMENT_TTL, redis_url=REDIS_URL)
 )
+# Article jobs for /chat with "job": true, run by `python jobs.py`
+JOBS = ProcessLocal(create_job_queue)
+if SESSION_BACKEND == "memory":
+    # Counting Redis sessions takes a keyspace SCAN, too costly for every scrape
+    SESSIONS_ACTIVE.set_function(lambda: len(SESSIONS.get()), service="api")
+JOB_QUEUE_DEPTH.set_function(lambda: JOBS.get().depth() if JOBS.initialized() else 0, service="api")
 
-SESSIONS: Dict[str, ArticleWriterModule] = {}
+async def _off_loop(store, fn, *args):
+    """Runs `fn(*args)` in a worker thread if `store` does blocking network I/O (Redis), else inline."""
+    if store.blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
 
 class ChatRequest(BaseModel):
     session_id: str
     message: str
-    text:str
+    text:str = ""
+    doc_id: Optional[str] = None
+    stream: bool = False
+    job: bool = False
+    callback_url: Optional[str] = None
 
 class ChatResponse(BaseModel):
     session_id: str
     response: str
 
-@app.post("/chat", response_model=ChatResponse)
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    session_id: Optional[str] = None
+    attempts: int
+    chars: int
+    cancel_requested: bool
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    response: Optional[str] = None
+    error: Optional[str] = None
+
+class DocumentRequest(BaseModel):
+    text: Optional[str] = None
+    article_id: Optional[str] = None
+
+class DocumentResponse(BaseModel):
+    doc_id: str
+    chars: int
+
+@router.post("/chat", response_model=ChatResponse)
 async def chat_with_bot(request: ChatRequest):
     """
     Main endpoint for interacting with the chatbot.
     
     - **session_id**: A unique identifier for the user's conversation.
     - **message**: The user's input message.
+    - **text** or **doc_id**: The article the conversation is about, inline or as registered via /documents.
+    - **stream**: If true, the reply is sent as server-sent events while it is generated.
+    - **job**: If true, the final article is generated by a job worker: the reply is a 202 with a
+      job_id to poll on /jobs/{job_id}. Other steps are answered as usual.
+    - **callback_url**: With job, the finished job is also POSTed here (hosts in JOB_CALLBACK_HOSTS).
     """
     session_id = request.session_id
     user_message = request.message
     text = request.text
     if not session_id or not user_message:
         raise HTTPException(status_code=400, detail="session_id and message are required.")
+    set_request(session=session_id)
+    if request.doc_id:
+        with stage("document_lookup"):
+            documents = DOCUMENTS.get()
+            text = await _off_loop(documents, documents.get, request.doc_id)
+        if text is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired doc_id. Please register the document again.")
+    if request.callback_url:
+        try:
+            validate_callback_url(request.callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     # Get or create a session for the user
-    if session_id not in SESSIONS:
-        SESSIONS[session_id] = ArticleWriterModule()
+    with stage("session_load"):
+        sessions = SESSIONS.get()
+        writer_module = await _off_loop(sessions, load_session, sessions, session_id)
+    if writer_module is None:
+        writer_module = ArticleWriterModule()
         print(f"New session created: {session_id}")
-    
-    writer_module = SESSIONS[session_id]
 
-    # Get the bot's response using our core logic
-    bot_reply = get_bot_response(user_message,text,writer_module)
-    
-    # Optional: Clean up session if the article writing process is finished
+    if request.job:
+        return await _submit_chat(session_id, user_message, text, writer_module, request.callback_url)
+
+    if request.stream:
+        return StreamingResponse(
+            _stream_chat(session_id, user_message, text, writer_module),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
+
+    # Get the bot's response using our core logic without blocking the event loop
+    bot_reply = await get_bot_response_async(user_message,text,writer_module)
+    await _save_session(session_id, writer_module, bot_reply)
+
+    return ChatResponse(session_id=session_id, response=bot_reply)
+
+async def _stream_chat(session_id, user_message, text, writer_module):
+    """Sends each chunk as a message event, then a `done` event with the full reply."""
+    parts = []
+    stream = stream_bot_response_async(user_message, text, writer_module)
+    try:
+        async for chunk in stream:
+            parts.append(chunk)
+            yield sse_event({"text": chunk})
+    finally:
+        # Close explicitly so an abandoned stream rolls the workflow back before it is saved
+        await stream.aclose()
+        bot_reply = "".join(parts).rstrip()
+        await _save_session(session_id, writer_module, bot_reply)
+    yield sse_event({"session_id": session_id, "response": bot_reply}, event="done")
+
+async def _submit_chat(session_id, user_message, text, writer_module, callback_url):
+    """Like a plain /chat turn, except that the final article is queued as a job (202)."""
+    def submit(call):
+        return JOBS.get().submit(
+            call.prompt_key, call.context_vars, prefix=call.prefix, session_id=session_id, callback_url=callback_url
+        )
+
+    try:
+        bot_reply, job = await submit_bot_response_async(user_message, text, writer_module, submit)
+    except QueueFull:
+        raise HTTPException(
+            status_code=429, detail="Too many articles are being written. Please try again shortly.",
+            headers={"Retry-After": str(JOB_RETRY_AFTER)}
+        )
+    if job is None:
+        await _save_session(session_id, writer_module, bot_reply)
+        return ChatResponse(session_id=session_id, response=bot_reply)
+    await _save_session(session_id, writer_module, "")
+    return JSONResponse(
+        {"session_id": session_id, "job_id": job["job_id"], "status": job["status"],
+         "response": f"Your article is being written. Check /jobs/{job['job_id']} for the result."},
+        status_code=202
+    )
+
+async def _save_session(session_id, writer_module, bot_reply):
+    with stage("session_save"):
+        sessions = SESSIONS.get()
+        await _off_loop(sessions, save_session, sessions, session_id, writer_module)
     if writer_module.stage == "idle" and "Here is your complete article" in bot_reply:
-         del SESSIONS[session_id]
          print(f"Session closed after article generation: {session_id}")
 
-    return ChatResponse(session_id=session_id, response=bot_reply)
+@router.post("/documents", response_model=DocumentResponse)
+def register_document(request: DocumentRequest):
+    """
+    Registers an article once so later /chat turns can refer to it by doc_id.
+
+    - **text**: The article text, or
+    - **article_id**: The id of an article in the Mongo collection.
+    """
+    if request.article_id:
+        try:
+            text = fetch_article_text(request.article_id)
+        except LookupError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid article_id.")
+        if text is None:
+            raise HTTPException(status_code=404, detail=f"Article with ID {request.article_id} not found.")
+    elif request.text:
+        text = request.text
+    else:
+        raise HTTPException(status_code=400, detail="text or article_id is required.")
+
+    try:
+        doc_id = DOCUMENTS.get().register(text)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return DocumentResponse(doc_id=doc_id, chars=len(text))
+
+@router.get("/jobs/{job_id}", response_model=JobResponse, response_model_exclude_none=True)
+def get_job(job_id: str):
+    """Status of an article job; `response` holds the article once `status` is "succeeded"."""
+    job = JOBS.get().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job_id.")
+    return job
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse, response_model_exclude_none=True)
+def cancel_job(job_id: str):
+    """Cancels a queued or running article job."""
+    job = JOBS.get().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job_id.")
+    if job["status"] in ("succeeded", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}.")
+    return job
+
+app = FastAPI(
+    title="Gemini Chatbot API",
+    description="An API for a multi-functional chatbot with summarization, Q&A, and an interactive article writer.",
+    version="1.0.0"
+)
+# /metrics and per-route request latency
+instrument_fastapi(app, "api")
+# Priority and fair-share flow of the LLM calls made for each request
+scope_fastapi(app)
+app.include_router(router)
 
 @app.get("/")
 def read_root():
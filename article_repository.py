@@ -0,0 +1,453 @@
+"""
+Shared MongoDB access for the article services.
+
+`mongodb_api.py` and `summaryapi.py` read articles through an
+`ArticleRepository`, which
+
+- fetches only the fields a route needs (see `PROJECTIONS`),
+- creates clients with explicit pool and timeout settings (`client_options`),
+- keeps hot documents in a bounded LRU+TTL cache that is invalidated by a
+  change stream, or by polling a version field (`updatedAt` by default) when
+  change streams are unavailable (standalone servers need a replica set).
+
+`AsyncArticleRepository` is the asyncio variant for `server.py`, on PyMongo's
+native async client (`create_async_client`); its invalidation runs as an
+asyncio task instead of a thread.
+
+Cached documents are shared between requests and must be treated as read-only.
+"""
+import asyncio
+import decimal
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from email.utils import format_datetime
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from document_registry import ARTICLE_TEXT_FIELDS
+from summary_worker import SUMMARY_SOURCE_PROJECTION
+
+# Fields fetched per view; None fetches the whole document
+PROJECTIONS = {
+    "details": None,
+    "summary": SUMMARY_SOURCE_PROJECTION,
+    "full_text": {"title": 1, **{name: 1 for name in ARTICLE_TEXT_FIELDS}},
+}
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))  # wait for a pooled connection
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+ARTICLE_CACHE_MAX_ENTRIES = int(os.getenv("ARTICLE_CACHE_MAX_ENTRIES", "1000"))  # 0 disables the cache
+ARTICLE_CACHE_TTL = float(os.getenv("ARTICLE_CACHE_TTL", "300"))  # upper bound on staleness, seconds
+# "auto" (change stream, polling fallback), "change_stream", "poll" or "none" (TTL only)
+ARTICLE_CACHE_INVALIDATION = os.getenv("ARTICLE_CACHE_INVALIDATION", "auto")
+ARTICLE_CACHE_POLL_INTERVAL = float(os.getenv("ARTICLE_CACHE_POLL_INTERVAL", "5"))
+ARTICLE_VERSION_FIELD = os.getenv("ARTICLE_VERSION_FIELD", "updatedAt")
+
+def client_options():
+    """Keyword arguments for MongoClient, so every service sizes its pool the same way."""
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "tlsAllowInvalidCertificates": True,
+    }
+
+def create_client(mongo_uri, **overrides):
+    from pymongo import MongoClient
+    return MongoClient(mongo_uri, **{**client_options(), **overrides})
+
+def create_async_client(mongo_uri, **overrides):
+    """PyMongo's asyncio client (the successor of Motor) with the same pool settings."""
+    from pymongo import AsyncMongoClient
+    return AsyncMongoClient(mongo_uri, **{**client_options(), **overrides})
+
+# === Serialization ===
+
+def json_default(o):
+    """
+    `default` hook for `json.dumps` that writes ObjectIds as strings.
+
+    Other values are encoded like Flask's default JSON provider (dates as
+    HTTP dates), so the Flask and ASGI services return the same JSON without
+    this module depending on Flask. The encoder calls it only for values it
+    cannot serialize itself, so documents are encoded in a single pass.
+    """
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, date):
+        if not isinstance(o, datetime):
+            o = datetime(o.year, o.month, o.day)
+        o = o.replace(tzinfo=timezone.utc) if o.tzinfo is None else o.astimezone(timezone.utc)
+        return format_datetime(o, usegmt=True)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+# === Cache ===
+
+class ArticleCache:
+    """Bounded LRU cache of article documents with a TTL, keyed by `_id` and view."""
+    def __init__(self, max_entries=1000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (_id, view) -> (expires_at, document)
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, see `token`
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def token(self):
+        """
+        Taken before reading a document from the database and passed to `put`.
+
+        If an invalidation arrives while the read is in flight, `put` skips the
+        possibly stale document instead of caching it until the TTL expires.
+        """
+        return self._generation
+
+    def get(self, article_id, view):
+        key = (article_id, view)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, article_id, view, document, token=None):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            self._entries[(article_id, view)] = (expires_at, document)
+            self._entries.move_to_end((article_id, view))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, article_id):
+        with self._lock:
+            self._generation += 1
+            for view in PROJECTIONS:
+                if self._entries.pop((article_id, view), None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+class CacheInvalidator:
+    """
+    Background thread that drops changed articles from an `ArticleCache`.
+
+    Follows a change stream when the server supports it; otherwise polls for
+    documents whose `version_field` moved past the last seen value, starting
+    from the newest one (or from the start time, as a UTC date, while no
+    article has the field). Polling cannot see deletes, so the cache TTL
+    bounds how long a deleted article is still served.
+    """
+    def __init__(self, collection, cache, mode="auto", poll_interval=5, version_field="updatedAt"):
+        self.collection = collection
+        self.cache = cache
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.version_field = version_field
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def _mark_started(self):
+        # BSON dates are naive UTC, so the fallback watermark compares like a stored `updatedAt`
+        self._started = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def _watermark(self, latest):
+        """Where polling starts: the newest version in the collection, else the start time."""
+        if latest is not None:
+            return latest
+        logging.warning(
+            f"No article has '{self.version_field}'; cache polling only sees articles whose "
+            f"'{self.version_field}' is set to a date after {self._started.isoformat()}Z."
+        )
+        return self._started
+
+    def start(self):
+        if self.mode == "none" or self._thread is not None:
+            return
+        self._mark_started()
+        self._thread = threading.Thread(target=self._run, name="article-cache-invalidator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self.mode in ("auto", "change_stream"):
+            try:
+                self._follow_change_stream()
+                return
+            except (OperationFailure, NotImplementedError) as e:
+                if self.mode == "change_stream":
+                    logging.error(f"Article change stream unavailable: {e}")
+                    return
+                logging.warning(f"Article change stream unavailable ({e}); polling {self.version_field} every {self.poll_interval}s.")
+        self._poll()
+
+    def _follow_change_stream(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+        while not self._stop.is_set():
+            try:
+                with self.collection.watch(pipeline) as stream:
+                    logging.info("Following article change stream for cache invalidation.")
+                    while not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            self.cache.invalidate(change["documentKey"]["_id"])
+            except OperationFailure:
+                raise
+            except PyMongoError as e:
+                # Changes may have been missed while disconnected
+                logging.warning(f"Article change stream interrupted ({e}); clearing the article cache.")
+                self.cache.clear()
+                self._stop.wait(self.poll_interval)
+
+    def _latest_version(self):
+        latest = self.collection.find_one(
+            {self.version_field: {"$exists": True}}, {self.version_field: 1}, sort=[(self.version_field, -1)]
+        )
+        return latest.get(self.version_field) if latest else None
+
+    def _poll(self):
+        since = None
+        while not self._stop.is_set():
+            try:
+                if since is None:
+                    since = self._watermark(self._latest_version())
+                else:
+                    query = {self.version_field: {"$gt": since}}
+                    for doc in self.collection.find(query, {self.version_field: 1}):
+                        self.cache.invalidate(doc["_id"])
+                        since = max(since, doc[self.version_field])
+            except PyMongoError as e:
+                logging.warning(f"Polling for changed articles failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+# === Repository ===
+
+class ArticleRepository:
+    """Reads articles by `_id` with per-view projections, through an optional `ArticleCache`."""
+    def __init__(self, collection, cache=None, invalidation="auto", poll_interval=5, version_field="updatedAt"):
+        self.collection = collection
+        self.cache = cache
+        self._invalidator = None
+        if cache is not None:
+            self._invalidator = CacheInvalidator(collection, cache, invalidation, poll_interval, version_field)
+            self._invalidator.start()
+
+    def get(self, article_id, view="details"):
+        """Returns the article's `view` fields, or None if it does not exist. Raises InvalidId for bad ids."""
+        oid = article_id if isinstance(article_id, ObjectId) else ObjectId(article_id)
+        if self.cache is None:
+            return self.collection.find_one({"_id": oid}, PROJECTIONS[view])
+        cached = self.cache.get(oid, view)
+        if cached is not None:
+            return cached
+        token = self.cache.token()
+        article = self.collection.find_one({"_id": oid}, PROJECTIONS[view])
+        if article is not None:
+            self.cache.put(oid, view, article, token)
+        return article
+
+    def get_many(self, article_ids, view="details"):
+        """Returns {_id: article} for the ids that exist, reading cache misses with one $in query."""
+        found, missing = {}, []
+        for oid in article_ids:
+            cached = self.cache.get(oid, view) if self.cache is not None else None
+            if cached is not None:
+                found[oid] = cached
+            else:
+                missing.append(oid)
+        if missing:
+            token = self.cache.token() if self.cache is not None else None
+            for article in self.collection.find({"_id": {"$in": missing}}, PROJECTIONS[view]):
+                found[article["_id"]] = article
+                if self.cache is not None:
+                    self.cache.put(article["_id"], view, article, token)
+        return found
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def close(self):
+        if self._invalidator is not None:
+            self._invalidator.stop()
+
+class AsyncCacheInvalidator(CacheInvalidator):
+    """`CacheInvalidator` for an async collection, running as an asyncio task."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._task = None
+
+    def start(self):
+        """Starts the task on the running event loop; call from async code."""
+        if self.mode == "none" or self._task is not None:
+            return
+        self._mark_started()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        if self.mode in ("auto", "change_stream"):
+            try:
+                await self._follow_change_stream()
+                return
+            except (OperationFailure, NotImplementedError) as e:
+                if self.mode == "change_stream":
+                    logging.error(f"Article change stream unavailable: {e}")
+                    return
+                logging.warning(f"Article change stream unavailable ({e}); polling {self.version_field} every {self.poll_interval}s.")
+        await self._poll()
+
+    async def _follow_change_stream(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+        while not self._stop.is_set():
+            try:
+                async with await self.collection.watch(pipeline) as stream:
+                    logging.info("Following article change stream for cache invalidation.")
+                    async for change in stream:
+                        self.cache.invalidate(change["documentKey"]["_id"])
+            except OperationFailure:
+                raise
+            except PyMongoError as e:
+                logging.warning(f"Article change stream interrupted ({e}); clearing the article cache.")
+                self.cache.clear()
+                await asyncio.sleep(self.poll_interval)
+
+    async def _latest_version(self):
+        latest = await self.collection.find_one(
+            {self.version_field: {"$exists": True}}, {self.version_field: 1}, sort=[(self.version_field, -1)]
+        )
+        return latest.get(self.version_field) if latest else None
+
+    async def _poll(self):
+        since = None
+        while not self._stop.is_set():
+            try:
+                if since is None:
+                    since = self._watermark(await self._latest_version())
+                else:
+                    query = {self.version_field: {"$gt": since}}
+                    async for doc in self.collection.find(query, {self.version_field: 1}):
+                        self.cache.invalidate(doc["_id"])
+                        since = max(since, doc[self.version_field])
+            except PyMongoError as e:
+                logging.warning(f"Polling for changed articles failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+class AsyncArticleRepository:
+    """`ArticleRepository` for an async collection; the invalidation task starts on first read."""
+    def __init__(self, collection, cache=None, invalidation="auto", poll_interval=5, version_field="updatedAt"):
+        self.collection = collection
+        self.cache = cache
+        self._invalidator = None
+        if cache is not None:
+            self._invalidator = AsyncCacheInvalidator(collection, cache, invalidation, poll_interval, version_field)
+
+    async def get(self, article_id, view="details"):
+        """Returns the article's `view` fields, or None if it does not exist. Raises InvalidId for bad ids."""
+        oid = article_id if isinstance(article_id, ObjectId) else ObjectId(article_id)
+        if self.cache is None:
+            return await self.collection.find_one({"_id": oid}, PROJECTIONS[view])
+        self._invalidator.start()
+        cached = self.cache.get(oid, view)
+        if cached is not None:
+            return cached
+        token = self.cache.token()
+        article = await self.collection.find_one({"_id": oid}, PROJECTIONS[view])
+        if article is not None:
+            self.cache.put(oid, view, article, token)
+        return article
+
+    async def get_many(self, article_ids, view="details"):
+        """Returns {_id: article} for the ids that exist, reading cache misses with one $in query."""
+        if self._invalidator is not None:
+            self._invalidator.start()
+        found, missing = {}, []
+        for oid in article_ids:
+            cached = self.cache.get(oid, view) if self.cache is not None else None
+            if cached is not None:
+                found[oid] = cached
+            else:
+                missing.append(oid)
+        if missing:
+            token = self.cache.token() if self.cache is not None else None
+            async for article in self.collection.find({"_id": {"$in": missing}}, PROJECTIONS[view]):
+                found[article["_id"]] = article
+                if self.cache is not None:
+                    self.cache.put(article["_id"], view, article, token)
+        return found
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def close(self):
+        if self._invalidator is not None:
+            self._invalidator.stop()
+
+def _repository_options():
+    cache = ArticleCache(ARTICLE_CACHE_MAX_ENTRIES, ARTICLE_CACHE_TTL) if ARTICLE_CACHE_MAX_ENTRIES > 0 else None
+    return {
+        "cache": cache,
+        "invalidation": ARTICLE_CACHE_INVALIDATION,
+        "poll_interval": ARTICLE_CACHE_POLL_INTERVAL,
+        "version_field": ARTICLE_VERSION_FIELD,
+    }
+
+def create_async_repository(collection):
+    """Async repository over `collection` using the ARTICLE_CACHE_* settings."""
+    return AsyncArticleRepository(collection, **_repository_options())
+
+def create_repository(collection):
+    """Repository over `collection` using the ARTICLE_CACHE_* settings."""
+    return ArticleRepository(collection, **_repository_options())
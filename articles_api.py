@@ -0,0 +1,299 @@
+"""
+Article routes of `mongodb_api.py` and `summaryapi.py` as an asyncio router.
+
+Mounted by `server.py` next to the chat routes, so all of them share one
+process-wide async MongoDB client, article cache and LLM client. Requests
+and responses keep the shapes of the Flask services, including their JSON
+encoding (ObjectIds as strings, Flask's date format, sorted keys).
+"""
+import asyncio
+import json
+import logging
+import os
+
+from bson import ObjectId
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from article_repository import create_async_client, create_async_repository, json_default
+from document_registry import article_text
+from lazy import ProcessLocal
+from llm_resilience import LLMError
+from metrics import stage
+from summarizer import summarize
+from summary_worker import (
+    AsyncSummaryStore, batch_concurrency, create_summary_async, get_or_create_summary_async, summary_collection_name, summary_is_fresh
+)
+
+SUMMARY_BATCH_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_CONCURRENCY", "8"))
+SUMMARY_BATCH_MAX_ITEMS = int(os.getenv("SUMMARY_BATCH_MAX_ITEMS", "100"))
+# "meta" summarizes title and meta description; "full" the whole article text
+SUMMARIZE_MODES = ("meta", "full")
+
+router = APIRouter(tags=["articles"])
+
+class MongoJSONResponse(JSONResponse):
+    """Encodes like the Flask services (`json_default`, sorted keys), so clients see the same JSON."""
+    def render(self, content):
+        return json.dumps(content, default=json_default, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def _error(message, status_code):
+    return MongoJSONResponse({"error": message}, status_code=status_code)
+
+# === MongoDB Setup ===
+# Created on first use, on the event loop that serves requests
+
+def _create_client():
+    for name in ("MONGO_URI", "DATABASE_NAME", "COLLECTION_NAME"):
+        if not os.getenv(name):
+            raise RuntimeError(f"{name} not found in environment variables")
+    logging.info(f"Connecting to MongoDB at: {os.getenv('MONGO_URI')}")
+    return create_async_client(os.getenv("MONGO_URI"))
+
+_client = ProcessLocal(_create_client)
+_articles = ProcessLocal(lambda: create_async_repository(get_collection()))
+_summary_store = ProcessLocal(
+    lambda: AsyncSummaryStore(get_database()[summary_collection_name(os.getenv("COLLECTION_NAME"))])
+)
+
+def get_database():
+    return _client.get()[os.getenv("DATABASE_NAME")]
+
+def get_collection():
+    return get_database()[os.getenv("COLLECTION_NAME")]
+
+def get_articles():
+    return _articles.get()
+
+def get_summary_store():
+    return _summary_store.get()
+
+async def close():
+    """Stops cache invalidation and closes the client; called on shutdown."""
+    if _articles.initialized():
+        _articles.get().close()
+    if _client.initialized():
+        await _client.get().close()
+
+# === Helper Functions ===
+
+async def _json_body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+async def get_article_by_id(article_id, view="details"):
+    """Fetches the fields of `view` (see article_repository.PROJECTIONS). Returns None if missing or invalid."""
+    try:
+        logging.info(f"Looking up article ID: {article_id}")
+        with stage("get_article_by_id", article_id=str(article_id), view=view):
+            article = await get_articles().get(article_id, view)
+        if article:
+            logging.info("Article found.")
+        else:
+            logging.warning("Article not found.")
+        return article
+    except Exception as e:
+        logging.error(f"Error in get_article_by_id: {e}")
+        return None
+
+def llm_error_response(e):
+    """Maps a failed LLM call to an error response with a matching status code (429, 503, 504, ...)."""
+    logging.warning(f"LLM call failed with {type(e).__name__}: {e}")
+    return _error(f"Summary generation failed: {e}", e.status_code)
+
+# === Routes ===
+
+@router.get("/health")
+async def health_check():
+    try:
+        await _client.get().admin.command("ping")
+        db_status = "connected"
+    except Exception as e:
+        db_status = f"error: {e}"
+    return MongoJSONResponse({
+        "status": "healthy",
+        "database": db_status,
+        "article_cache": get_articles().cache_stats() if _articles.initialized() else None
+    })
+
+@router.post("/article-details")
+async def get_article_details(request: Request):
+    try:
+        article_id = (await _json_body(request)).get("article_id")
+        if not article_id:
+            logging.warning("No article_id provided.")
+            return _error("article_id is required", 400)
+
+        article = await get_article_by_id(article_id)
+        if not article:
+            return _error(f"Article with ID {article_id} not found", 404)
+
+        return MongoJSONResponse({"success": True, "article": article})
+
+    except Exception as e:
+        logging.exception("Error in get_article_details")
+        return _error(f"Internal server error: {e}", 500)
+
+@router.post("/article-summary")
+async def get_article_with_summary(request: Request):
+    try:
+        article_id = (await _json_body(request)).get("article_id")
+        if not article_id:
+            logging.warning("No article_id provided.")
+            return _error("article_id is required", 400)
+
+        article = await get_article_by_id(article_id)
+        if not article:
+            return _error(f"Article with ID {article_id} not found", 404)
+
+        title = article.get("title", "")
+        meta_desc = article.get("meta", {}).get("description", "")
+        combined_text = f"{title} {meta_desc}".strip()
+
+        summary = await get_or_create_summary_async(get_summary_store(), article) if combined_text else "No content to summarize."
+
+        return MongoJSONResponse({
+            "success": True,
+            "article": article,
+            "extracted_data": {
+                "title": title,
+                "meta_description": meta_desc,
+                "combined_text": combined_text
+            },
+            "ai_summary": summary
+        })
+
+    except LLMError as e:
+        return llm_error_response(e)
+    except Exception as e:
+        logging.exception("Error in get_article_with_summary")
+        return _error(f"Internal server error: {e}", 500)
+
+@router.post("/summarize")
+async def summarize_article(request: Request):
+    try:
+        data = await _json_body(request)
+        article_id = data.get("article_id")
+        if not article_id:
+            logging.warning("No article_id provided.")
+            return _error("article_id is required", 400)
+        mode = data.get("mode", "meta")
+        if mode not in SUMMARIZE_MODES:
+            return _error(f"mode must be one of: {', '.join(SUMMARIZE_MODES)}", 400)
+        if mode == "full":
+            return await summarize_full_article(article_id)
+
+        article = await get_article_by_id(article_id, view="summary")
+        if not article:
+            return _error(f"Article with ID {article_id} not found", 404)
+
+        title = article.get("title", "")
+        meta_desc = article.get("meta", {}).get("description", "")
+        # The stored summary is served only while it matches the article's current title and description
+        summary_meta = await get_or_create_summary_async(get_summary_store(), article) if (title or meta_desc) else "No data to summarize."
+
+        return MongoJSONResponse({"title": title, "summary": summary_meta})
+
+    except LLMError as e:
+        return llm_error_response(e)
+    except Exception as e:
+        logging.exception("Error in summarize_article")
+        return _error(f"Internal server error: {e}", 500)
+
+async def summarize_full_article(article_id):
+    """Summarizes the whole article text, chunk by chunk when it is long (see summarizer.py)."""
+    article = await get_article_by_id(article_id, view="full_text")
+    if not article:
+        return _error(f"Article with ID {article_id} not found", 404)
+    text = article_text(article)
+    with stage("summarize_full_article", text_chars=len(text)):
+        # The map step runs on the summarizer's thread pool
+        summary = await asyncio.to_thread(summarize, text, "auto") if text else "No content to summarize."
+    return MongoJSONResponse({"title": article.get("title", ""), "summary": summary, "mode": "full"})
+
+@router.post("/summarize/batch")
+async def summarize_articles_batch(request: Request):
+    data = await _json_body(request)
+    article_ids = data.get("article_ids")
+    if not isinstance(article_ids, list) or not article_ids:
+        return _error("article_ids must be a non-empty list", 400)
+    if len(article_ids) > SUMMARY_BATCH_MAX_ITEMS:
+        return _error(f"At most {SUMMARY_BATCH_MAX_ITEMS} article_ids per request", 400)
+
+    try:
+        concurrency = batch_concurrency(data.get("concurrency"), SUMMARY_BATCH_CONCURRENCY)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    return StreamingResponse(_summarize_batch_lines(article_ids, concurrency), media_type="application/x-ndjson")
+
+async def _summarize_batch_lines(article_ids, concurrency):
+    """Yields one NDJSON line per article as its summary becomes available."""
+    def line(item):
+        return json.dumps(item) + "\n"
+
+    ids = {}
+    for article_id in dict.fromkeys(map(str, article_ids)):
+        try:
+            ids[ObjectId(article_id)] = article_id
+        except Exception:
+            yield line({"article_id": article_id, "error": "Invalid article_id"})
+    if not ids:
+        return
+
+    # The articles' current text and their stored summaries, in one $in read each
+    try:
+        found = await get_articles().get_many(list(ids), view="summary")
+    except Exception as e:
+        logging.error(f"Error fetching articles for batch summary: {e}")
+        for oid in ids:
+            yield line({"article_id": ids[oid], "error": "Database error"})
+        return
+    try:
+        stored = await get_summary_store().get_many(list(found))
+    except Exception as e:
+        logging.error(f"Error reading stored summaries: {e}")
+        stored = {}
+
+    # Stored summaries that are still fresh first; stale or missing ones are regenerated
+    articles = []
+    for oid, article_id in ids.items():
+        article = found.get(oid)
+        if article is None:
+            yield line({"article_id": article_id, "error": f"Article with ID {article_id} not found"})
+        elif summary_is_fresh(stored.get(oid), article):
+            yield line({"article_id": article_id, "title": stored[oid].get("title", ""), "summary": stored[oid]["summary"]})
+        else:
+            articles.append(article)
+    if not articles:
+        return
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(_summarize_for_batch(article, semaphore)) for article in articles]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            article, item = await next_done
+            yield line({"article_id": ids[article["_id"]], "title": article.get("title", ""), **item})
+    finally:
+        # Stop outstanding work if the client disconnects mid-stream
+        for task in tasks:
+            task.cancel()
+
+async def _summarize_for_batch(article, semaphore):
+    """Returns (article, {"summary": ...} or error fields)."""
+    title = article.get("title", "")
+    meta_desc = article.get("meta", {}).get("description", "")
+    if not (title or meta_desc):
+        return article, {"summary": "No data to summarize."}
+    try:
+        async with semaphore:
+            return article, {"summary": await create_summary_async(get_summary_store(), article)}
+    except LLMError as e:
+        logging.warning(f"LLM call failed with {type(e).__name__}: {e}")
+        return article, {"error": f"Summary generation failed: {e}", "status": e.status_code}
+    except Exception as e:
+        logging.exception("Error summarizing article in batch")
+        return article, {"error": f"Internal server error: {e}", "status": 500}
@@ -0,0 +1,95 @@
+"""
+Benchmark: semantic answer cache hit rate, false hits and lookup cost.
+
+Replays groups of reworded questions about one article. The first wording
+of each group is answered (cached); every later wording should hit that
+answer, and a hit on another group's answer is a false hit. Reports both per
+similarity threshold, plus the lookup cost with a full per-document index.
+
+    python benchmarks/bench_answer_cache.py [--thresholds 0.75,0.8,0.85,0.9,0.95] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import SemanticAnswerCache
+
+# Wordings of the same question; different groups need different answers
+GROUPS = [
+    ["What's the main point?", "Main takeaway?", "what is the key message here", "What's the gist of the article?"],
+    ["Who is the author?", "who wrote this?", "Who wrote the article?", "who's the writer"],
+    ["Who is the audience?", "Who is this article for?", "who are the target readers?"],
+    ["When was the forum founded?", "when was the forum started", "When did the forum get founded?"],
+    ["Why did they change the onboarding flow?", "why was onboarding changed?", "Why did the onboarding flow change?"],
+    ["When did they change the onboarding flow?", "when was onboarding changed?"],
+    ["Which tools are mentioned?", "What tools does it mention?", "what tools are discussed?"],
+    ["Does it recommend raising prices?", "does the article suggest raising prices?", "is raising prices recommended?"],
+    ["Does it advise against raising prices?", "Does it not recommend raising prices?"],
+    ["What happened in 2019?", "what happened during 2019?"],
+    ["What happened in 2020?", "What happened in the year 2020?"],
+    ["How does moderation work?", "how does the moderation work?", "How is moderation done?"],
+    ["How many subscribers did the newsletter reach?", "how many newsletter subscribers were there?"],
+    ["How many members joined the forum?", "how many people joined the forum?"],
+    ["What are the next steps for editors?", "what should editors do next?", "next steps for editors?"],
+    ["What is the main point of section 2?", "main point of section 2?"],
+    # Near misses: one content word apart from another group
+    ["What does it say about moderation?", "what does the article say about moderation"],
+    ["What does it say about moderation tools?", "what does it say about tools for moderation?"],
+    ["Who founded the forum?", "who started the forum?"],
+    ["Who moderates the forum?", "who are the forum moderators?"],
+    ["How does onboarding work?", "how does the onboarding work?"],
+    ["What are the risks of raising prices?", "what risks come with raising prices?"],
+    ["What are the benefits of raising prices?", "what are the upsides of raising prices?"],
+]
+
+def run(threshold):
+    cache = SemanticAnswerCache(threshold=threshold)
+    for i, group in enumerate(GROUPS):
+        cache.put("doc", group[0], f"answer {i}")
+    hits = false_hits = lookups = 0
+    misses = []
+    for i, group in enumerate(GROUPS):
+        for question in group[1:]:
+            lookups += 1
+            match = cache.lookup("doc", question)
+            if match is None:
+                misses.append(question)
+            elif match.answer == f"answer {i}":
+                hits += 1
+            else:
+                false_hits += 1
+                misses.append(f"{question} -> {match.question} (false hit)")
+    return lookups, hits, false_hits, misses
+
+def lookup_cost(repeat, entries=64):
+    cache = SemanticAnswerCache(max_entries=entries)
+    questions = [q for group in GROUPS for q in group]
+    for i in range(entries):
+        cache.put("doc", f"{questions[i % len(questions)]} variant {i}", f"answer {i}")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for question in questions:
+            cache.lookup("doc", question)
+    return (time.perf_counter() - start) / (repeat * len(questions)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--thresholds", default="0.75,0.8,0.85,0.9,0.95")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--verbose", action="store_true", help="List the wordings that missed.")
+    args = parser.parse_args()
+
+    print(f"{'threshold':>9} {'lookups':>7} {'hit rate':>8} {'false hits':>10}")
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        lookups, hits, false_hits, misses = run(threshold)
+        print(f"{threshold:>9.2f} {lookups:>7} {hits / lookups:>8.0%} {false_hits:>10}")
+        if args.verbose:
+            for miss in misses:
+                print(f"          miss: {miss}")
+    print(f"\nlookup with 64 cached questions: {lookup_cost(args.repeat):.1f} µs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Benchmark: the four-process layout against the consolidated server.py.
+
+Starts each layout as real server processes on the fake LLM backend and
+drives both with the same mixed workload (chat turns, /summarize,
+/article-details, /article-summary):
+
+- multi: api.py (uvicorn), flask_api.py, summaryapi.py and mongodb_api.py
+  (threaded Flask servers), each with its own LLM client, caches and Mongo
+  pool. Chat users are split between api.py and flask_api.py, and
+  /summarize between summaryapi.py and mongodb_api.py.
+- single: server.py (uvicorn, one worker).
+
+Reports throughput, latency, resident memory of all server processes,
+upstream LLM calls and article cache hits (read from each process's
+/metrics and /health).
+
+Without MONGO_URI every process gets its own in-memory database seeded with
+the same articles (mongomock, wrapped for the async client), so no MongoDB
+is needed. With MONGO_URI, DATABASE_NAME and COLLECTION_NAME set, the real
+collection is used and --article-id picks the articles to request.
+
+    python benchmarks/bench_consolidated.py [--users 40] [--duration 15]
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ARTICLE_COUNT = 200
+CHAT_TURNS = ["summarize this", "what are the key points?", "suggest topics", "thanks!"]
+TEXT = " ".join(f"Paragraph {p} discusses community growth, moderation and content strategy." for p in range(40))
+
+# === Server processes ===
+
+LAYOUTS = {
+    # name -> [(module, kind, port offset)]
+    "multi": [("api", "uvicorn", 0), ("flask_api", "flask", 1), ("summaryapi", "flask", 2), ("mongodb_api", "flask", 3)],
+    "single": [("server", "uvicorn", 0)],
+}
+
+def article_ids():
+    from bson import ObjectId
+    return [ObjectId(f"{i + 1:024x}") for i in range(ARTICLE_COUNT)]
+
+def install_mongomock():
+    """Points MongoClient and AsyncMongoClient at one in-memory mongomock client seeded with articles."""
+    import mongomock
+    import pymongo
+
+    client = mongomock.MongoClient()
+    collection = client["bench"]["articles"]
+    collection.insert_many([
+        {"_id": oid, "title": f"Article {i}", "meta": {"description": TEXT[:300]}, "content": TEXT}
+        for i, oid in enumerate(article_ids())
+    ])
+    pymongo.MongoClient = lambda *a, **k: client
+    pymongo.AsyncMongoClient = lambda *a, **k: _AsyncClient(client)
+    os.environ.update(MONGO_URI="mongodb://mongomock", DATABASE_NAME="bench", COLLECTION_NAME="articles")
+    # mongomock has no change streams
+    os.environ["ARTICLE_CACHE_INVALIDATION"] = "poll"
+
+class _AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class _AsyncCollection:
+    def __init__(self, collection):
+        self._collection = collection
+        self.name = collection.name
+
+    async def find_one(self, *args, **kwargs):
+        return self._collection.find_one(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        return _AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def update_one(self, *args, **kwargs):
+        return self._collection.update_one(*args, **kwargs)
+
+    async def watch(self, *args, **kwargs):
+        raise NotImplementedError("mongomock has no change streams")
+
+class _AsyncDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return _AsyncCollection(self._database[name])
+
+    async def command(self, *args, **kwargs):
+        return {"ok": 1.0}
+
+class _AsyncClient:
+    def __init__(self, client):
+        self._client = client
+        self.admin = _AsyncDatabase(client["admin"])
+
+    def __getitem__(self, name):
+        return _AsyncDatabase(self._client[name])
+
+    async def close(self):
+        pass
+
+def serve(module, kind, port, mongomock):
+    """Runs one server in this process (called in a child via --serve)."""
+    import logging
+    logging.disable(logging.WARNING)
+    if mongomock:
+        install_mongomock()
+    app = __import__(module).app
+    if kind == "uvicorn":
+        import uvicorn
+        uvicorn.run(app, host="127.0.0.1", port=port, log_level="error")
+    else:
+        app.run(host="127.0.0.1", port=port, debug=False, threaded=True)
+
+def start_layout(layout, args):
+    env = {
+        **os.environ,
+        "LLM_BACKEND": "fake", "FAKE_LLM_LATENCY": args.llm_latency, "GEMINI_RPM": "0", "PYTHONUNBUFFERED": "1",
+    }
+    processes = []
+    for module, kind, offset in LAYOUTS[layout]:
+        command = [sys.executable, os.path.abspath(__file__), "--serve", module, "--kind", kind, "--port", str(args.port + offset)]
+        if args.mongomock:
+            command.append("--mongomock")
+        processes.append(subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    return processes
+
+async def wait_ready(client, urls, timeout=60):
+    deadline = time.perf_counter() + timeout
+    for url in urls:
+        while True:
+            try:
+                if (await client.get(url + "/metrics")).status_code == 200:
+                    break
+            except Exception:
+                pass
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"{url} did not start")
+            await asyncio.sleep(0.2)
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process from /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+def rss_mb(pid):
+    """Resident memory of a process from /proc (Linux), in MB."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return int(re.search(r"VmRSS:\s+(\d+)", f.read()).group(1)) / 1024
+    except (OSError, AttributeError):
+        return 0.0
+
+# === Workload ===
+
+def urls_for(layout, port):
+    """Base URL per route group; the multi layout splits chat and /summarize across two services each."""
+    base = f"http://127.0.0.1:{port}"
+    if layout == "single":
+        return {"chat": [base], "summarize": [base], "articles": base}
+    return {
+        "chat": [base, f"http://127.0.0.1:{port + 1}"],
+        "summarize": [f"http://127.0.0.1:{port + 2}", f"http://127.0.0.1:{port + 3}"],
+        "articles": f"http://127.0.0.1:{port + 3}",
+    }
+
+def scenario(rng, vu, ids, urls):
+    """Yields (url, json body, label) for one round of a virtual user."""
+    if rng.random() < 0.5:
+        chat = urls["chat"][vu % len(urls["chat"])]
+        session_id = f"vu-{vu}-{rng.randrange(10**9)}"
+        for message in CHAT_TURNS:
+            yield chat + "/chat", {"session_id": session_id, "message": message, "text": TEXT}, "/chat"
+        return
+    article_id = str(rng.choice(ids))
+    roll = rng.random()
+    if roll < 0.6:
+        yield rng.choice(urls["summarize"]) + "/summarize", {"article_id": article_id}, "/summarize"
+    elif roll < 0.8:
+        yield urls["articles"] + "/article-details", {"article_id": article_id}, "/article-details"
+    else:
+        yield urls["articles"] + "/article-summary", {"article_id": article_id}, "/article-summary"
+
+async def virtual_user(vu, client, ids, urls, args, samples, deadline):
+    rng = random.Random(args.seed * 100003 + vu)
+    while time.perf_counter() < deadline:
+        for url, body, label in scenario(rng, vu, ids, urls):
+            start = time.perf_counter()
+            try:
+                ok = (await client.post(url, json=body)).status_code < 400
+            except Exception:
+                ok = False
+            samples.append((label, time.perf_counter() - start, ok))
+
+def metric_sum(text, name, **labels):
+    total = 0.0
+    for line in text.splitlines():
+        if not line.startswith(name + "{") and not line.startswith(name + " "):
+            continue
+        if all(f'{k}="{v}"' in line for k, v in labels.items()):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+async def run_layout(layout, args, ids):
+    import httpx
+
+    processes = start_layout(layout, args)
+    bases = sorted({f"http://127.0.0.1:{args.port + offset}" for _, _, offset in LAYOUTS[layout]})
+    try:
+        limits = httpx.Limits(max_connections=args.users * 2)
+        async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+            await wait_ready(client, bases)
+            idle_rss = sum(rss_mb(p.pid) for p in processes)
+            idle_cpu = sum(cpu_seconds(p.pid) for p in processes)
+            samples = []
+            start = time.perf_counter()
+            deadline = start + args.duration
+            urls = urls_for(layout, args.port)
+            await asyncio.gather(*(virtual_user(vu, client, ids, urls, args, samples, deadline) for vu in range(args.users)))
+            elapsed = time.perf_counter() - start
+            busy_rss = sum(rss_mb(p.pid) for p in processes)
+            cpu = sum(cpu_seconds(p.pid) for p in processes) - idle_cpu
+
+            llm_calls, cache_hits, cache_lookups = 0.0, 0.0, 0.0
+            for base in bases:
+                text = (await client.get(base + "/metrics")).text
+                llm_calls += metric_sum(text, "llm_request_seconds_count", result="ok")
+                cache_hits += metric_sum(text, "llm_cache_lookups_total", result="hit")
+                cache_lookups += metric_sum(text, "llm_cache_lookups_total")
+    finally:
+        for p in processes:
+            p.send_signal(signal.SIGINT)
+        for p in processes:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    latencies = sorted(s for _, s, _ in samples)
+    return {
+        "processes": len(processes),
+        "requests": len(samples),
+        "errors": sum(1 for *_, ok in samples if not ok),
+        "rps": len(samples) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else 0.0,
+        "idle_rss_mb": idle_rss,
+        "busy_rss_mb": busy_rss,
+        "cpu_ms_per_request": cpu * 1000 / len(samples) if samples else 0.0,
+        "llm_calls": llm_calls,
+        "llm_cache_hit_rate": cache_hits / cache_lookups if cache_lookups else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=18000, help="First port; the multi layout uses four.")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), action="append", help="Layouts to run (default: both).")
+    parser.add_argument("--llm-latency", default="lognormal:0.3,0.5", help="Fake backend latency distribution.")
+    parser.add_argument("--article-id", action="append", help="Article ids to request with a real MONGO_URI.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--kind", help=argparse.SUPPRESS)
+    parser.add_argument("--mongomock", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.kind, args.port, args.mongomock)
+        return
+
+    args.mongomock = not os.getenv("MONGO_URI")
+    if args.mongomock:
+        ids = article_ids()
+    elif args.article_id:
+        ids = args.article_id
+    else:
+        sys.exit("--article-id is required with MONGO_URI")
+
+    print(f"{args.users} virtual users for {args.duration:.0f}s per layout, fake LLM latency {args.llm_latency}\n")
+    print(f"{'layout':<8}{'procs':>6}{'requests':>10}{'errors':>8}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'RSS idle':>10}{'RSS busy':>10}{'CPU ms/req':>11}{'LLM calls':>11}{'cache hit':>11}")
+    for layout in args.layout or ["multi", "single"]:
+        r = asyncio.run(run_layout(layout, args, ids))
+        print(f"{layout:<8}{r['processes']:>6}{r['requests']:>10}{r['errors']:>8}{r['rps']:>8.1f}{r['p50_ms']:>9.1f}"
+              f"{r['p95_ms']:>9.1f}{r['idle_rss_mb']:>8.0f}MB{r['busy_rss_mb']:>8.0f}MB{r['cpu_ms_per_request']:>11.2f}{r['llm_calls']:>11.0f}"
+              f"{r['llm_cache_hit_rate']:>11.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: intent routing cost and LLM call rate.
+
+Replays a labeled set of chat messages through each registered intent
+classifier and reports the routing cost per message, the accuracy against
+the labels, and how many messages would call the LLM (summary, topics, Q&A)
+compared with how many needed it. The messages are not part of the
+classifier's training examples.
+
+    python benchmarks/bench_intent.py [--repeat 2000] [--threshold 0.6]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_classifier import CLASSIFIERS, LLM_INTENTS, create_classifier
+
+# (message, expected intent)
+SAMPLES = [
+    ("Hi!", "greeting"), ("hello there", "greeting"), ("Hey, good morning", "greeting"),
+    ("Can you summarize this for me?", "summary"), ("I need a quick summary", "summary"),
+    ("What's the gist of it?", "summary"), ("Give me the key points", "summary"),
+    ("what is this piece about?", "summary"), ("tl;dr please", "summary"), ("Sum this up in two lines", "summary"),
+    ("Suggest a few topics we could write next", "topic"), ("any ideas for a follow-up post?", "topic"),
+    ("What should we write about after this?", "topic"), ("Give me some article ideas on the same theme", "topic"),
+    ("brainstorm related topics", "topic"), ("Can you recommend other topics?", "topic"),
+    ("What topic does the article cover?", "qa"), ("Who is the author?", "qa"),
+    ("What does it say about moderation?", "qa"), ("Does the article suggest raising prices?", "qa"),
+    ("How many subscribers did the newsletter reach?", "qa"), ("When is the meetup?", "qa"),
+    ("Why did they change the onboarding flow?", "qa"), ("Which tools are mentioned?", "qa"),
+    ("Is there anything about guest authors?", "qa"), ("What happened in March?", "qa"),
+    ("Explain the part about search ranking", "qa"), ("what are the suggested next steps for editors?", "qa"),
+    ("thanks!", "thanks"), ("Thank you so much", "thanks"), ("thx", "thanks"), ("cheers", "thanks"),
+    ("ok", "ack"), ("Okay cool", "ack"), ("got it", "ack"), ("sounds good!", "ack"), ("nice", "ack"),
+    ("bye", "goodbye"), ("that's all, thanks", "goodbye"), ("See you later", "goodbye"),
+]
+
+def run(name, threshold, repeat):
+    classifier = create_classifier(name, threshold=threshold)
+    messages = [message for message, _ in SAMPLES]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            classifier.classify(message)
+    per_message_us = (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+    results = [(classifier.classify(message), expected) for message, expected in SAMPLES]
+    correct = sum(intent.name == expected for intent, expected in results)
+    llm_calls = sum(intent.name in LLM_INTENTS for intent, _ in results)
+    needed = sum(expected in LLM_INTENTS for _, expected in results)
+    fallbacks = sum(intent.source == "fallback" for intent, _ in results)
+    misses = [(message, intent.name, expected) for (message, _), (intent, expected) in zip(SAMPLES, results) if intent.name != expected]
+    return per_message_us, correct, llm_calls, needed, fallbacks, misses
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--verbose", action="store_true", help="List misclassified messages.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    create_classifier("local")
+    print(f"local classifier load (training): {(time.perf_counter() - start) * 1000:.2f} ms")
+    print(f"{len(SAMPLES)} labeled messages\n")
+    print(f"{'classifier':<10} {'us/msg':>8} {'accuracy':>9} {'LLM calls':>10} {'needed':>7} {'fallbacks':>10}")
+    for name in sorted(CLASSIFIERS):
+        per_message_us, correct, llm_calls, needed, fallbacks, misses = run(name, args.threshold, args.repeat)
+        print(f"{name:<10} {per_message_us:8.1f} {correct / len(SAMPLES):9.0%} "
+              f"{llm_calls / len(SAMPLES):10.0%} {needed / len(SAMPLES):7.0%} {fallbacks:10d}")
+        if args.verbose:
+            for message, got, expected in misses:
+                print(f"    {message!r}: {got} (expected {expected})")
+
+if __name__ == "__main__":
+    main()
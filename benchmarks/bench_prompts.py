@@ -0,0 +1,113 @@
+"""
+Benchmark: compiled prompt rendering and input tokens with Gemini context caching.
+
+1. Render cost per prompt: `str.format` on the raw template (the old path)
+   against the compiled prompt from prompt_registry.py.
+2. Input tokens of a Q&A session (several questions about one article) sent
+   through llm_service on the fake backend, with context caching off and on:
+   tokens per call, the share served from the context cache, and the total
+   of uncached tokens (billed at the full input rate).
+
+With --live the session is also sent to Gemini (needs GOOGLE_API_KEY and a
+GEMINI_MODEL that supports explicit caching) and the reported usage and
+latency per call are compared.
+
+    python benchmarks/bench_prompts.py [--article-tokens 6000] [--questions 10] [--live]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTIONS = [
+    "Who founded the forum?", "How does moderation work?", "What changed in 2020?", "Who is the audience?",
+    "What are the next steps for editors?", "How many members joined?", "Which tools are mentioned?",
+    "Why was onboarding changed?", "What is the main point?", "Does it recommend raising prices?",
+]
+
+def make_article(tokens):
+    sentence = "The community forum grew through weekly moderation reviews, editor guides and member interviews. "
+    return (sentence * (tokens * 4 // len(sentence) + 1))[:tokens * 4]
+
+def render_cost(article, repeat):
+    from prompt_registry import PROMPT_REGISTRY
+    from prompts import PROMPTS
+
+    print(f"{'prompt':<20} {'str.format':>11} {'compiled':>9}")
+    for key in PROMPT_REGISTRY:
+        prompt = PROMPT_REGISTRY[key]
+        values = {field: article if field == "text" else f"Example {field}" for field in prompt.fields}
+        template = PROMPTS[key]["prompt"]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            template.format(**values)
+        raw = (time.perf_counter() - start) / repeat * 1e6
+        start = time.perf_counter()
+        for _ in range(repeat):
+            prompt.render(values)
+        compiled = (time.perf_counter() - start) / repeat * 1e6
+        print(f"{key:<20} {raw:>9.2f}µs {compiled:>7.2f}µs")
+
+def qa_session(article, questions, context_cache, backend, options):
+    """Per call: (prompt tokens, cached tokens, seconds), read from the response usage metrics."""
+    import llm_service
+    from llm_backends import create_model_pool
+    from llm_cache import create_cache
+    from config import GEMINI_CONTEXT_CACHE_MIN_TOKENS
+    from metrics import REGISTRY
+
+    # The whole article is sent (no retrieval), so every question shares the same prefix
+    llm_service._models.set(create_model_pool(
+        backend, options, context_cache=context_cache, min_tokens=GEMINI_CONTEXT_CACHE_MIN_TOKENS, min_uses=2
+    ))
+    llm_service._response_cache.set(create_cache("none", 0))
+    labels = {"prompt_key": "question_answering"}
+
+    def sample(name):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    calls = []
+    for question in questions:
+        before = sample("llm_input_tokens_sum"), sample("llm_cached_input_tokens_sum")
+        start = time.perf_counter()
+        llm_service.generate("question_answering", {"text": article, "question": question})
+        elapsed = time.perf_counter() - start
+        calls.append((sample("llm_input_tokens_sum") - before[0], sample("llm_cached_input_tokens_sum") - before[1], elapsed))
+    return calls
+
+def report(name, calls):
+    prompt_tokens = sum(c[0] for c in calls)
+    cached = sum(c[1] for c in calls)
+    print(f"{name:<14} {prompt_tokens / len(calls):>11.0f} {cached / max(prompt_tokens, 1):>7.0%} "
+          f"{prompt_tokens - cached:>15.0f} {statistics.median(c[2] for c in calls) * 1000:>6.0f}ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--article-tokens", type=int, default=6000)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20000)
+    parser.add_argument("--live", action="store_true", help="Also run the Q&A session against Gemini.")
+    args = parser.parse_args()
+
+    os.environ.setdefault("FAKE_LLM_LATENCY", "fixed:0")
+    article = make_article(args.article_tokens)
+    questions = (QUESTIONS * (args.questions // len(QUESTIONS) + 1))[:args.questions]
+
+    render_cost(article, args.repeat)
+
+    from config import FAKE_LLM_OPTIONS, GEMINI_MODEL
+    runs = [("fake", FAKE_LLM_OPTIONS)]
+    if args.live:
+        runs.append(("gemini", {"model_name": GEMINI_MODEL, "api_key": os.environ["GOOGLE_API_KEY"]}))
+    for backend, options in runs:
+        print(f"\n{backend}: {len(questions)} questions about one {args.article_tokens}-token article")
+        # Uncached tokens are billed at the full input rate; cached ones at the lower cached rate plus storage
+        print(f"{'context cache':<14} {'tokens/call':>11} {'cached':>7} {'uncached total':>15} {'p50':>8}")
+        report("off", qa_session(article, questions, False, backend, options))
+        report("on", qa_session(article, questions, True, backend, options))
+
+if __name__ == "__main__":
+    main()
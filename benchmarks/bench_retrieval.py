@@ -0,0 +1,95 @@
+"""
+Benchmark: whole-document vs retrieval-augmented question answering prompts.
+
+Builds synthetic articles with one planted fact per question, then compares
+prompt size, retrieval cost (cold index build vs cached index) and whether
+the retrieved context still contains the fact. With --live, both prompts are
+also sent to Gemini (needs GOOGLE_API_KEY) to compare end-to-end latency.
+
+    python benchmarks/bench_retrieval.py [--paragraphs 200] [--live]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import PROMPTS
+from retrieval import Retriever
+
+WORDS = (
+    "community content platform readers writers engagement growth strategy audience search ranking "
+    "newsletter social media analytics editorial calendar moderation feedback product design brand "
+    "marketing conversion retention onboarding tutorial guide review opinion interview research data"
+).split()
+
+FACTS = [
+    ("The annual member meetup is hosted in Lisbon every October.", "Where is the annual member meetup hosted?"),
+    ("Moderators review flagged comments within 36 hours.", "How fast do moderators review flagged comments?"),
+    ("The newsletter reached 48,000 subscribers in March.", "How many subscribers did the newsletter reach?"),
+    ("Guest authors are paid 250 dollars per published article.", "How much are guest authors paid per article?"),
+]
+
+def make_article(paragraphs, rng):
+    body = []
+    for _ in range(paragraphs):
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 20))).capitalize() + "." for _ in range(5)]
+        body.append(" ".join(sentences))
+    for fact, _ in FACTS:
+        body[rng.randrange(len(body))] += " " + fact
+    return "\n\n".join(body)
+
+def approx_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4
+
+def render(text, question):
+    return PROMPTS["question_answering"]["prompt"].format(text=text, question=question)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--live", action="store_true", help="Also time real Gemini calls.")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    article = make_article(args.paragraphs, rng)
+    retriever = Retriever(top_k=args.top_k)
+
+    start = time.perf_counter()
+    retriever.index_for(article)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    warm_ms, hits, whole_tokens, rag_tokens = [], 0, [], []
+    for fact, question in FACTS:
+        start = time.perf_counter()
+        context = retriever.context_for(article, question)
+        warm_ms.append((time.perf_counter() - start) * 1000)
+        hits += fact in context
+        whole_tokens.append(approx_tokens(render(article, question)))
+        rag_tokens.append(approx_tokens(render(context, question)))
+
+    print(f"article: {len(article):,} chars, {len(retriever.index_for(article).chunks)} chunks")
+    print(f"index build (cold):       {build_ms:8.2f} ms")
+    print(f"retrieval per question:   {statistics.mean(warm_ms):8.2f} ms (cached index)")
+    print(f"prompt tokens, whole doc: {statistics.mean(whole_tokens):8.0f}")
+    print(f"prompt tokens, top-{args.top_k}:     {statistics.mean(rag_tokens):8.0f} "
+          f"({statistics.mean(rag_tokens) / statistics.mean(whole_tokens):.1%} of whole)")
+    print(f"planted fact retrieved:   {hits}/{len(FACTS)}")
+
+    if args.live:
+        from llm_service import call_gemini
+        for label, make_text in (("whole doc", lambda q: article), ("retrieval", lambda q: retriever.context_for(article, q))):
+            timings = []
+            for _, question in FACTS:
+                start = time.perf_counter()
+                call_gemini("question_answering", {"text": make_text(question), "question": question})
+                timings.append(time.perf_counter() - start)
+            print(f"gemini latency, {label}: {statistics.mean(timings) * 1000:8.0f} ms mean")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: interactive latency next to a bulk summary client, FIFO vs the fair scheduler.
+
+Runs in one process on the fake LLM backend with the upstream capped at
+--concurrency calls. One batch client keeps --batch-threads summary calls
+in flight (a script looping /summarize), while --sessions interactive chat
+sessions each send a question, read the reply and think for --think seconds.
+
+- fifo: every call is in the same flow and class, so calls are served in
+  arrival order, as they were before the scheduler.
+- fair: calls carry their request context (interactive sessions, batch
+  client), as the API routes set it.
+
+Reports interactive p50/p95 latency and batch throughput for each.
+
+    python benchmarks/bench_scheduler.py [--duration 10] [--latency 0.2] [--concurrency 4]
+"""
+import argparse
+import itertools
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every prompt is new, so no call is served from the response cache
+unique = itertools.count()
+
+def run(mode, args):
+    import llm_service
+    from llm_scheduler import FairScheduler, request_context
+
+    llm_service._scheduler.set(FairScheduler(max_concurrency=args.concurrency, reserved=args.reserved, max_wait=0))
+    stop = time.monotonic() + args.duration
+    latencies = []
+    batch_done = [0]
+    lock = threading.Lock()
+
+    def context(priority, flow):
+        if mode == "fifo":
+            return request_context(priority="interactive", session="everyone")
+        return request_context(priority=priority, client=flow, session=flow if priority == "interactive" else None)
+
+    def batch_client():
+        while time.monotonic() < stop:
+            with context("batch", "bulk-client"):
+                llm_service.generate("summary", {"text": f"Article {next(unique)} about community forums."})
+            with lock:
+                batch_done[0] += time.monotonic() < stop
+
+    def chat_session(session):
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            with context("interactive", session):
+                llm_service.generate("question_answering", {"text": "A post on moderation.", "question": f"Question {next(unique)}?"})
+            with lock:
+                if time.monotonic() < stop:
+                    latencies.append(time.perf_counter() - start)
+            time.sleep(args.think)
+
+    threads = [threading.Thread(target=batch_client) for _ in range(args.batch_threads)]
+    threads += [threading.Thread(target=chat_session, args=(f"session-{i}",)) for i in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "turns": len(latencies),
+        "batch_rps": batch_done[0] / args.duration,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per fake upstream call.")
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--reserved", type=int, default=1, help="LLM_RESERVED_INTERACTIVE")
+    parser.add_argument("--batch-threads", type=int, default=16)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--think", type=float, default=1.0, help="Seconds between a session's turns.")
+    args = parser.parse_args()
+
+    os.environ.update(LLM_BACKEND="fake", FAKE_LLM_LATENCY=f"fixed:{args.latency}")
+
+    print(f"{'mode':>5} {'chat p50':>9} {'chat p95':>9} {'turns':>6} {'batch/s':>8}")
+    for mode in ("fifo", "fair"):
+        result = run(mode, args)
+        print(f"{mode:>5} {result['p50']:>8.2f}s {result['p95']:>8.2f}s {result['turns']:>6} {result['batch_rps']:>8.1f}")
+
+if __name__ == "__main__":
+    main()
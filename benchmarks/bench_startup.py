@@ -0,0 +1,81 @@
+"""
+Benchmark: cold import time of each service entry point.
+
+Every module is imported in a fresh interpreter with no credentials and an
+unroutable MONGO_URI, so the numbers show what a worker pays before it can
+serve its first request (and that importing does not need the network or
+exit on a missing key). Reports the median over --runs imports and which
+heavy dependencies were loaded eagerly.
+
+    python benchmarks/bench_startup.py [--runs 5] [--max-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["config", "llm_service", "chatbot_logic", "api", "flask_api", "mongodb_api", "summaryapi"]
+HEAVY = ["google.generativeai", "numpy", "redis"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def clean_env():
+    env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_API_KEY", "MONGO_URI")}
+    # 10.255.255.1 is not routable: any eager connection attempt shows up as a multi-second import
+    env.update(MONGO_URI="mongodb://10.255.255.1:27017", DATABASE_NAME="bench", COLLECTION_NAME="articles")
+    return env
+
+def measure(module, runs, timeout):
+    samples, loaded = [], []
+    for _ in range(runs):
+        try:
+            result = subprocess.run(
+                [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                cwd=ROOT, env=clean_env(), capture_output=True, text=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            return {"error": f"import took longer than {timeout}s"}
+        lines = result.stdout.strip().splitlines()
+        if result.returncode != 0 or not lines:
+            return {"error": f"import failed (exit {result.returncode})"}
+        report = json.loads(lines[-1])
+        samples.append(report["ms"])
+        loaded = report["loaded"]
+    return {"median_ms": round(statistics.median(samples), 1), "max_ms": round(max(samples), 1), "loaded": loaded}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds before an import counts as hung.")
+    parser.add_argument("--max-ms", type=float, help="Fail if any module's median import time exceeds this.")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = {module: measure(module, args.runs, args.timeout) for module in MODULES}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'module':<16}{'median ms':>11}{'max ms':>10}  eager heavy imports")
+        for module, r in results.items():
+            if "error" in r:
+                print(f"{module:<16}{'-':>11}{'-':>10}  {r['error']}")
+            else:
+                print(f"{module:<16}{r['median_ms']:>11}{r['max_ms']:>10}  {', '.join(r['loaded']) or '-'}")
+
+    failures = [m for m, r in results.items() if "error" in r or (args.max_ms is not None and r["median_ms"] > args.max_ms)]
+    if failures:
+        print("FAILED: " + ", ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
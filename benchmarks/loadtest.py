@@ -0,0 +1,228 @@
+"""
+Load test for the chat and summary services.
+
+Drives api.py (FastAPI), flask_api.py or mongodb_api.py with concurrent
+virtual users and reports throughput and p50/p95/p99 latency per endpoint.
+By default the app runs in-process on the fake LLM backend
+(llm_backends.FakeModel), so no API key, quota or network is needed:
+
+    python benchmarks/loadtest.py --target api --users 50 --duration 20
+    python benchmarks/loadtest.py --target flask --users 20
+    python benchmarks/loadtest.py --target mongodb --mongomock --users 20
+
+Against an already running server (start it with LLM_BACKEND=fake to keep
+quota out of the picture):
+
+    python benchmarks/loadtest.py --target api --base-url http://localhost:8000
+
+For CI, --max-p95-ms and --min-rps make the run exit with status 1 when the
+result regresses past the given limits; --json prints a machine-readable report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ARTICLES = [
+    " ".join(
+        f"Paragraph {p} of article {a} discusses community growth, moderation and content strategy."
+        for p in range(40)
+    )
+    for a in range(20)
+]
+
+CHAT_TURNS = ["summarize this", "what are the key points?", "suggest topics", "how does it end?"]
+WRITER_FLOW = ["write a new article", "B2B SaaS founders", "1. Growing a Community", "2. Case study"]
+
+# === Scenarios: each yields (method, path, json body) for one virtual user ===
+
+def chat_scenario(rng, vu, state):
+    session_id = f"vu-{vu}-{rng.randrange(10**9)}"
+    text = rng.choice(ARTICLES)
+    turns = WRITER_FLOW if rng.random() < 0.1 else rng.sample(CHAT_TURNS, k=len(CHAT_TURNS))
+    for message in turns:
+        yield "POST", "/chat", {"session_id": session_id, "message": message, "text": text}
+
+def summary_scenario(rng, vu, state):
+    ids = state["article_ids"]
+    if rng.random() < 0.1:
+        yield "POST", "/summarize/batch", {"article_ids": rng.sample(ids, k=min(10, len(ids)))}
+    elif rng.random() < 0.3:
+        yield "POST", "/article-summary", {"article_id": rng.choice(ids)}
+    else:
+        yield "POST", "/summarize", {"article_id": rng.choice(ids)}
+
+# === Targets ===
+
+def configure_environment(args):
+    """Defaults that keep in-process runs offline and deterministic."""
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    os.environ.setdefault("FAKE_LLM_LATENCY", args.llm_latency)
+    os.environ.setdefault("FAKE_LLM_ERROR_RATE", str(args.llm_error_rate))
+    os.environ.setdefault("GEMINI_RPM", "0")
+    if not args.cache:
+        os.environ.setdefault("LLM_CACHE_BACKEND", "none")
+
+def load_target(args):
+    """Returns (scenario, state, client factory, is_async_app)."""
+    import httpx
+
+    state = {"article_ids": args.article_id or []}
+    if args.target == "mongodb":
+        scenario = summary_scenario
+    else:
+        scenario = chat_scenario
+
+    if args.base_url:
+        if args.target == "mongodb" and not state["article_ids"]:
+            sys.exit("--article-id is required with --base-url for the mongodb target")
+        return scenario, state, lambda: httpx.AsyncClient(base_url=args.base_url, timeout=120), True
+
+    configure_environment(args)
+    if args.target == "api":
+        import api
+        transport = httpx.ASGITransport(app=api.app)
+        return scenario, state, lambda: httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120), True
+
+    if args.target == "flask":
+        import flask_api
+        app = flask_api.app
+    else:
+        if args.mongomock:
+            import mongomock
+            import pymongo
+            client = mongomock.MongoClient()
+            pymongo.MongoClient = lambda *a, **k: client
+            # mongomock has no change streams
+            os.environ.setdefault("ARTICLE_CACHE_INVALIDATION", "poll")
+            for name, value in (("MONGO_URI", "mongodb://mongomock"), ("DATABASE_NAME", "loadtest"), ("COLLECTION_NAME", "articles")):
+                os.environ.setdefault(name, value)
+        import mongodb_api
+        app = mongodb_api.app
+        if args.mongomock:
+            mongodb_api.get_collection().insert_many([
+                {"title": f"Article {i}", "meta": {"description": ARTICLES[i % len(ARTICLES)][:300]}, "body": ARTICLES[i % len(ARTICLES)]}
+                for i in range(200)
+            ])
+        if not state["article_ids"]:
+            state["article_ids"] = [str(doc["_id"]) for doc in mongodb_api.get_collection().find({}, {"_id": 1}).limit(500)]
+    transport = httpx.WSGITransport(app=app)
+    return scenario, state, lambda: httpx.Client(transport=transport, base_url="http://loadtest", timeout=120), False
+
+# === Runner ===
+
+async def virtual_user(vu, args, scenario, state, make_client, is_async, results, deadline):
+    rng = random.Random(args.seed * 100003 + vu)
+    client = make_client()
+    try:
+        while time.perf_counter() < deadline:
+            for method, path, body in scenario(rng, vu, state):
+                if time.perf_counter() >= deadline:
+                    break
+                start = time.perf_counter()
+                try:
+                    if is_async:
+                        response = await client.request(method, path, json=body)
+                    else:
+                        response = await asyncio.to_thread(client.request, method, path, json=body)
+                    ok = response.status_code < 400
+                except Exception:
+                    ok = False
+                results[path].append((time.perf_counter() - start, ok))
+    finally:
+        if is_async:
+            await client.aclose()
+        else:
+            client.close()
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(results, elapsed):
+    report = {"elapsed_s": round(elapsed, 2), "endpoints": {}}
+    everything = []
+    for path, samples in sorted(results.items()):
+        latencies = sorted(s for s, _ in samples)
+        everything.extend(samples)
+        report["endpoints"][path] = _stats(latencies, samples, elapsed)
+    report["total"] = _stats(sorted(s for s, _ in everything), everything, elapsed)
+    return report
+
+def _stats(latencies, samples, elapsed):
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, ok in samples if not ok),
+        "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+async def run(args):
+    scenario, state, make_client, is_async = load_target(args)
+    if not is_async:
+        # One thread per virtual user for the blocking WSGI client
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.users))
+    results = defaultdict(list)
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(
+        virtual_user(vu, args, scenario, state, make_client, is_async, results, deadline)
+        for vu in range(args.users)
+    ))
+    return summarize(results, time.perf_counter() - start)
+
+def print_report(report, target, users):
+    print(f"\n{target}: {users} virtual users for {report['elapsed_s']}s")
+    print(f"{'endpoint':<20}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for path, s in rows:
+        print(f"{path:<20}{s['requests']:>10}{s['errors']:>8}{s['rps']:>9}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["api", "flask", "mongodb"], default="api")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users.")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run.")
+    parser.add_argument("--base-url", help="Load a running server instead of the in-process app.")
+    parser.add_argument("--article-id", action="append", help="Article id to request (mongodb target, repeatable).")
+    parser.add_argument("--mongomock", action="store_true", help="Run mongodb_api against an in-memory mongomock database.")
+    parser.add_argument("--llm-latency", default="lognormal:0.3,0.5", help="Fake backend latency distribution.")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fake backend error injection rate.")
+    parser.add_argument("--cache", action="store_true", help="Keep the LLM response cache enabled.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail if overall p95 latency exceeds this.")
+    parser.add_argument("--min-rps", type=float, help="Fail if overall throughput is below this.")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.target, args.users)
+
+    failures = []
+    if args.max_p95_ms is not None and report["total"]["p95_ms"] > args.max_p95_ms:
+        failures.append(f"p95 {report['total']['p95_ms']} ms > {args.max_p95_ms} ms")
+    if args.min_rps is not None and report["total"]["rps"] < args.min_rps:
+        failures.append(f"throughput {report['total']['rps']} rps < {args.min_rps} rps")
+    if failures:
+        print("FAILED: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,252 @@
-import re
-from llm_service import call_gemini
-from config import ARTICLE
+import asyncio
+import logging
+import threading
+import uuid
+from llm_service import call_gemini, call_gemini_async, generate, is_error_reply, stream_gemini, stream_gemini_async
+from config import (
+    ARTICLE, RAG_ENABLED, RAG_TOP_K, RAG_CHUNK_CHARS, RAG_MIN_CHARS, SUMMARY_CHAT_MODE,
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_MAX_DOCUMENTS,
+    SEMANTIC_CACHE_AUDIT_RATE, SEMANTIC_CACHE_AUDIT_AGREEMENT,
+    INTENT_CLASSIFIER, INTENT_CONFIDENCE_THRESHOLD,
+    SPECULATIVE_WRITER, SPECULATIVE_TITLE_PICKS, SPECULATIVE_IDEA_PICKS,
+    SPECULATIVE_CONCURRENCY, SPECULATIVE_MAX_ENTRIES, SPECULATIVE_MAX_SESSIONS
+)
+from document_registry import document_id
+from intent_classifier import SMALL_TALK_REPLIES, create_classifier
+from lazy import ProcessLocal
+from llm_scheduler import request_context
+from metrics import INTENT_ROUTES, span, stage
+from speculation import SpeculationCache, match_option, parse_options
+
+def _create_retriever():
+    # Imported here so numpy is only loaded once a question is actually answered
+    from retrieval import Retriever
+    return Retriever(top_k=RAG_TOP_K, chunk_chars=RAG_CHUNK_CHARS, min_chars=RAG_MIN_CHARS)
+
+retriever = ProcessLocal(_create_retriever)
+
+def _create_answer_cache():
+    from answer_cache import SemanticAnswerCache
+    return SemanticAnswerCache(
+        threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        max_documents=SEMANTIC_CACHE_MAX_DOCUMENTS, audit_rate=SEMANTIC_CACHE_AUDIT_RATE,
+        audit_agreement=SEMANTIC_CACHE_AUDIT_AGREEMENT
+    )
+
+# Answers to earlier questions about the same document, matched by meaning
+answer_cache = ProcessLocal(_create_answer_cache)
+
+# Background generations of the article writer, see ArticleWriterModule
+speculations = ProcessLocal(
+    lambda: SpeculationCache(SPECULATIVE_CONCURRENCY, SPECULATIVE_MAX_ENTRIES, SPECULATIVE_MAX_SESSIONS)
+)
+
+def _prepare_summary(context_vars):
+    # Long articles are summarized chunk by chunk first (SUMMARY_CHAT_MODE, see summarizer.py)
+    from summarizer import summary_input
+    return {**context_vars, "text": summary_input(context_vars["text"], SUMMARY_CHAT_MODE)}
+
+class PendingCall:
+    """An LLM call that must complete before a reply can be produced.
+
+    The workflow logic builds one of these instead of calling the model
+    directly, so the same state transitions serve the blocking, asyncio and
+    streaming code paths. The reply is `prefix` followed by the model output;
+    `on_result` applies state changes once the full output is known, and
+    `on_abort` undoes the pending transition if a stream is abandoned.
+    `prepare(context_vars)`, if given, is blocking work that produces the
+    final context (e.g. summarizing a long text chunk by chunk); the async
+    paths run it in a worker thread. It may instead return the output itself
+    (e.g. a cached answer), and then the model is not called.
+    """
+    def __init__(self, prompt_key, context_vars, on_result=None, prefix="", on_abort=None, prepare=None):
+        self.prompt_key = prompt_key
+        self.context_vars = context_vars
+        self.on_result = on_result
+        self.prefix = prefix
+        self.on_abort = on_abort
+        self.prepare = prepare
+
+    def _context(self):
+        return self.prepare(self.context_vars) if self.prepare else self.context_vars
+
+    async def _context_async(self):
+        return await asyncio.to_thread(self.prepare, self.context_vars) if self.prepare else self.context_vars
+
+    def complete(self, result: str):
+        if self.on_result:
+            self.on_result(result)
+        return self.prefix + result
+
+    def _call(self):
+        context = self._context()
+        if isinstance(context, str):
+            return context
+        return call_gemini(self.prompt_key, context_vars=context)
+
+    async def _call_async(self):
+        context = await self._context_async()
+        if isinstance(context, str):
+            return context
+        return await call_gemini_async(self.prompt_key, context_vars=context)
+
+    def _chunks(self):
+        context = self._context()
+        if isinstance(context, str):
+            yield context
+        else:
+            yield from stream_gemini(self.prompt_key, context_vars=context)
+
+    async def _chunks_async(self):
+        context = await self._context_async()
+        if isinstance(context, str):
+            yield context
+            return
+        async for chunk in stream_gemini_async(self.prompt_key, context_vars=context):
+            yield chunk
+
+    def run(self):
+        return self.complete(self._call())
+
+    async def run_async(self):
+        return self.complete(await self._call_async())
+
+    def stream(self):
+        """Yields the reply in chunks; state changes are applied after the last chunk."""
+        parts = []
+        finished = False
+        try:
+            if self.prefix:
+                yield self.prefix
+            for chunk in self._chunks():
+                if not parts:
+                    chunk = chunk.lstrip()
+                if chunk:
+                    parts.append(chunk)
+                    yield chunk
+            finished = True
+            self.complete("".join(parts).strip())
+        finally:
+            if not finished and self.on_abort:
+                self.on_abort()
+
+    async def stream_async(self):
+        """Async variant of `stream`."""
+        parts = []
+        finished = False
+        try:
+            if self.prefix:
+                yield self.prefix
+            async for chunk in self._chunks_async():
+                if not parts:
+                    chunk = chunk.lstrip()
+                if chunk:
+                    parts.append(chunk)
+                    yield chunk
+            finished = True
+            self.complete("".join(parts).strip())
+        finally:
+            if not finished and self.on_abort:
+                self.on_abort()
+
+class SpeculativeCall(PendingCall):
+    """A PendingCall whose output is already being generated in the background.
+
+    The speculation's result is used once it finishes; if it failed, the call
+    is made as usual.
+    """
+    def __init__(self, future, prompt_key, context_vars, **kwargs):
+        super().__init__(prompt_key, context_vars, **kwargs)
+        self.future = future
+
+    def _speculated(self):
+        try:
+            return self.future.result()
+        except Exception as e:
+            logging.warning(f"Speculative '{self.prompt_key}' failed, generating again: {e}")
+            return None
+
+    async def _speculated_async(self):
+        try:
+            return await asyncio.wrap_future(self.future)
+        except Exception as e:
+            logging.warning(f"Speculative '{self.prompt_key}' failed, generating again: {e}")
+            return None
+
+    def _call(self):
+        result = self._speculated()
+        return result if result is not None else super()._call()
+
+    async def _call_async(self):
+        result = await self._speculated_async()
+        return result if result is not None else await super()._call_async()
+
+    def _chunks(self):
+        result = self._speculated()
+        if result is None:
+            yield from super()._chunks()
+        else:
+            yield result
+
+    async def _chunks_async(self):
+        result = await self._speculated_async()
+        if result is None:
+            async for chunk in super()._chunks_async():
+                yield chunk
+        else:
+            yield result
+
+def _resolve(reply):
+    return reply.run() if isinstance(reply, PendingCall) else reply
+
+async def _resolve_async(reply):
+    return await reply.run_async() if isinstance(reply, PendingCall) else reply
 
 class ArticleWriterModule:
-    """Manages the multi-step process of writing an article."""
-    def __init__(self):
+    """Manages the multi-step process of writing an article.
+
+    If `speculative` (default: SPECULATIVE_WRITER), blog ideas for the first
+    titles and an article for the first blog ideas are generated in the
+    background while the user is still choosing (see speculation.py).
+    """
+    def __init__(self, speculative=None):
         self.stage = "idle"
         self.context = {}
+        self.speculative = SPECULATIVE_WRITER if speculative is None else speculative
     def reset(self):
+        self._discard_speculations()
         self.stage = "idle"
         self.context = {}
 
+    def to_state(self):
+        """Compact, JSON-serializable state, or None when there is nothing worth keeping."""
+        if self.stage == "idle" and not self.context:
+            return None
+        return {"s": self.stage, "c": self.context}
+
+    @classmethod
+    def from_state(cls, state):
+        module = cls()
+        if state:
+            module.stage = state["s"]
+            module.context = state["c"]
+        return module
+
     def handle(self, user_msg: str):
         """Processes user input through the article writing workflow."""
+        return _resolve(self.advance(user_msg))
+
+    async def handle_async(self, user_msg: str):
+        """Async variant of `handle` that awaits the LLM without blocking the event loop."""
+        return await _resolve_async(self.advance(user_msg))
+
+    def advance(self, user_msg: str):
+        """
+        Moves the workflow forward by one user message.
+
+        Returns a reply string, a PendingCall whose completion yields the reply,
+        or None if the message is not handled by this module.
+        """
         msg_lower = user_msg.strip().lower()
 
         if self.stage == "idle":
@@ -24,74 +258,302 @@ class ArticleWriterModule:
         elif self.stage == "awaiting_context":
             self.context["description"] = user_msg
             self.stage = "generating_titles"
-            return self._generate_titles()
+            return self._titles_call()
 
         elif self.stage == "awaiting_title_choice":
             self.context["chosen_title"] = user_msg
             self.context["title"] = user_msg  # Store title for later use
             self.stage = "generating_blog_ideas"
-            return self._generate_blog_ideas()
+            return self._blog_ideas_call()
 
         elif self.stage == "awaiting_blog_choice":
             self.context["chosen_blog"] = user_msg
             self.context["blog_idea"] = user_msg  # <-- Add this line
             self.stage = "generating_final_article"
-            return self._generate_article()
+            return self._article_call()
 
         return None # Should not be reached
 
-    def _generate_titles(self):
-        titles = call_gemini("generate_titles", context_vars={"description": self.context["description"]})
+    def _titles_call(self):
+        return PendingCall(
+            "generate_titles", {"description": self.context["description"]}, self._on_titles,
+            prefix="Here are 5 title options. Please copy and paste the one you'd like to use:\n\n",
+            on_abort=lambda: self._rollback("awaiting_context")
+        )
+
+    def _on_titles(self, titles):
         self.context["titles"] = titles
         self.stage = "awaiting_title_choice"
-        return f"Here are 5 title options. Please copy and paste the one you'd like to use:\n\n{titles}"
+        for title in self._likely_picks(titles, SPECULATIVE_TITLE_PICKS):
+            self._speculate("generate_blog_ideas", title, {"title": title, "description": self.context["description"]})
 
-    def _generate_blog_ideas(self):
-        ideas = call_gemini("generate_blog_ideas", context_vars=self.context)
+    def _blog_ideas_call(self):
+        future, title = self._take_speculation("generate_blog_ideas", self.context.get("titles"), self.context["title"])
+        if title is not None:
+            self.context["title"] = title
+        return self._pending(
+            future, "generate_blog_ideas", self.context, self._on_blog_ideas,
+            prefix="Excellent. Now, here are 5 blog ideas based on that title. Please pick one to develop:\n\n",
+            on_abort=lambda: self._rollback("awaiting_title_choice")
+        )
+
+    def _on_blog_ideas(self, ideas):
         self.context["ideas"] = ideas
         self.stage = "awaiting_blog_choice"
-        return f"Excellent. Now, here are 5 blog ideas based on that title. Please pick one to develop:\n\n{ideas}"
+        for idea in self._likely_picks(ideas, SPECULATIVE_IDEA_PICKS):
+            self._speculate("generate_article", idea, self._article_vars(idea))
 
-    def _generate_article(self):
+    def _article_vars(self, blog_idea):
         # Prepare context for the prompt
-        context_vars = {
+        return {
             "title": self.context.get("title", ""),
-            "blog_idea": self.context.get("chosen_blog", ""),
+            "blog_idea": blog_idea,
             "description": self.context.get("description", "")
         }
-        article = call_gemini("generate_article", context_vars=context_vars)
-        final_response = f"**Here is your complete article:**\n\n---\n\n{article}"
+
+    def _article_call(self):
+        future, idea = self._take_speculation("generate_article", self.context.get("ideas"), self.context.get("chosen_blog", ""))
+        if idea is not None:
+            self.context["chosen_blog"] = self.context["blog_idea"] = idea
+        return self._pending(
+            future, "generate_article", self._article_vars(self.context.get("chosen_blog", "")), self._on_article,
+            prefix="**Here is your complete article:**\n\n---\n\n",
+            on_abort=lambda: self._rollback("awaiting_blog_choice")
+        )
+
+    def _on_article(self, article):
         self.reset()  # Reset for the next use
-        return final_response
+
+    def _rollback(self, stage):
+        """Returns to `stage` when a generation step was abandoned before it finished."""
+        self.stage = stage
+
+    # === Speculation ===
+    def _likely_picks(self, options_text, count):
+        # Users mostly pick from the top of a list
+        return parse_options(options_text)[:count] if self.speculative else []
+
+    def _speculate(self, prompt_key, option, context_vars):
+        session = self.context.setdefault("speculation_id", uuid.uuid4().hex)
+        speculations.get().start(session, prompt_key, option, context_vars)
+
+    def _take_speculation(self, prompt_key, options_text, choice):
+        """
+        Returns (future or None, matched option or None) for the user's `choice`.
+
+        The session's other speculations for `prompt_key` are cancelled.
+        """
+        if not self.speculative or "speculation_id" not in self.context:
+            return None, None
+        option = match_option(choice, parse_options(options_text))
+        return speculations.get().take(self.context["speculation_id"], prompt_key, option), option
+
+    def _discard_speculations(self):
+        if "speculation_id" in self.context:
+            speculations.get().discard(self.context["speculation_id"])
+
+    @staticmethod
+    def _pending(future, prompt_key, context_vars, on_result, **kwargs):
+        if future is not None:
+            return SpeculativeCall(future, prompt_key, context_vars, on_result=on_result, **kwargs)
+        return PendingCall(prompt_key, context_vars, on_result, **kwargs)
+
+    def _generate_titles(self):
+        return self._titles_call().run()
+
+    def _generate_blog_ideas(self):
+        return self._blog_ideas_call().run()
+
+    def _generate_article(self):
+        return self._article_call().run()
+
+# === Session Persistence ===
+def load_session(store, session_id: str):
+    """Returns the session's ArticleWriterModule, or None if the store has no state for it."""
+    state = store.get(session_id)
+    return ArticleWriterModule.from_state(state) if state else None
+
+def save_session(store, session_id: str, writer_module: ArticleWriterModule):
+    """Writes the module back to the store, dropping sessions that have no state left."""
+    state = writer_module.to_state()
+    if state is None:
+        store.delete(session_id)
+    else:
+        store.put(session_id, state)
 
 # === Intent Detection ===
+# Trained once per process on first use
+intent_classifier = ProcessLocal(lambda: create_classifier(INTENT_CLASSIFIER, threshold=INTENT_CONFIDENCE_THRESHOLD))
+
+def classify_intent(msg: str):
+    """Returns an `intent_classifier.Intent` (name, confidence, source); no LLM call."""
+    intent = intent_classifier.get().classify(msg)
+    INTENT_ROUTES.inc(intent=intent.name, source=intent.source)
+    return intent
+
 def detect_intent(msg: str):
-    msg_lower = msg.lower()
-    if "summary" in msg_lower or "summarize" in msg_lower: return "summary"
-    if "topic" in msg_lower or "suggest" in msg_lower: return "topic"
-    return "qa" # Default fallback
+    return classify_intent(msg).name
 
 # === Main Chat Engine Function ===
-def get_bot_response(user_msg: str,text: str,writer_module: ArticleWriterModule) -> str:
+def route_message(user_msg: str, text: str, writer_module: ArticleWriterModule):
     """
-    Determines the user's intent and gets the appropriate response.
-    This is the main entry point for the logic.
+    Determines the user's intent without calling the LLM.
+
+    Returns a reply string or a PendingCall that produces the reply.
     """
-    # First, check for simple greetings
-    if re.match(r"^\s*(hi|hello|hey)\b.*", user_msg.lower()):
-        return "Hi there! How can I help you today? You can ask me to summarize the article, suggest new topics, ask a question about it, or write a new article."
+    intent = classify_intent(user_msg)
+
+    # First, answer small talk without the LLM. Inside the article workflow
+    # only greetings are, as any other message is the answer to a step
+    if intent.name in SMALL_TALK_REPLIES and (writer_module.stage == "idle" or intent.name == "greeting"):
+        return SMALL_TALK_REPLIES[intent.name]
 
     # Second, let the ArticleWriterModule try to handle it
-    module_response = writer_module.handle(user_msg)
+    module_response = writer_module.advance(user_msg)
     if module_response:
         return module_response
 
-    # If not handled, fall back to simple intent detection
-    intent = detect_intent(user_msg)
-    
+    # If not handled, route by the detected intent
+    intent = intent.name
     if intent == "summary":
-        return call_gemini("summary", context_vars={"text": text})
+        return PendingCall("summary", {"text": text}, prepare=_prepare_summary)
     elif intent == "topic":
-        return call_gemini("suggest_topics", context_vars={"text": text})
+        return PendingCall("suggest_topics", {"text": text})
     else: # Default to Q&A
-        return call_gemini("question_answering", context_vars={"text": text, "question": user_msg})
+        return _answer_question(user_msg, text)
+
+def _qa_context(text, question):
+    # Long articles: only the chunks relevant to the question go into the prompt
+    with stage("retrieval"):
+        return retriever.get().context_for(text, question) if RAG_ENABLED else text
+
+def _prepare_question(context_vars):
+    return {**context_vars, "text": _qa_context(context_vars["text"], context_vars["question"])}
+
+def _answer_question(question, text):
+    """
+    A PendingCall that answers `question`, or reuses the cached answer to a rewording of it.
+
+    Retrieval and the answer cache lookup (embedding the question) run in its
+    `prepare` step, so the async paths do them off the event loop.
+    """
+    context_vars = {"text": text, "question": question}
+    doc_key = document_id(text) if SEMANTIC_CACHE_ENABLED and text else None
+    if doc_key is None:
+        return PendingCall("question_answering", context_vars, prepare=_prepare_question)
+
+    cache = answer_cache.get()
+    hits = []
+
+    def lookup(context_vars):
+        with stage("answer_cache"):
+            match = cache.lookup(doc_key, question)
+        if match is None:
+            return _prepare_question(context_vars)
+        hits.append(match)
+        if cache.should_audit():
+            threading.Thread(target=_audit_answer, args=(doc_key, question, text, match), daemon=True).start()
+        return match.answer
+
+    def remember(answer):
+        if not hits and answer and not is_error_reply(answer):
+            cache.put(doc_key, question, answer)
+    return PendingCall("question_answering", context_vars, remember, prepare=lookup)
+
+def _audit_answer(doc_key, question, text, match):
+    """Answers a cache hit's question again to count false hits (semantic_cache_audits_total)."""
+    try:
+        with request_context(priority="background"):
+            fresh = generate("question_answering", {"text": _qa_context(text, question), "question": question})
+    except Exception as e:
+        logging.warning(f"Semantic cache audit skipped: {e}")
+        return
+    if not answer_cache.get().audit(doc_key, question, match, fresh):
+        logging.info(f"Semantic cache false hit: '{question}' matched '{match.question}' ({match.score:.2f})")
+
+def _route(user_msg, text, writer_module):
+    with stage("intent_routing", writer_stage=writer_module.stage):
+        return route_message(user_msg, text, writer_module)
+
+def get_bot_response(user_msg: str,text: str,writer_module: ArticleWriterModule) -> str:
+    """
+    Determines the user's intent and gets the appropriate response.
+    This is the main entry point for the logic.
+    """
+    with span("get_bot_response", text_chars=len(text)):
+        return _resolve(_route(user_msg, text, writer_module))
+
+async def get_bot_response_async(user_msg: str, text: str, writer_module: ArticleWriterModule) -> str:
+    """Async variant of `get_bot_response` for asyncio servers such as FastAPI."""
+    with span("get_bot_response", text_chars=len(text)):
+        return await _resolve_async(_route(user_msg, text, writer_module))
+
+# Long generations that /chat hands to the job queue (jobs.py) when the client asks for a job
+JOB_PROMPTS = ("generate_article",)
+
+def _deferrable(reply):
+    if not isinstance(reply, PendingCall) or reply.prompt_key not in JOB_PROMPTS:
+        return False
+    # A step already generated in the background is answered right away
+    return not (isinstance(reply, SpeculativeCall) and reply.future.done())
+
+def _defer(reply, submit):
+    """
+    Hands a JOB_PROMPTS step to `submit(call)` and returns the job.
+
+    The workflow moves on as if the step had completed, since its output now
+    belongs to the job. If `submit` raises (e.g. jobs.QueueFull), the step is
+    rolled back so the same message can be sent again.
+    """
+    try:
+        job = submit(reply)
+    except Exception:
+        if reply.on_abort:
+            reply.on_abort()
+        raise
+    if isinstance(reply, SpeculativeCall):
+        reply.future.cancel()
+    if reply.on_result:
+        reply.on_result("")
+    return job
+
+def submit_bot_response(user_msg: str, text: str, writer_module: ArticleWriterModule, submit):
+    """
+    Variant of `get_bot_response` that queues long generations instead of running them.
+
+    Returns (reply, None), or (None, job) when the step was handed to `submit`.
+    """
+    with span("get_bot_response", text_chars=len(text)):
+        reply = _route(user_msg, text, writer_module)
+        if _deferrable(reply):
+            return None, _defer(reply, submit)
+        return _resolve(reply), None
+
+async def submit_bot_response_async(user_msg: str, text: str, writer_module: ArticleWriterModule, submit):
+    """Async variant of `submit_bot_response`; `submit` is a blocking callable run in a thread."""
+    with span("get_bot_response", text_chars=len(text)):
+        reply = _route(user_msg, text, writer_module)
+        if _deferrable(reply):
+            return None, await asyncio.to_thread(_defer, reply, submit)
+        return await _resolve_async(reply), None
+
+def stream_bot_response(user_msg: str, text: str, writer_module: ArticleWriterModule):
+    """Streaming variant of `get_bot_response`. Yields the reply in chunks."""
+    reply = _route(user_msg, text, writer_module)
+    if isinstance(reply, PendingCall):
+        yield from reply.stream()
+    else:
+        yield reply
+
+async def stream_bot_response_async(user_msg: str, text: str, writer_module: ArticleWriterModule):
+    """Async variant of `stream_bot_response`."""
+    reply = _route(user_msg, text, writer_module)
+    if isinstance(reply, PendingCall):
+        stream = reply.stream_async()
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+    else:
+        yield reply
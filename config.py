@@ -1,20 +1,112 @@
 import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+# Settings only: clients are created lazily on first use (see llm_service and lazy.ProcessLocal),
+# so importing this module needs no credentials and does no network I/O
 load_dotenv()
 
-try:
-    api_key = os.environ["GOOGLE_API_KEY"]
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables.")
-    genai.configure(api_key=api_key)
-    print("Gemini API configured successfully.")
-except (KeyError, ValueError) as e:
-    print(f"Error configuring Gemini API: {e}")
-    exit()
-
-model = genai.GenerativeModel("gemini-2.0-flash")
+# LLM backend: "gemini" or "fake" (local stand-in for load tests, no API key needed)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Explicit context caching of long prompt prefixes (the article) for prompts with a context_field in prompts.py
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096"))  # the API rejects small caches
+GEMINI_CONTEXT_CACHE_MIN_USES = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_USES", "2"))  # prefix seen this often before it is cached
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "600"))  # seconds; storage is billed per token-hour
+GEMINI_CONTEXT_CACHE_MAX = int(os.getenv("GEMINI_CONTEXT_CACHE_MAX", "32"))  # caches per process, least recently used released first
+
+# Options for the fake backend, see llm_backends.FakeModel
+FAKE_LLM_OPTIONS = {
+    "latency": os.getenv("FAKE_LLM_LATENCY", "lognormal:0.8,0.5"),
+    "tokens_per_second": float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "0")),
+    "output_tokens": int(os.getenv("FAKE_LLM_OUTPUT_TOKENS", "60")),
+    "error_rate": float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+    "error_codes": os.getenv("FAKE_LLM_ERROR_CODES", "429,503"),
+    "seed": int(os.getenv("FAKE_LLM_SEED", "0")),
+}
+
+# Seconds to wait for a single async Gemini call before giving up
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# LLM response cache: "memory", "sqlite" or "none"
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))  # seconds, 0 disables expiry
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+
+# Client-side protection for the Gemini quota; GEMINI_RPM=0 disables the rate limiter
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "1000"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "20"))
+LLM_RATE_LIMIT_MAX_WAIT = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT", "10"))  # seconds to queue for a slot before 429
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))  # consecutive failures that open the circuit
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))  # seconds before a trial call is allowed
+# Scheduling of upstream calls (llm_scheduler.py): priority classes, per-session fair queuing, concurrency cap
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "true").lower() == "true"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # upstream calls in flight per process
+LLM_RESERVED_INTERACTIVE = int(os.getenv("LLM_RESERVED_INTERACTIVE", "2"))  # of those, slots batch/background calls never take
+LLM_QUEUE_MAX_WAIT = float(os.getenv("LLM_QUEUE_MAX_WAIT", "30"))  # seconds a call without X-Request-Timeout may queue (0 = no limit)
+
+# Hierarchical summaries of long texts (summarizer.py); also used by map_reduce budgets in prompts.py
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", os.getenv("LLM_MAP_CONCURRENCY", "4")))  # process-wide pool
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_SINGLE_PASS_TOKENS = int(os.getenv("SUMMARY_SINGLE_PASS_TOKENS", "4000"))  # "auto" mode threshold
+SUMMARY_MAX_LEVELS = int(os.getenv("SUMMARY_MAX_LEVELS", "3"))
+SUMMARY_CHAT_MODE = os.getenv("SUMMARY_CHAT_MODE", "auto")  # auto, single or map_reduce
+# Partial summaries by chunk hash: "memory", "sqlite" (shared by workers, survives restarts) or "none"
+SUMMARY_CHUNK_CACHE_BACKEND = os.getenv("SUMMARY_CHUNK_CACHE_BACKEND", "memory")
+SUMMARY_CHUNK_CACHE_TTL = float(os.getenv("SUMMARY_CHUNK_CACHE_TTL", str(7 * 86400)))
+SUMMARY_CHUNK_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CHUNK_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+SUMMARY_CHUNK_CACHE_PATH = os.getenv("SUMMARY_CHUNK_CACHE_PATH", "summary_chunks.sqlite3")
+
+# Chat session store: "memory" (per process) or "redis" (shared across workers)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))  # idle seconds before a session is dropped
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))  # memory backend only
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Registered chat documents: "memory" (per process) or "redis" (shared across workers)
+DOCUMENT_BACKEND = os.getenv("DOCUMENT_BACKEND", "memory")
+DOCUMENT_TTL = float(os.getenv("DOCUMENT_TTL", "86400"))  # idle seconds before a document is dropped
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(64 * 1024 * 1024)))  # memory backend only
+
+# Retrieval for question answering: only the most relevant chunks of long articles go into the prompt
+RAG_ENABLED = os.getenv("RAG_ENABLED", "true").lower() == "true"
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "800"))
+RAG_MIN_CHARS = int(os.getenv("RAG_MIN_CHARS", "4000"))  # shorter articles are sent whole
+
+# Semantic answer cache (answer_cache.py): reuse a Q&A answer for rewordings of an answered question about the same document
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))  # cosine similarity of the questions
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "64"))  # questions per document (LRU)
+SEMANTIC_CACHE_MAX_DOCUMENTS = int(os.getenv("SEMANTIC_CACHE_MAX_DOCUMENTS", "256"))  # documents per process (LRU)
+SEMANTIC_CACHE_AUDIT_RATE = float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", "0.02"))  # share of hits answered again to count false hits
+SEMANTIC_CACHE_AUDIT_AGREEMENT = float(os.getenv("SEMANTIC_CACHE_AUDIT_AGREEMENT", "0.5"))  # answer similarity that counts as agreeing
+
+# Intent routing (intent_classifier.py): "local" (keywords + naive Bayes, small-talk replies) or "keyword" (old substring rules)
+INTENT_CLASSIFIER = os.getenv("INTENT_CLASSIFIER", "local")
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.6"))  # below it, the LLM answers as Q&A
+
+# Article writer: generate the next step for the likeliest picks while the user is choosing (speculation.py)
+SPECULATIVE_WRITER = os.getenv("SPECULATIVE_WRITER", "false").lower() == "true"
+SPECULATIVE_TITLE_PICKS = int(os.getenv("SPECULATIVE_TITLE_PICKS", "2"))  # blog idea lists prefetched per title list
+SPECULATIVE_IDEA_PICKS = int(os.getenv("SPECULATIVE_IDEA_PICKS", "1"))  # articles drafted per blog idea list
+SPECULATIVE_CONCURRENCY = int(os.getenv("SPECULATIVE_CONCURRENCY", "4"))
+SPECULATIVE_MAX_ENTRIES = int(os.getenv("SPECULATIVE_MAX_ENTRIES", "4"))  # per session
+SPECULATIVE_MAX_SESSIONS = int(os.getenv("SPECULATIVE_MAX_SESSIONS", "1000"))
+
+# Article jobs (jobs.py): /chat with "job": true queues the final article for `python jobs.py` workers
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.sqlite3")  # shared by the API processes and the workers
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))  # queued jobs before /chat answers 429
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", "10"))  # Retry-After seconds sent with a 429
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))  # jobs run at once per worker process
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "30"))  # a running job not renewed for this long is run again
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # runs before a job whose workers keep dying fails
+JOB_TTL = float(os.getenv("JOB_TTL", "86400"))  # seconds a finished job stays readable
+JOB_CALLBACK_HOSTS = os.getenv("JOB_CALLBACK_HOSTS", "")  # hosts allowed in callback_url (comma-separated, "*" = any); empty disables callbacks
 
 ARTICLE = """
 
@@ -0,0 +1,140 @@
+"""
+Upload-once registry for the documents chat turns are about.
+
+Clients register an article's text (or its Mongo `article_id`) once and refer
+to the returned `doc_id` on later `/chat` turns instead of re-sending the
+whole text. A `doc_id` is the SHA-256 of the text, so registering the same
+content twice returns the same id and stores a single copy; the same hash
+identifies the document for per-document caches downstream.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from lazy import ProcessLocal
+
+def document_id(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class MemoryDocumentRegistry:
+    """In-process registry bounded by total stored bytes, with an idle TTL."""
+    # Calls never wait on the network, so async servers make them inline
+    blocking = False
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=86400):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # doc_id -> (text, size, expires_at)
+        self._lock = threading.Lock()
+
+    def register(self, text):
+        doc_id = document_id(text)
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            raise ValueError("Document is larger than the registry can hold.")
+        with self._lock:
+            old = self._entries.pop(doc_id, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[doc_id] = (text, size, self._expires_at())
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+        return doc_id
+
+    def get(self, doc_id):
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is None:
+                return None
+            text, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[doc_id]
+                self.current_bytes -= size
+                return None
+            self._entries[doc_id] = (text, size, self._expires_at())
+            self._entries.move_to_end(doc_id)
+            return text
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expires_at(self):
+        return time.monotonic() + self.ttl if self.ttl else None
+
+class RedisDocumentRegistry:
+    """Registry on a Redis-protocol server, shared by every worker and node; calls block on the network."""
+    blocking = True
+
+    def __init__(self, client, ttl=86400, prefix="chatbot:doc:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def register(self, text):
+        doc_id = document_id(text)
+        self.client.set(self.prefix + doc_id, text.encode("utf-8"), ex=int(self.ttl) if self.ttl else None)
+        return doc_id
+
+    def get(self, doc_id):
+        key = self.prefix + doc_id
+        data = self.client.get(key)
+        if data is None:
+            return None
+        if self.ttl:
+            self.client.expire(key, int(self.ttl))
+        return data.decode("utf-8")
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*", count=1000))
+
+def create_document_registry(backend, max_bytes=64 * 1024 * 1024, ttl=86400, redis_url=None):
+    """Builds the registry named by `backend` ("memory" or "redis")."""
+    if backend == "memory":
+        return MemoryDocumentRegistry(max_bytes=max_bytes, ttl=ttl)
+    if backend == "redis":
+        import redis  # Only needed when documents are shared through Redis
+        return RedisDocumentRegistry(redis.Redis.from_url(redis_url), ttl=ttl)
+    raise ValueError(f"Unknown document registry backend: {backend}")
+
+# === Registering Mongo articles ===
+
+# Dotted article fields joined (in order) to form the text of a registered article
+ARTICLE_TEXT_FIELDS = [f.strip() for f in os.getenv("ARTICLE_TEXT_FIELDS", "title,meta.description,content").split(",") if f.strip()]
+
+def _connect_article_collection():
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise LookupError("Registering articles by article_id requires MONGO_URI to be set.")
+    from article_repository import create_client
+    client = create_client(mongo_uri)
+    return client[os.getenv("DATABASE_NAME")][os.getenv("COLLECTION_NAME")]
+
+_article_collection = ProcessLocal(_connect_article_collection)
+
+def article_collection():
+    """Connects to the configured article collection on first use."""
+    return _article_collection.get()
+
+def _field(doc, dotted):
+    for part in dotted.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+def article_text(article):
+    """Text of an article document built from ARTICLE_TEXT_FIELDS."""
+    values = (_field(article, name) for name in ARTICLE_TEXT_FIELDS)
+    return "\n\n".join(str(v).strip() for v in values if v)
+
+def fetch_article_text(article_id, collection=None):
+    """Loads an article's text by id, or returns None if it does not exist."""
+    from bson import ObjectId
+    collection = collection if collection is not None else article_collection()
+    article = collection.find_one({"_id": ObjectId(article_id)}, {name: 1 for name in ARTICLE_TEXT_FIELDS})
+    return article_text(article) if article else None
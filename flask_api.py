@@ -1,9 +1,41 @@
-from flask import Flask, request, jsonify
-from chatbot_logic import ArticleWriterModule, get_bot_response
+import os
+from flask import Flask, Response, request, jsonify, stream_with_context
+from chatbot_logic import (
+    ArticleWriterModule, get_bot_response, stream_bot_response, submit_bot_response, load_session, save_session
+)
+from config import (
+    SESSION_BACKEND, SESSION_MAX_ENTRIES, SESSION_TTL, REDIS_URL,
+    DOCUMENT_BACKEND, DOCUMENT_MAX_BYTES, DOCUMENT_TTL, JOB_RETRY_AFTER
+)
+from document_registry import create_document_registry, fetch_article_text
+from jobs import QueueFull, create_job_queue, validate_callback_url
+from lazy import ProcessLocal
+from llm_scheduler import scope_flask, set_request
+from metrics import JOB_QUEUE_DEPTH, SESSIONS_ACTIVE, instrument_flask, stage
+from session_store import create_session_store
+from bson.errors import InvalidId
+from streaming import SSE_HEADERS, sse_event
 
 app = Flask(__name__)
+# /metrics and per-route request latency
+instrument_flask(app, "flask_api")
+# Priority and fair-share flow of the LLM calls made for each request
+scope_flask(app)
 
-SESSIONS = {}
+# Bounded, TTL-evicted session store; use SESSION_BACKEND=redis to share sessions across workers
+SESSIONS = ProcessLocal(
+    lambda: create_session_store(SESSION_BACKEND, max_entries=SESSION_MAX_ENTRIES, ttl=SESSION_TTL, redis_url=REDIS_URL)
+)
+# Documents registered once through /documents and referenced by doc_id on /chat
+DOCUMENTS = ProcessLocal(
+    lambda: create_document_registry(DOCUMENT_BACKEND, max_bytes=DOCUMENT_MAX_BYTES, ttl=DOCUMENT_TTL, redis_url=REDIS_URL)
+)
+# Article jobs for /chat with "job": true, run by `python jobs.py`
+JOBS = ProcessLocal(create_job_queue)
+if SESSION_BACKEND == "memory":
+    # Counting Redis sessions takes a keyspace SCAN, too costly for every scrape
+    SESSIONS_ACTIVE.set_function(lambda: len(SESSIONS.get()), service="flask_api")
+JOB_QUEUE_DEPTH.set_function(lambda: JOBS.get().depth() if JOBS.initialized() else 0, service="flask_api")
 
 @app.route("/chat", methods=["POST"])
 def chat_with_bot():
@@ -11,29 +43,136 @@ def chat_with_bot():
     session_id = data.get("session_id")
     user_message = data.get("message")
     text = data.get("text","")
+    stream = bool(data.get("stream", False))
     if not session_id or not user_message:
         return jsonify({"detail": "session_id and message are required."}), 400
+    set_request(session=session_id)
+    doc_id = data.get("doc_id")
+    if doc_id:
+        with stage("document_lookup"):
+            text = DOCUMENTS.get().get(doc_id)
+        if text is None:
+            return jsonify({"detail": "Unknown or expired doc_id. Please register the document again."}), 404
+    callback_url = data.get("callback_url")
+    if callback_url:
+        try:
+            validate_callback_url(callback_url)
+        except ValueError as e:
+            return jsonify({"detail": str(e)}), 400
 
     # Get or create a session for the user
-    if session_id not in SESSIONS:
-        SESSIONS[session_id] = ArticleWriterModule()
+    with stage("session_load"):
+        writer_module = load_session(SESSIONS.get(), session_id)
+    if writer_module is None:
+        writer_module = ArticleWriterModule()
         print(f"New session created: {session_id}")
 
-    writer_module = SESSIONS[session_id]
+    if data.get("job"):
+        return _submit_chat(session_id, user_message, text, writer_module, callback_url)
+
+    if stream:
+        return Response(
+            stream_with_context(_stream_chat(session_id, user_message, text, writer_module)),
+            mimetype="text/event-stream",
+            headers=SSE_HEADERS
+        )
 
     # Get the bot's response using our core logic
     bot_reply = get_bot_response(user_message, text, writer_module)
+    _save_session(session_id, writer_module, bot_reply)
+        
+    return jsonify({"session_id": session_id, "response": bot_reply})
+
+def _stream_chat(session_id, user_message, text, writer_module):
+    """Sends each chunk as a message event, then a `done` event with the full reply."""
+    parts = []
+    stream = stream_bot_response(user_message, text, writer_module)
+    try:
+        for chunk in stream:
+            parts.append(chunk)
+            yield sse_event({"text": chunk})
+    finally:
+        # Close explicitly so an abandoned stream rolls the workflow back before it is saved
+        stream.close()
+        bot_reply = "".join(parts).rstrip()
+        _save_session(session_id, writer_module, bot_reply)
+    yield sse_event({"session_id": session_id, "response": bot_reply}, event="done")
 
-    # Optional: Clean up session if the article writing process is finished
+def _submit_chat(session_id, user_message, text, writer_module, callback_url):
+    """Like a plain /chat turn, except that the final article is queued as a job (202)."""
+    def submit(call):
+        return JOBS.get().submit(
+            call.prompt_key, call.context_vars, prefix=call.prefix, session_id=session_id, callback_url=callback_url
+        )
+
+    try:
+        bot_reply, job = submit_bot_response(user_message, text, writer_module, submit)
+    except QueueFull:
+        response = jsonify({"detail": "Too many articles are being written. Please try again shortly."})
+        response.headers["Retry-After"] = str(JOB_RETRY_AFTER)
+        return response, 429
+    if job is None:
+        _save_session(session_id, writer_module, bot_reply)
+        return jsonify({"session_id": session_id, "response": bot_reply})
+    _save_session(session_id, writer_module, "")
+    return jsonify({
+        "session_id": session_id, "job_id": job["job_id"], "status": job["status"],
+        "response": f"Your article is being written. Check /jobs/{job['job_id']} for the result."
+    }), 202
+
+def _save_session(session_id, writer_module, bot_reply):
+    with stage("session_save"):
+        save_session(SESSIONS.get(), session_id, writer_module)
     if writer_module.stage == "idle" and "Here is your complete article" in bot_reply:
-        del SESSIONS[session_id]
         print(f"Session closed after article generation: {session_id}")
-        
-    return jsonify({"session_id": session_id, "response": bot_reply})
+
+@app.route("/documents", methods=["POST"])
+def register_document():
+    """Registers an article (text or article_id) once so /chat turns can refer to it by doc_id."""
+    data = request.get_json()
+    article_id = data.get("article_id")
+    if article_id:
+        try:
+            text = fetch_article_text(article_id)
+        except LookupError as e:
+            return jsonify({"detail": str(e)}), 400
+        except InvalidId:
+            return jsonify({"detail": "Invalid article_id."}), 400
+        if text is None:
+            return jsonify({"detail": f"Article with ID {article_id} not found."}), 404
+    elif data.get("text"):
+        text = data["text"]
+    else:
+        return jsonify({"detail": "text or article_id is required."}), 400
+
+    try:
+        doc_id = DOCUMENTS.get().register(text)
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 413
+    return jsonify({"doc_id": doc_id, "chars": len(text)})
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Status of an article job; `response` holds the article once `status` is "succeeded"."""
+    job = JOBS.get().get(job_id)
+    if job is None:
+        return jsonify({"detail": "Unknown or expired job_id."}), 404
+    return jsonify({k: v for k, v in job.items() if v is not None})
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """Cancels a queued or running article job."""
+    job = JOBS.get().cancel(job_id)
+    if job is None:
+        return jsonify({"detail": "Unknown or expired job_id."}), 404
+    if job["status"] in ("succeeded", "failed"):
+        return jsonify({"detail": f"Job already {job['status']}."}), 409
+    return jsonify({k: v for k, v in job.items() if v is not None})
 
 @app.route("/", methods=["GET"])
 def read_root():
     return jsonify({"message": "Welcome to the Gemini Chatbot API. Please use the /docs endpoint to see the API documentation."})
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000, debug=True)
\ No newline at end of file
+    # The debugger and reloader are opt-in (FLASK_DEBUG=true); never enable them in production
+    app.run(host="0.0.0.0", port=8000, debug=os.getenv("FLASK_DEBUG", "false").lower() == "true", threaded=True)
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Local intent classification for chat messages.
+
+Routing a message must not cost an LLM call, and small talk ("thanks", "ok",
+"bye") should not cost one either. The `local` classifier works in three
+steps, all in-process and in microseconds:
+
+1. Small-talk patterns that must match the whole message ("thanks!",
+   "ok cool") return a canned reply intent.
+   Mixed small talk ("ok thanks, bye") takes the first of goodbye, thanks,
+   greeting and ack that it contains.
+2. A compiled keyword automaton (one regex with a named group per intent)
+   finds unambiguous requests such as "summarize" or "suggest topics".
+3. Otherwise a small multinomial naive Bayes model over words and word
+   pairs, trained once per process on `TRAINING_EXAMPLES`, scores every
+   intent.
+
+A result whose confidence is below the threshold falls back to `qa`, i.e.
+the LLM answers the message about the article, which is what every
+unrecognized message did before. The `keyword` classifier keeps the old
+substring rules.
+
+Classifiers are registered with `register_classifier` and chosen with
+INTENT_CLASSIFIER, like the LLM backends in `llm_backends.py`.
+"""
+import math
+import re
+from collections import Counter, namedtuple
+
+# Intents answered without the LLM, and their replies
+SMALL_TALK_REPLIES = {
+    "greeting": "Hi there! How can I help you today? You can ask me to summarize the article, suggest new topics, ask a question about it, or write a new article.",
+    "thanks": "You're welcome! Let me know if you'd like a summary, topic ideas, or an answer about the article.",
+    "ack": "Great. You can ask me to summarize the article, suggest new topics, ask a question about it, or write a new article.",
+    "goodbye": "Goodbye! Come back any time you need help with an article.",
+}
+# Intents that are answered by the LLM
+LLM_INTENTS = ("summary", "topic", "qa")
+FALLBACK_INTENT = "qa"
+
+Intent = namedtuple("Intent", ["name", "confidence", "source"])  # source: small_talk, keyword, model or fallback
+
+_SMALL_TALK_PATTERNS = {
+    "greeting": r"(hi|hello|hey|hiya|howdy|good (morning|afternoon|evening))( there| again)?",
+    "thanks": r"(thanks|thank you|thx|ty|cheers|much appreciated)( (so|very) much| a lot| again)?",
+    "ack": r"(ok|okay|k|cool|great|nice|got it|sounds good|alright|perfect|awesome|sure)",
+    "goodbye": r"(bye|goodbye|see you|see ya|that'?s all|that is all|cya)( for now| later)?",
+}
+_SMALL_TALK_RE = {
+    intent: re.compile(rf"^(?:{pattern})(?:[\s,]+(?:{pattern}))*$") for intent, pattern in _SMALL_TALK_PATTERNS.items()
+}
+# Small talk of several kinds ("ok thanks, bye") takes the first of these intents it contains
+_SMALL_TALK_PRIORITY = ("goodbye", "thanks", "greeting", "ack")
+_ANY_SMALL_TALK = "|".join(_SMALL_TALK_PATTERNS.values())
+_MIXED_SMALL_TALK_RE = re.compile(rf"^(?:{_ANY_SMALL_TALK})(?:[\s,]+(?:{_ANY_SMALL_TALK}))*$")
+_SMALL_TALK_PART_RE = {intent: re.compile(rf"\b(?:{pattern})\b") for intent, pattern in _SMALL_TALK_PATTERNS.items()}
+# Request phrasings that name exactly one intent wherever they appear; a bare noun like "summary" is left to the model
+_KEYWORDS = {
+    "summary": r"summar(ise|ize|ising|izing)|sum (it|this|that) up|tl;?dr|recap|gist|key (points|takeaways)|main points|"
+               r"in a nutshell|brief overview|(short|brief|quick|one[- ]line) summary|summary please|"
+               r"(give|write|show|send|get|make|want|need)( me| us)? (a|an|the)( \w+)? (summary|overview)",
+    "topic": r"suggest(ion)?s?( \w+)? (topics?|ideas?)|(topic|article|blog|post|content) ideas?|new topics?|"
+             r"more topics|related topics|what (else )?(should|could|can) (i|we) write( about)?|brainstorm",
+}
+_KEYWORD_RE = re.compile("|".join(rf"(?P<{intent}>\b(?:{pattern})\b)" for intent, pattern in _KEYWORDS.items()))
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_EDGE_PUNCTUATION = " \t\n.!?,:;~-*\"'()[]"
+
+TRAINING_EXAMPLES = {
+    "summary": [
+        "summarize the article", "give me a summary", "can you summarize this", "short summary please",
+        "what is this article about", "what's the article about", "give me an overview", "sum it up",
+        "what are the main points", "boil it down for me", "explain the article briefly", "key takeaways",
+        "recap the article", "tldr", "what is the gist", "shorten this article", "brief overview of the text",
+    ],
+    "topic": [
+        "suggest some topics", "suggest new topics", "give me topic ideas", "what should i write about next",
+        "ideas for new articles", "recommend related topics", "any other topics to cover", "what else could we write",
+        "suggest a follow up article", "more article ideas", "brainstorm topics with me", "topics similar to this one",
+        "what topics could we cover next", "suggest related themes", "propose new blog post ideas",
+    ],
+    "qa": [
+        "who wrote the article", "what does the author say about pricing", "when was this published",
+        "why did the company change its policy", "how many people attended the event", "where is the meetup held",
+        "what topic does the article cover", "does the article mention moderation", "is there a deadline",
+        "what did the study find", "how does the new feature work", "which cities are mentioned",
+        "what are the risks described", "explain the second paragraph", "what is the main argument about funding",
+        "according to the article what happened in march", "can you tell me more about the budget",
+        "what does the author suggest about onboarding", "is the summary section accurate",
+    ],
+    "greeting": ["hi", "hello", "hey there", "good morning", "hello again", "hey bot", "hi how are you"],
+    "thanks": ["thanks", "thank you", "thanks a lot", "thank you so much", "great thanks", "thx", "much appreciated"],
+    "ack": ["ok", "okay", "cool", "got it", "sounds good", "nice", "alright", "perfect"],
+    "goodbye": ["bye", "goodbye", "see you later", "that's all for now", "bye thanks", "see ya"],
+}
+
+def normalize(message):
+    return " ".join(message.lower().split()).strip(_EDGE_PUNCTUATION)
+
+def features(text):
+    """Words and adjacent word pairs of normalized text."""
+    words = _WORD_RE.findall(text)
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+class NaiveBayes:
+    """Multinomial naive Bayes with add-one smoothing over `features`."""
+    def __init__(self, examples):
+        self.intents = sorted(examples)
+        total = sum(len(texts) for texts in examples.values())
+        self.log_priors = {intent: math.log(len(examples[intent]) / total) for intent in self.intents}
+        counts = {intent: Counter(f for text in examples[intent] for f in features(normalize(text))) for intent in self.intents}
+        self.vocabulary = set().union(*counts.values())
+        self.log_likelihoods = {}
+        self.log_unseen = {}
+        for intent in self.intents:
+            denominator = sum(counts[intent].values()) + len(self.vocabulary)
+            self.log_likelihoods[intent] = {f: math.log((n + 1) / denominator) for f, n in counts[intent].items()}
+            self.log_unseen[intent] = math.log(1 / denominator)
+
+    def predict(self, text, intents=None):
+        """Returns (intent, posterior probability) among `intents` (default: all)."""
+        known = [f for f in features(text) if f in self.vocabulary]
+        intents = intents or self.intents
+        scores = {
+            intent: self.log_priors[intent] + sum(self.log_likelihoods[intent].get(f, self.log_unseen[intent]) for f in known)
+            for intent in intents
+        }
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        total = sum(math.exp(score - top) for score in scores.values())
+        return best, 1 / total
+
+# === Classifiers ===
+
+CLASSIFIERS = {}
+
+def register_classifier(name):
+    """Decorator registering a classifier factory under `name`."""
+    def decorator(factory):
+        CLASSIFIERS[name] = factory
+        return factory
+    return decorator
+
+def create_classifier(name, **options):
+    if name not in CLASSIFIERS:
+        raise ValueError(f"Unknown intent classifier '{name}'. Available: {', '.join(sorted(CLASSIFIERS))}")
+    return CLASSIFIERS[name](**options)
+
+@register_classifier("local")
+class LocalIntentClassifier:
+    """Small-talk patterns, then keywords, then naive Bayes; see the module docstring."""
+    def __init__(self, threshold=0.6, examples=None, **_):
+        self.threshold = threshold
+        self.model = NaiveBayes(examples or TRAINING_EXAMPLES)
+
+    def classify(self, message):
+        text = normalize(message)
+        if not text:
+            return Intent(FALLBACK_INTENT, 0.0, "fallback")
+        for intent, pattern in _SMALL_TALK_RE.items():
+            if pattern.match(text):
+                return Intent(intent, 1.0, "small_talk")
+        if _MIXED_SMALL_TALK_RE.match(text):
+            intent = next(i for i in _SMALL_TALK_PRIORITY if _SMALL_TALK_PART_RE[i].search(text))
+            return Intent(intent, 1.0, "small_talk")
+
+        matched = {m.lastgroup for m in _KEYWORD_RE.finditer(text)}
+        if len(matched) == 1:
+            return Intent(matched.pop(), 1.0, "keyword")
+        # Several keyword intents ("summarize it and suggest topics"): let the model pick between them
+        intent, confidence = self.model.predict(text, sorted(matched) if matched else None)
+        if confidence < self.threshold:
+            return Intent(FALLBACK_INTENT, confidence, "fallback")
+        return Intent(intent, confidence, "model")
+
+@register_classifier("keyword")
+class KeywordIntentClassifier:
+    """The original substring rules: any greeting prefix, then "summary"/"summarize", then "topic"/"suggest"."""
+    def __init__(self, **_):
+        pass
+
+    def classify(self, message):
+        msg_lower = message.lower()
+        if re.match(r"^\s*(hi|hello|hey)\b.*", msg_lower):
+            return Intent("greeting", 1.0, "keyword")
+        if "summary" in msg_lower or "summarize" in msg_lower:
+            return Intent("summary", 1.0, "keyword")
+        if "topic" in msg_lower or "suggest" in msg_lower:
+            return Intent("topic", 1.0, "keyword")
+        return Intent(FALLBACK_INTENT, 1.0, "fallback")
@@ -0,0 +1,383 @@
+"""
+Persistent queue for long generations, run by a separate worker pool.
+
+With `"job": true`, `/chat` does not run the final article generation on
+the web worker: it queues the step here and answers with a `job_id` at once.
+`python jobs.py` runs the workers, which stream the article from the model
+and store the reply; clients poll `GET /jobs/{id}` or receive a POST on
+their `callback_url`.
+
+The queue is a SQLite table shared by the API processes and the workers on
+one host, so queued and running jobs survive restarts of either. A worker
+holds a lease on each job it runs and renews it every few seconds; a job
+whose worker died is picked up again once the lease runs out, up to
+JOB_MAX_ATTEMPTS runs. Submitting raises `QueueFull` past JOB_QUEUE_MAX
+queued jobs (HTTP 429). Cancelling drops a queued job, or stops a running
+one at its next chunk.
+
+    python jobs.py                              # JOB_WORKER_CONCURRENCY jobs at once
+    python jobs.py --concurrency 4 --metrics-port 9100
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+import uuid
+from urllib.parse import urlparse
+
+from config import (
+    JOB_DB_PATH, JOB_QUEUE_MAX, JOB_WORKER_CONCURRENCY, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_TTL,
+    JOB_CALLBACK_HOSTS
+)
+from metrics import JOBS, JOB_WAIT, stage
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+CALLBACK_TIMEOUT = 10  # seconds
+
+class QueueFull(Exception):
+    """Raised by `JobQueue.submit` when `max_queued` jobs are already waiting."""
+
+class JobQueue:
+    """Jobs in a SQLite table; safe to share between threads and processes on one host."""
+    def __init__(self, path, max_queued=100, lease=30, max_attempts=3, ttl=86400):
+        self.path = path
+        self.max_queued = max_queued
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Autocommit mode; writes that read first take the write lock with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, prompt_key TEXT NOT NULL, context TEXT NOT NULL, prefix TEXT NOT NULL, "
+            "session_id TEXT, callback_url TEXT, status TEXT NOT NULL, result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, chars INTEGER NOT NULL DEFAULT 0, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, lease_until REAL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at)")
+
+    def submit(self, prompt_key, context_vars, prefix="", session_id=None, callback_url=None):
+        """Queues a generation of `prompt_key` and returns the job (see `view`). Raises QueueFull."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                JOBS.inc(result="rejected")
+                raise QueueFull(f"{queued} jobs are already queued")
+            if self.ttl:
+                conn.execute("DELETE FROM jobs WHERE finished_at < ?", (now - self.ttl,))
+            conn.execute(
+                "INSERT INTO jobs (id, prompt_key, context, prefix, session_id, callback_url, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, prompt_key, json.dumps(context_vars), prefix, session_id, callback_url, now)
+            )
+        JOBS.inc(result="queued")
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """The job as returned by the API, or None if it is unknown or expired."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return view(row) if row else None
+
+    def cancel(self, job_id):
+        """
+        Cancels a job and returns it, or None if it is unknown.
+
+        A queued job is cancelled at once; a running one is flagged and
+        stopped by its worker. Finished jobs are left as they are.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "queued":
+                conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (time.time(), job_id)
+                )
+                JOBS.inc(result="cancelled")
+            elif row["status"] == "running":
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        return self.get(job_id)
+
+    def claim(self):
+        """
+        Takes the oldest runnable job for the calling worker, or returns None.
+
+        Runnable are queued jobs and running jobs whose lease has expired
+        because their worker stopped. The job dict includes `context`.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["status"] == "running":
+                    if row["attempts"] >= self.max_attempts or row["cancel_requested"]:
+                        status = "cancelled" if row["cancel_requested"] else "failed"
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                            (status, None if row["cancel_requested"] else "Worker stopped while running the job", now, row["id"])
+                        )
+                        JOBS.inc(result=status)
+                        continue
+                    JOBS.inc(result="retried")
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, chars = 0, "
+                    "started_at = ?, lease_until = ? WHERE id = ?",
+                    (now, now + self.lease, row["id"])
+                )
+                break
+        job = dict(row)
+        job["attempts"] += 1
+        job["context"] = json.loads(job["context"])
+        if row["status"] == "queued":
+            JOB_WAIT.observe(now - row["created_at"])
+        return job
+
+    def renew(self, job_id, attempt, chars):
+        """Extends a running job's lease and records its progress. Returns True if it should stop."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, chars = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+                (time.time() + self.lease, chars, job_id, attempt)
+            )
+            row = self._conn.execute(
+                "SELECT status, attempts, cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        # Also stop if the job was taken over by another worker after the lease expired
+        return row is None or row["status"] != "running" or row["attempts"] != attempt or bool(row["cancel_requested"])
+
+    def finish(self, job_id, attempt, status, result=None, error=None):
+        """Records the outcome of a run. Returns the job, or None if this run no longer owns it."""
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, chars = COALESCE(?, chars), finished_at = ?, "
+                "lease_until = NULL WHERE id = ? AND status = 'running' AND attempts = ?",
+                (status, result, error, None if result is None else len(result), time.time(), job_id, attempt)
+            ).rowcount
+        if not updated:
+            return None
+        JOBS.inc(result=status)
+        return self.get(job_id)
+
+    def depth(self):
+        """Number of queued jobs."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+class _Transaction:
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._lock.release()
+            raise
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
+
+def view(row):
+    """The public fields of a job row."""
+    job = {
+        "job_id": row["id"],
+        "status": row["status"],
+        "session_id": row["session_id"],
+        "attempts": row["attempts"],
+        "chars": row["chars"],
+        "cancel_requested": bool(row["cancel_requested"]),
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+    }
+    if row["status"] == "succeeded":
+        job["response"] = row["prefix"] + row["result"]
+    if row["error"]:
+        job["error"] = row["error"]
+    return job
+
+def create_job_queue(path=JOB_DB_PATH):
+    return JobQueue(path, max_queued=JOB_QUEUE_MAX, lease=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS, ttl=JOB_TTL)
+
+def validate_callback_url(url, allowed_hosts=JOB_CALLBACK_HOSTS):
+    """Raises ValueError unless `url` is an http(s) URL on a host listed in JOB_CALLBACK_HOSTS."""
+    hosts = {h.strip().lower() for h in allowed_hosts.split(",") if h.strip()}
+    if not hosts:
+        raise ValueError("Job callbacks are disabled. Poll /jobs/{job_id} instead.")
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("callback_url must be an http or https URL.")
+    if "*" not in hosts and parsed.hostname.lower() not in hosts:
+        raise ValueError(f"callback_url host '{parsed.hostname}' is not allowed.")
+
+def notify(url, job):
+    """POSTs the finished job to its callback URL; failures are logged, not retried."""
+    request = urllib.request.Request(
+        url, data=json.dumps(job).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=CALLBACK_TIMEOUT) as response:
+            response.read()
+    except Exception as e:
+        logging.warning(f"Callback for job {job['job_id']} to {url} failed: {e}")
+
+# === Workers ===
+
+class JobWorker:
+    """
+    Runs jobs from `queue` on `concurrency` threads until `stop()`.
+
+    One extra thread renews the leases of running jobs every
+    `heartbeat_interval` seconds and flags the ones to stop.
+    """
+    def __init__(self, queue, concurrency=2, poll_interval=0.5, heartbeat_interval=None):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval or max(0.1, queue.lease / 3)
+        self._running = {}  # job_id -> [attempt, chars]
+        self._stopping = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True) for i in range(self.concurrency)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stops taking jobs and waits for running ones; unfinished jobs are run again after their lease."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_once(self):
+        """Runs the next job, if any. Returns True if there was one."""
+        job = self.queue.claim()
+        if job is None:
+            return False
+        self._run(job)
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if not self.run_once():
+                    self._stop.wait(self.poll_interval)
+            except Exception:
+                logging.exception("Job worker error")
+                self._stop.wait(self.poll_interval)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                running = [(job_id, attempt, chars) for job_id, (attempt, chars) in self._running.items()]
+            for job_id, attempt, chars in running:
+                try:
+                    if self.queue.renew(job_id, attempt, chars):
+                        with self._lock:
+                            self._stopping.add(job_id)
+                except Exception as e:
+                    logging.warning(f"Could not renew the lease of job {job_id}: {e}")
+
+    def _run(self, job):
+        # Imported here so the API processes that only queue jobs never build a model client
+        from llm_scheduler import request_context
+        from llm_service import generate_stream
+
+        job_id, attempt = job["id"], job["attempts"]
+        with self._lock:
+            self._running[job_id] = [attempt, 0]
+        parts = []
+        stream = generate_stream(job["prompt_key"], job["context"])
+        try:
+            # Nobody is waiting on the response, so jobs queue behind interactive calls in the same process
+            with request_context(priority="batch", client="jobs", session=job["session_id"]), \
+                    stage("job", prompt_key=job["prompt_key"], job_id=job_id):
+                for chunk in stream:
+                    parts.append(chunk)
+                    with self._lock:
+                        self._running[job_id][1] += len(chunk)
+                        stop = job_id in self._stopping
+                    if stop:
+                        logging.info(f"Stopping job {job_id}")
+                        result = self.queue.finish(job_id, attempt, "cancelled")
+                        break
+                else:
+                    result = self.queue.finish(job_id, attempt, "succeeded", result="".join(parts).strip())
+        except Exception as e:
+            logging.warning(f"Job {job_id} failed with {type(e).__name__}: {e}")
+            result = self.queue.finish(job_id, attempt, "failed", error=f"Article generation failed: {e}")
+        finally:
+            stream.close()
+            with self._lock:
+                self._running.pop(job_id, None)
+                self._stopping.discard(job_id)
+        if result is not None and job["callback_url"]:
+            notify(job["callback_url"], result)
+
+if __name__ == "__main__":
+    import signal
+    from dotenv import load_dotenv
+    from metrics import JOB_QUEUE_DEPTH, serve_metrics
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Run queued article jobs.")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    parser.add_argument("--db", default=JOB_DB_PATH, help="SQLite file shared with the API (JOB_DB_PATH).")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("JOB_WORKER_METRICS_PORT", "0")),
+                        help="Serve /metrics on this port (0 = off).")
+    args = parser.parse_args()
+
+    queue = create_job_queue(args.db)
+    if args.metrics_port:
+        JOB_QUEUE_DEPTH.set_function(queue.depth, service="jobs")
+        serve_metrics(args.metrics_port)
+    worker = JobWorker(queue, concurrency=args.concurrency).start()
+    logging.info(f"Running jobs from {args.db} with {args.concurrency} workers")
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    worker.stop()
@@ -0,0 +1,40 @@
+import os
+import threading
+
+class ProcessLocal:
+    """
+    Creates a value on first use, once per process.
+
+    Clients built this way are never created at import time, and a worker
+    forked from a preloaded parent (e.g. gunicorn --preload) builds its own
+    instead of sharing sockets or threads that are not fork-safe.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            # A lock held by another thread at fork time would stay locked in the child
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._value = self._factory()
+                    self._pid = pid
+        return self._value
+
+    def set(self, value):
+        """Replaces the value for this process, e.g. with a fake in tests."""
+        with self._lock:
+            self._value = value
+            self._pid = os.getpid()
+
+    def initialized(self):
+        return self._pid == os.getpid()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
@@ -0,0 +1,360 @@
+"""
+LLM backend registry.
+
+A backend is any object with the `generate_content` / `generate_content_async`
+interface of `google.generativeai.GenerativeModel` (including `stream=True`).
+`llm_service` only talks to that interface, so the backend chosen by
+`LLM_BACKEND` can be swapped without touching the callers:
+
+- `gemini`: the real Gemini model.
+- `fake`: a deterministic local stand-in with configurable latency, token-rate
+  streaming and error injection, for capacity tests that must not burn quota.
+
+`ModelPool` keeps one model per system instruction and, where the backend
+registers a context cache, serves long prompt prefixes from cached content.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from metrics import LLM_CONTEXT_CACHES
+from token_budget import estimate_tokens
+
+BACKENDS = {}
+CONTEXT_CACHES = {}
+
+def register_backend(name):
+    """Decorator registering a backend factory under `name`."""
+    def decorator(factory):
+        BACKENDS[name] = factory
+        return factory
+    return decorator
+
+def register_context_cache(name):
+    """
+    Decorator registering a context cache factory for backend `name`.
+
+    The factory is called as `factory(contents, ttl, system_instruction=..., **backend_options)`
+    and returns (model that reads `contents` from the cache, function releasing the cache).
+    """
+    def decorator(factory):
+        CONTEXT_CACHES[name] = factory
+        return factory
+    return decorator
+
+def create_backend(name, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}'. Available: {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[name](**options)
+
+@register_backend("gemini")
+def gemini_backend(model_name="gemini-2.0-flash", api_key=None, system_instruction=None, **_):
+    import google.generativeai as genai
+    if api_key:
+        genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+@register_context_cache("gemini")
+def gemini_context_cache(contents, ttl, model_name="gemini-2.0-flash", api_key=None, system_instruction=None, **_):
+    # Explicit caching needs a model that supports it and a per-model minimum of cached tokens
+    import datetime
+    import google.generativeai as genai
+    from google.generativeai import caching
+    if api_key:
+        genai.configure(api_key=api_key)
+    cached = caching.CachedContent.create(
+        model=model_name,
+        system_instruction=system_instruction,
+        contents=[contents],
+        ttl=datetime.timedelta(seconds=ttl),
+    )
+    return genai.GenerativeModel.from_cached_content(cached_content=cached), cached.delete
+
+# === Fake backend ===
+
+class FakeAPIError(Exception):
+    """Injected failure; `code` is read by llm_resilience.classify_error like a provider error."""
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+class _Usage:
+    def __init__(self, prompt_tokens, output_tokens, cached_tokens=0):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+        self.cached_content_token_count = cached_tokens
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class _AsyncStream:
+    def __init__(self, agen):
+        self._agen = agen
+
+    def __aiter__(self):
+        return self._agen
+
+def parse_latency(spec):
+    """
+    Parses a latency distribution spec into a sampler `fn(rng) -> seconds`.
+
+    Formats: "fixed:0.2", "uniform:0.1,0.5", "normal:mean,stddev",
+    "lognormal:median,sigma" (heavy-tailed, closest to real LLM latency).
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+_WORDS = (
+    "community article readers insight growth content strategy audience engagement idea "
+    "platform writer topic summary analysis trend practical guide example value story"
+).split()
+
+@register_backend("fake")
+class FakeModel:
+    """
+    Deterministic local stand-in for a Gemini model.
+
+    The output text depends only on the prompt, so caching and coalescing
+    behave as they would against the real model. Latency and errors are
+    drawn from a seeded RNG.
+
+    Args:
+        latency (str): Time to first token, see `parse_latency`.
+        tokens_per_second (float): Streaming rate after the first token; 0 returns everything at once.
+        output_tokens (int): Words generated per response, capped by max_output_tokens.
+        error_rate (float): Probability that a call fails.
+        error_codes (str): Comma-separated status codes to pick injected errors from.
+        seed (int): RNG seed for latency and error sampling.
+        system_instruction (str): Counted as prompt tokens, like Gemini does.
+        cached_context (str): Content this model reads from a context cache; replies
+            are the same as for the full prompt, and its tokens are reported as cached.
+    """
+    def __init__(self, latency="fixed:0", tokens_per_second=0, output_tokens=60, error_rate=0.0,
+                 error_codes="429,503", seed=0, model_name="fake", system_instruction=None, cached_context="", **_):
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+        self.cached_context = cached_context
+        self._sample_latency = parse_latency(latency)
+        self.tokens_per_second = float(tokens_per_second)
+        self.output_tokens = int(output_tokens)
+        self.error_rate = float(error_rate)
+        self.error_codes = [int(c) for c in str(error_codes).split(",") if c]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    # --- sampling ---
+
+    def _plan(self, prompt, generation_config):
+        """Decides latency, failure and output for one call."""
+        with self._lock:
+            self.calls += 1
+            latency = self._sample_latency(self._rng)
+            error = None
+            if self.error_rate and self._rng.random() < self.error_rate:
+                code = self._rng.choice(self.error_codes)
+                error = FakeAPIError(code, "Injected failure from the fake LLM backend.")
+        max_tokens = (generation_config or {}).get("max_output_tokens") or self.output_tokens
+        words = self._words(self.cached_context + prompt, min(self.output_tokens, max_tokens))
+        return latency, error, words
+
+    @staticmethod
+    def _words(prompt, count):
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        return [rng.choice(_WORDS) for _ in range(count)]
+
+    def _usage(self, prompt, words):
+        # Roughly four characters per prompt token; a context cache holds the system instruction too
+        cached = (len(self.system_instruction) + len(self.cached_context)) // 4 if self.cached_context else 0
+        total = (len(self.system_instruction) + len(self.cached_context) + len(prompt)) // 4
+        return _Usage(max(1, total), len(words), cached)
+
+    def _chunks(self, words, size=8):
+        for i in range(0, len(words), size):
+            yield " ".join(words[i:i + size]) + (" " if i + size < len(words) else "")
+
+    # --- GenerativeModel interface ---
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **_):
+        latency, error, words = self._plan(prompt, generation_config)
+        time.sleep(latency)
+        if error:
+            raise error
+        if not stream:
+            time.sleep(len(words) / self.tokens_per_second if self.tokens_per_second else 0)
+            return FakeResponse(" ".join(words), self._usage(prompt, words))
+        return self._stream(prompt, words)
+
+    def _stream(self, prompt, words):
+        for chunk in self._chunks(words):
+            if self.tokens_per_second:
+                time.sleep(len(chunk.split()) / self.tokens_per_second)
+            yield FakeResponse(chunk, self._usage(prompt, words))
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **_):
+        latency, error, words = self._plan(prompt, generation_config)
+        await asyncio.sleep(latency)
+        if error:
+            raise error
+        if not stream:
+            await asyncio.sleep(len(words) / self.tokens_per_second if self.tokens_per_second else 0)
+            return FakeResponse(" ".join(words), self._usage(prompt, words))
+        return _AsyncStream(self._stream_async(prompt, words))
+
+    async def _stream_async(self, prompt, words):
+        for chunk in self._chunks(words):
+            if self.tokens_per_second:
+                await asyncio.sleep(len(chunk.split()) / self.tokens_per_second)
+            yield FakeResponse(chunk, self._usage(prompt, words))
+
+@register_context_cache("fake")
+def fake_context_cache(contents, ttl, **options):
+    return FakeModel(cached_context=contents, **options), lambda: None
+
+# === Model pool ===
+
+_Context = namedtuple("_Context", "model release expires")
+
+class ModelPool:
+    """
+    Backend models by system instruction, plus context caches for long prompt prefixes.
+
+    `factory(system_instruction)` builds a model. With a `context_factory`
+    (see `register_context_cache`), a prompt prefix of at least `min_tokens`
+    that is seen `min_uses` times is cached upstream for `ttl` seconds; later
+    prompts with that prefix send only the rest. At most `max_contexts` caches
+    are kept, and the least recently used one is released first.
+    """
+    def __init__(self, factory, context_factory=None, min_tokens=4096, min_uses=2, ttl=600, max_contexts=32,
+                 max_tracked=4096):
+        self._factory = factory
+        self._context_factory = context_factory
+        self.min_tokens = min_tokens
+        self.min_uses = min_uses
+        self.ttl = ttl
+        self.max_contexts = max_contexts
+        self.max_tracked = max_tracked
+        self._models = {}
+        self._contexts = OrderedDict()  # prefix key -> _Context; model is None while creating or after a failure
+        self._uses = OrderedDict()  # prefix key -> uses, for prefixes not cached yet
+        self._lock = threading.Lock()
+
+    def get(self, system_instruction=None):
+        model = self._models.get(system_instruction)
+        if model is None:
+            with self._lock:
+                model = self._models.get(system_instruction)
+                if model is None:
+                    model = self._models[system_instruction] = self._factory(system_instruction)
+        return model
+
+    def _claim(self, system_instruction, prompt, prefix_len):
+        """(cached model or None, key of a context cache this caller should create or None)."""
+        if self._context_factory is None or estimate_tokens(prompt[:prefix_len]) < self.min_tokens:
+            return None, None
+        digest = hashlib.sha256((system_instruction or "").encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(prompt[:prefix_len].encode("utf-8"))
+        key = digest.hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._contexts.get(key)
+            if entry is not None and entry.expires > now:
+                if entry.model is None:
+                    return None, None
+                self._contexts.move_to_end(key)
+                LLM_CONTEXT_CACHES.inc(result="hit")
+                return entry.model, None
+            self._contexts.pop(key, None)
+            uses = self._uses.pop(key, 0) + 1
+            if uses < self.min_uses:
+                self._uses[key] = uses
+                while len(self._uses) > self.max_tracked:
+                    self._uses.popitem(last=False)
+                return None, None
+            # Placeholder, so concurrent callers send the full prompt instead of creating it again
+            self._contexts[key] = _Context(None, None, now + self.ttl)
+        return None, key
+
+    def _create(self, key, system_instruction, contents):
+        try:
+            model, release = self._context_factory(system_instruction, contents, self.ttl)
+        except Exception as e:
+            # The placeholder stays until it expires, so the prefix is not retried on every call
+            logging.warning(f"Context cache creation failed, sending full prompts: {e}")
+            LLM_CONTEXT_CACHES.inc(result="failed")
+            return None
+        LLM_CONTEXT_CACHES.inc(result="created")
+        # Stop using a cache shortly before the provider expires it
+        expires = time.monotonic() + self.ttl - min(60, self.ttl / 10)
+        evicted = []
+        with self._lock:
+            self._contexts[key] = _Context(model, release, expires)
+            self._contexts.move_to_end(key)
+            while len(self._contexts) > self.max_contexts:
+                evicted.append(self._contexts.popitem(last=False)[1])
+        for entry in evicted:
+            LLM_CONTEXT_CACHES.inc(result="evicted")
+            if entry.release is not None:
+                try:
+                    entry.release()
+                except Exception as e:
+                    logging.warning(f"Could not release a context cache: {e}")
+        return model
+
+    def resolve(self, system_instruction, prompt, prefix_len=0):
+        """(model, prompt to send): with a context cache for the first `prefix_len` characters, only the rest."""
+        model, key = self._claim(system_instruction, prompt, prefix_len)
+        if key is not None:
+            model = self._create(key, system_instruction, prompt[:prefix_len])
+        if model is not None:
+            return model, prompt[prefix_len:]
+        return self.get(system_instruction), prompt
+
+    async def resolve_async(self, system_instruction, prompt, prefix_len=0):
+        """Async variant of `resolve`; creating a cache runs in a worker thread."""
+        model, key = self._claim(system_instruction, prompt, prefix_len)
+        if key is not None:
+            model = await asyncio.to_thread(self._create, key, system_instruction, prompt[:prefix_len])
+        if model is not None:
+            return model, prompt[prefix_len:]
+        return self.get(system_instruction), prompt
+
+    def stats(self):
+        with self._lock:
+            cached = sum(1 for entry in self._contexts.values() if entry.model is not None)
+            return {"models": len(self._models), "context_caches": cached}
+
+def create_model_pool(name, options, context_cache=False, **context_options):
+    """A ModelPool of backend `name`; `context_cache` enables context caches where the backend has them."""
+    context_factory = None
+    if context_cache and name in CONTEXT_CACHES:
+        cache_factory = CONTEXT_CACHES[name]
+        context_factory = lambda system_instruction, contents, ttl: cache_factory(
+            contents, ttl, **{**options, "system_instruction": system_instruction}
+        )
+    elif context_cache:
+        logging.warning(f"The '{name}' LLM backend has no context cache; sending full prompts.")
+    return ModelPool(
+        lambda system_instruction: create_backend(name, **{**options, "system_instruction": system_instruction}),
+        context_factory,
+        **context_options,
+    )
@@ -0,0 +1,232 @@
+import abc
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+def make_cache_key(prompt_key, final_prompt, max_output_tokens, model_name, system_instruction=None):
+    """Content-addressed key for one LLM request."""
+    digest = hashlib.sha256()
+    for part in (prompt_key, final_prompt, str(max_output_tokens), model_name, system_instruction or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class ResponseCache(abc.ABC):
+    """Base class for LLM response caches. Tracks hit/miss counters."""
+    # Lookups never leave the process, so async callers make them inline
+    blocking = False
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _expires_at(self):
+        return time.monotonic() + self.ttl if self.ttl else None
+
+    @abc.abstractmethod
+    def _get(self, key):
+        """The cached value for `key`, or None."""
+
+    @abc.abstractmethod
+    def _set(self, key, value):
+        """Stores `value` under `key`."""
+
+class NullCache(ResponseCache):
+    """Cache that never stores anything; used when caching is disabled."""
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value):
+        pass
+
+class MemoryCache(ResponseCache):
+    """In-process LRU cache bounded by total stored bytes, with optional TTL."""
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=None):
+        super().__init__(ttl)
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.current_bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size, self._expires_at())
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"entries": len(self._entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes})
+        return stats
+
+class SQLiteCache(ResponseCache):
+    """On-disk cache that survives restarts. Evicts least recently used rows past `max_bytes`."""
+    # Lookups hit the disk, so async callers make them in a worker thread
+    blocking = True
+    # Hits record their access time in memory; the times are written with the next insert or once this many pile up
+    TOUCH_BATCH = 256
+    # Seconds between re-reading the stored byte total, which other processes sharing the file also change
+    RESYNC_INTERVAL = 60
+    # Rows deleted per statement while evicting
+    EVICT_BATCH = 64
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl=None):
+        super().__init__(ttl)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> accessed_at not yet written
+        # WAL lets readers in other workers proceed during a write; writers wait up to 30s for the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires ON llm_cache (expires_at)")
+        self._conn.commit()
+        self._resync()
+
+    def _expires_at(self):
+        # Wall-clock time, since entries outlive the process
+        return time.time() + self.ttl if self.ttl else None
+
+    def _resync(self):
+        """Reloads the running byte total from the table."""
+        self.current_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        self._synced_at = time.monotonic()
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, size, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, size, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._touched.pop(key, None)
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.current_bytes -= size
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._flush_touched()
+                self._conn.commit()
+            return value
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", [(at, key) for key, at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _set(self, key, value):
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if time.monotonic() - self._synced_at >= self.RESYNC_INTERVAL:
+                self._resync()
+            self._flush_touched()
+            old = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, self._expires_at(), time.time())
+            )
+            self.current_bytes += size - (old[0] if old else 0)
+            if self.current_bytes > self.max_bytes:
+                self._evict(self.current_bytes - self.max_bytes)
+            self._conn.commit()
+
+    def _evict(self, excess):
+        """Deletes expired rows, then least recently used ones, until `excess` bytes are freed."""
+        now = time.time()
+        freed = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).fetchone()[0]
+        if freed:
+            self._conn.execute("DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        while freed < excess:
+            rows = self._conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed_at LIMIT ?", (self.EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            batch = []
+            for key, size in rows:
+                if freed >= excess:
+                    break
+                batch.append((key,))
+                freed += size
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", batch)
+        self.current_bytes -= freed
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            self._resync()
+        stats.update({"entries": entries, "bytes": self.current_bytes, "max_bytes": self.max_bytes, "path": self.path})
+        return stats
+
+def create_cache(backend, max_bytes, ttl=None, path=None):
+    """Builds the cache backend named by `backend` ("memory", "sqlite" or "none")."""
+    if backend == "memory":
+        return MemoryCache(max_bytes=max_bytes, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteCache(path, max_bytes=max_bytes, ttl=ttl)
+    if backend in ("none", "", None):
+        return NullCache()
+    raise ValueError(f"Unknown LLM cache backend: {backend}")
@@ -0,0 +1,259 @@
+"""
+Typed errors and load protection for calls to the LLM provider.
+
+- `classify_error` turns provider exceptions into `LLMError` subclasses that
+  carry the HTTP status an API route should answer with.
+- `TokenBucket` spaces requests out to stay inside the provider quota.
+- `RetryPolicy` retries transient failures with jittered exponential backoff.
+- `CircuitBreaker` fails fast while the provider keeps failing, then lets a
+  single trial call through to probe for recovery.
+"""
+import asyncio
+import random
+import threading
+import time
+
+class LLMError(Exception):
+    """Base class for LLM failures. `status_code` is what an API route should return."""
+    status_code = 502
+    retryable = False
+
+class PromptNotFoundError(LLMError):
+    status_code = 500
+
+class PromptVariableError(LLMError):
+    """A prompt was rendered without a value for one of its placeholders."""
+    status_code = 500
+
+class LLMConfigurationError(LLMError):
+    """The backend cannot be created, e.g. because the API key is missing."""
+    status_code = 500
+
+class PromptTemplateError(LLMConfigurationError):
+    """An entry in prompts.py is invalid; raised when the prompts are compiled at import."""
+
+class LLMRateLimitError(LLMError):
+    """The provider (or our own limiter) rejected the call for exceeding the quota."""
+    status_code = 429
+    retryable = True
+
+class LocalRateLimitError(LLMRateLimitError):
+    """Raised by our own TokenBucket; waiting longer is what it just refused, so it is not retried."""
+    retryable = False
+
+class LLMUnavailableError(LLMError):
+    """Transient provider-side failure (5xx)."""
+    status_code = 503
+    retryable = True
+
+class LLMTimeoutError(LLMError):
+    status_code = 504
+    retryable = True
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without calling the provider while the circuit breaker is open."""
+    retryable = False
+
+def classify_error(error):
+    """Maps an exception raised by the provider client to an LLMError."""
+    if isinstance(error, LLMError):
+        return error
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return LLMTimeoutError(str(error) or "The Gemini API timed out.")
+    code = getattr(error, "code", None)
+    if code == 429:
+        return LLMRateLimitError(str(error))
+    if code in (504, 408):
+        return LLMTimeoutError(str(error))
+    if isinstance(code, int) and code >= 500:
+        return LLMUnavailableError(str(error))
+    return LLMError(str(error))
+
+class TokenBucket:
+    """
+    Client-side rate limiter allowing `rate` calls per second with bursts of `capacity`.
+
+    Callers wait for a token for at most `max_wait` seconds, after which
+    LocalRateLimitError is raised instead of queueing indefinitely.
+    """
+    def __init__(self, rate, capacity=1, max_wait=10.0, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes a token now or reserves the next one. Returns the seconds to wait for it."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if wait > self.max_wait:
+                raise LocalRateLimitError("Local Gemini rate limit exceeded; try again shortly.")
+            self._tokens -= 1
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive retryable failures and rejects
+    calls for `reset_timeout` seconds; then one trial call decides whether it closes again.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def check(self):
+        """Raises CircuitOpenError while open, without claiming the half-open trial call."""
+        with self._lock:
+            if self._state() == "open":
+                raise CircuitOpenError("The Gemini API is unavailable; failing fast until it recovers.")
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half_open" and self._trial_in_flight):
+                raise CircuitOpenError("The Gemini API is unavailable; failing fast until it recovers.")
+            if state == "half_open":
+                self._trial_in_flight = True
+
+    def release_trial(self):
+        """Gives up a claimed trial call that was cancelled before it produced an outcome."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self._trial_in_flight = False
+            if not error.retryable:
+                # The provider answered; the request itself was bad
+                if self._state() == "half_open":
+                    self._opened_at = None
+                    self._failures = 0
+                return
+            self._failures += 1
+            if self._state() == "half_open" or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+class RetryPolicy:
+    """Retries retryable LLMErrors with full-jitter exponential backoff."""
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=8.0, sleep=time.sleep, async_sleep=asyncio.sleep):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn):
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except LLMError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                self._sleep(self.delay(attempt))
+                attempt += 1
+
+    async def call_async(self, coro_fn):
+        attempt = 0
+        while True:
+            try:
+                return await coro_fn()
+            except LLMError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                await self._async_sleep(self.delay(attempt))
+                attempt += 1
+
+class ResilientCaller:
+    """Runs provider calls through the circuit breaker, rate limiter and retry policy."""
+    def __init__(self, limiter=None, breaker=None, retry=None):
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.retry = retry or RetryPolicy()
+
+    def call(self, fn):
+        return self.retry.call(lambda: self._attempt(fn))
+
+    async def call_async(self, coro_fn):
+        return await self.retry.call_async(lambda: self._attempt_async(coro_fn))
+
+    def _attempt(self, fn):
+        # Fail fast before waiting for a rate-limit token; the limiter never trips the breaker
+        self.breaker.check()
+        if self.limiter:
+            self.limiter.acquire()
+        self.breaker.before_call()
+        try:
+            result = fn()
+        except Exception as e:
+            error = classify_error(e)
+            self.breaker.record_failure(error)
+            if error is e:
+                raise
+            raise error from e
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _attempt_async(self, coro_fn):
+        # Fail fast before waiting for a rate-limit token; the limiter never trips the breaker
+        self.breaker.check()
+        if self.limiter:
+            await self.limiter.acquire_async()
+        self.breaker.before_call()
+        try:
+            result = await coro_fn()
+        except Exception as e:
+            error = classify_error(e)
+            self.breaker.record_failure(error)
+            if error is e:
+                raise
+            raise error from e
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        return result
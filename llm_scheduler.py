@@ -0,0 +1,337 @@
+"""
+Priority-aware, per-session fair scheduling of upstream LLM calls.
+
+Every upstream call (not cache hits) takes a slot from the process-wide
+`FairScheduler` first, so interactive chat turns, bulk summary endpoints and
+background work no longer compete first come, first served:
+
+- Priority classes: `interactive`, `batch` and `background`, weighted
+  8 : 1 : 0.25. A call's class comes from the request context (set per
+  endpoint, see ENDPOINT_PRIORITIES), else from the prompt's `"priority"` in
+  prompts.py, else `interactive`.
+- Weighted fair queuing (start-time fair queuing): each session, or each
+  API client for requests without one, is a flow. Flows are served in
+  proportion to their class weight, and a call costs its estimated prompt
+  plus output tokens, so one client looping /summarize gets its share and
+  no more.
+- A global concurrency cap (LLM_MAX_CONCURRENCY per process), of which
+  LLM_RESERVED_INTERACTIVE slots only interactive calls may use.
+- Deadlines: a queued call is dropped with LLMTimeoutError once its caller's
+  deadline (X-Request-Timeout header, else LLM_QUEUE_MAX_WAIT) has passed,
+  rather than being sent upstream for nobody.
+
+Request context is a ContextVar set by `request_context(...)` and the
+`scope_fastapi` / `scope_flask` hooks. It follows asyncio tasks and
+`asyncio.to_thread`; work handed to other thread pools is wrapped with
+`contextvars.copy_context().run`.
+
+Metrics: `llm_queue_depth{priority}`, `llm_queue_wait_seconds{priority}`,
+`llm_queue_dropped_total{priority,reason}` and `llm_inflight`.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+from contextlib import asynccontextmanager, contextmanager
+
+from llm_resilience import LLMTimeoutError
+from metrics import LLM_INFLIGHT, LLM_QUEUE_DEPTH, LLM_QUEUE_DROPPED, LLM_QUEUE_WAIT
+
+PRIORITY_WEIGHTS = {"interactive": 8.0, "batch": 1.0, "background": 0.25}
+DEFAULT_PRIORITY = "interactive"
+
+# Priority of the LLM calls made while serving each route
+ENDPOINT_PRIORITIES = {
+    "/chat": "interactive",
+    "/documents": "interactive",
+    "/article-details": "interactive",
+    "/article-summary": "batch",
+    "/summarize": "batch",
+    "/summarize/batch": "batch",
+}
+
+CLIENT_HEADER = "X-Client-Id"
+TIMEOUT_HEADER = "X-Request-Timeout"  # seconds the caller will wait
+
+RequestInfo = namedtuple("RequestInfo", "priority client session deadline")
+_request = contextvars.ContextVar("llm_request", default=RequestInfo(None, None, None, None))
+
+def current_request():
+    return _request.get()
+
+def _updated(priority=None, client=None, session=None, timeout=None):
+    info = _request.get()
+    return RequestInfo(
+        priority or info.priority,
+        client or info.client,
+        session or info.session,
+        time.monotonic() + timeout if timeout else info.deadline,
+    )
+
+@contextmanager
+def request_context(priority=None, client=None, session=None, timeout=None):
+    """Sets who the LLM calls inside the block are made for; unset fields are inherited."""
+    token = _request.set(_updated(priority, client, session, timeout))
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+def set_request(priority=None, client=None, session=None, timeout=None):
+    """Like `request_context`, for the rest of the current request (e.g. the session once the body is parsed)."""
+    _request.set(_updated(priority, client, session, timeout))
+
+def _header_timeout(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def scope_fastapi(app):
+    """Sets the request context of every request from its route, client and timeout headers."""
+    from fastapi import Request
+
+    @app.middleware("http")
+    async def llm_request_scope(request: Request, call_next):
+        with request_context(
+            priority=ENDPOINT_PRIORITIES.get(request.url.path),
+            client=request.headers.get(CLIENT_HEADER) or (request.client.host if request.client else None),
+            timeout=_header_timeout(request.headers.get(TIMEOUT_HEADER)),
+        ):
+            return await call_next(request)
+
+    return app
+
+def _iterate_in(info, iterable):
+    token = _request.set(info)
+    try:
+        yield from iterable
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+        _request.reset(token)
+
+def scope_flask(app):
+    """Flask variant of `scope_fastapi`; streamed bodies are iterated in the context of their request."""
+    from flask import g, request
+
+    @app.before_request
+    def _enter_llm_request_scope():
+        g._llm_request_token = _request.set(_updated(
+            priority=ENDPOINT_PRIORITIES.get(request.path),
+            client=request.headers.get(CLIENT_HEADER) or request.remote_addr,
+            timeout=_header_timeout(request.headers.get(TIMEOUT_HEADER)),
+        ))
+
+    @app.after_request
+    def _scope_llm_stream(response):
+        # Flask tears the request down before a streamed body is iterated
+        if response.is_streamed:
+            response.response = _iterate_in(_request.get(), response.response)
+        return response
+
+    @app.teardown_request
+    def _exit_llm_request_scope(exc):
+        token = g.pop("_llm_request_token", None)
+        if token is not None:
+            _request.reset(token)
+
+    return app
+
+class _Waiter:
+    __slots__ = ("priority", "flow", "start", "seq", "deadline", "enqueued", "state", "error", "event", "loop", "future")
+
+    def __init__(self, priority, flow, deadline):
+        self.priority = priority
+        self.flow = flow
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.state = "waiting"  # waiting, granted or dropped
+        self.error = None
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif self.loop is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class FairScheduler:
+    """
+    Start-time fair queuing of LLM calls over flows, with a concurrency cap.
+
+    A call of `cost` in a flow of weight w gets the start tag
+    max(virtual time, the flow's last finish tag) and finish tag
+    start + cost / w; queued calls run in start tag order. Calls that are
+    not interactive only run while more than `reserved` slots are free.
+    """
+    def __init__(self, max_concurrency=16, reserved=2, weights=None, max_wait=30.0, max_flows=10000):
+        self.max_concurrency = max_concurrency
+        self.reserved = min(reserved, max_concurrency - 1)
+        self.weights = dict(weights or PRIORITY_WEIGHTS)
+        self.max_wait = max_wait
+        self.max_flows = max_flows
+        self.running = 0
+        self._virtual_time = 0.0
+        self._finish_tags = {}  # flow -> last finish tag
+        self._queues = {priority: [] for priority in self.weights}  # priority -> heap of (start, seq, waiter)
+        self._waiting = dict.fromkeys(self.weights, 0)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        for priority in self.weights:
+            LLM_QUEUE_DEPTH.set_function(lambda p=priority: self._waiting[p], priority=priority)
+        LLM_INFLIGHT.set_function(lambda: self.running)
+
+    def _classify(self, prompt_priority):
+        info = _request.get()
+        priority = info.priority or prompt_priority or DEFAULT_PRIORITY
+        if priority not in self.weights:
+            priority = DEFAULT_PRIORITY
+        flow = (priority, info.session or info.client or "anonymous")
+        deadline = info.deadline
+        if self.max_wait:
+            deadline = min(deadline, time.monotonic() + self.max_wait) if deadline else time.monotonic() + self.max_wait
+        return priority, flow, deadline
+
+    def _enqueue(self, waiter, cost):
+        """Queues `waiter` and dispatches. Must hold the lock."""
+        start = max(self._virtual_time, self._finish_tags.get(waiter.flow, 0.0))
+        self._finish_tags[waiter.flow] = start + max(cost, 1) / self.weights[waiter.priority]
+        waiter.start = start
+        waiter.seq = next(self._seq)
+        heapq.heappush(self._queues[waiter.priority], (start, waiter.seq, waiter))
+        self._waiting[waiter.priority] += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grants free slots to queued calls in start tag order. Must hold the lock."""
+        now = time.monotonic()
+        while self.running < self.max_concurrency:
+            best = None
+            for priority, queue in self._queues.items():
+                while queue:
+                    head = queue[0][2]
+                    if head.state == "waiting" and not (head.deadline and head.deadline <= now):
+                        break
+                    heapq.heappop(queue)
+                    if head.state == "waiting":
+                        self._drop(head, "deadline")
+                if not queue:
+                    continue
+                if priority != "interactive" and self.running >= self.max_concurrency - self.reserved:
+                    continue
+                if best is None or queue[0][:2] < best[:2]:
+                    best = queue[0]
+            if best is None:
+                return
+            waiter = heapq.heappop(self._queues[best[2].priority])[2]
+            self._waiting[waiter.priority] -= 1
+            waiter.state = "granted"
+            self.running += 1
+            self._virtual_time = max(self._virtual_time, waiter.start)
+            LLM_QUEUE_WAIT.observe(now - waiter.enqueued, priority=waiter.priority)
+            waiter.wake()
+        if len(self._finish_tags) > self.max_flows:
+            # Flows whose last call finished in virtual time have no advantage left to remember
+            self._finish_tags = {f: t for f, t in self._finish_tags.items() if t > self._virtual_time}
+
+    def _drop(self, waiter, reason):
+        self._waiting[waiter.priority] -= 1
+        waiter.state = "dropped"
+        waiter.error = LLMTimeoutError("The request's deadline passed while it was waiting for the model.")
+        LLM_QUEUE_DROPPED.inc(priority=waiter.priority, reason=reason)
+        waiter.wake()
+
+    def _abandon(self, waiter, reason):
+        """The caller stopped waiting. Returns True if it holds a slot it must release."""
+        with self._lock:
+            if waiter.state == "granted":
+                return True
+            if waiter.state == "waiting":
+                self._drop(waiter, reason)
+            return False
+
+    def _release(self):
+        with self._lock:
+            self.running -= 1
+            self._dispatch()
+
+    def _raise_if_dropped(self, waiter):
+        if waiter.state == "dropped":
+            raise waiter.error
+
+    @contextmanager
+    def slot(self, prompt_priority=None, cost=1):
+        """Holds one of the `max_concurrency` slots for the duration of the block."""
+        waiter = _Waiter(*self._classify(prompt_priority))
+        waiter.event = threading.Event()
+        with self._lock:
+            self._enqueue(waiter, cost)
+        if waiter.state == "waiting":
+            timeout = waiter.deadline - time.monotonic() if waiter.deadline else None
+            if not waiter.event.wait(timeout) and self._abandon(waiter, "deadline"):
+                self._release()
+                raise LLMTimeoutError("The request's deadline passed while it was waiting for the model.")
+        self._raise_if_dropped(waiter)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot_async(self, prompt_priority=None, cost=1):
+        """Async variant of `slot`; waiting does not block the event loop."""
+        waiter = _Waiter(*self._classify(prompt_priority))
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        with self._lock:
+            self._enqueue(waiter, cost)
+        if waiter.state == "waiting":
+            timeout = waiter.deadline - time.monotonic() if waiter.deadline else None
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter, "deadline"):
+                    self._release()
+                raise LLMTimeoutError("The request's deadline passed while it was waiting for the model.")
+            except asyncio.CancelledError:
+                # The caller went away (e.g. the client disconnected)
+                if self._abandon(waiter, "cancelled"):
+                    self._release()
+                raise
+        self._raise_if_dropped(waiter)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {"running": self.running, "waiting": dict(self._waiting), "flows": len(self._finish_tags)}
+
+class NullScheduler:
+    """Lets every call through at once; used when scheduling is disabled."""
+    @contextmanager
+    def slot(self, prompt_priority=None, cost=1):
+        yield
+
+    @asynccontextmanager
+    async def slot_async(self, prompt_priority=None, cost=1):
+        yield
+
+    def stats(self):
+        return {}
+
+def create_scheduler(enabled=True, max_concurrency=16, reserved=2, max_wait=30.0):
+    if not enabled:
+        return NullScheduler()
+    return FairScheduler(max_concurrency=max_concurrency, reserved=reserved, max_wait=max_wait)
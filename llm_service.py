@@ -1,5 +1,293 @@
-from config import model
-from prompts import PROMPTS
+import asyncio
+import os
+import time
+
+from config import (
+    LLM_BACKEND, GEMINI_MODEL, FAKE_LLM_OPTIONS, LLM_TIMEOUT,
+    GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_MIN_TOKENS, GEMINI_CONTEXT_CACHE_MIN_USES,
+    GEMINI_CONTEXT_CACHE_TTL, GEMINI_CONTEXT_CACHE_MAX,
+    LLM_CACHE_BACKEND, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES, LLM_CACHE_PATH,
+    GEMINI_RPM, GEMINI_BURST, LLM_RATE_LIMIT_MAX_WAIT,
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET,
+    LLM_SCHEDULER_ENABLED, LLM_MAX_CONCURRENCY, LLM_RESERVED_INTERACTIVE, LLM_QUEUE_MAX_WAIT
+)
+from lazy import ProcessLocal
+from metrics import LLM_CACHE_LOOKUPS, LLM_LATENCY, LLM_TIME_TO_FIRST_CHUNK, PROMPT_COMPACTIONS, record_usage, stage
+from llm_backends import ModelPool, create_model_pool
+from llm_cache import create_cache, make_cache_key
+from llm_scheduler import create_scheduler
+from llm_resilience import (
+    CircuitBreaker, LLMConfigurationError, LLMError, LLMTimeoutError, PromptNotFoundError,
+    ResilientCaller, RetryPolicy, TokenBucket
+)
+from prompt_registry import PROMPT_REGISTRY
+from singleflight import SingleFlight, AsyncSingleFlight
+from token_budget import compact, estimate_tokens, plan
+
+def _create_models():
+    if LLM_BACKEND == "gemini":
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise LLMConfigurationError("GOOGLE_API_KEY not found in environment variables.")
+        options = {"model_name": GEMINI_MODEL, "api_key": api_key}
+        print("Gemini API configured successfully.")
+    else:
+        options = FAKE_LLM_OPTIONS
+        print(f"Using '{LLM_BACKEND}' LLM backend.")
+    # One model per system instruction; long article prefixes can be served from context caches
+    return create_model_pool(
+        LLM_BACKEND, options, context_cache=GEMINI_CONTEXT_CACHE, min_tokens=GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+        min_uses=GEMINI_CONTEXT_CACHE_MIN_USES, ttl=GEMINI_CONTEXT_CACHE_TTL, max_contexts=GEMINI_CONTEXT_CACHE_MAX
+    )
+
+def _create_upstream():
+    # Rate limiting, retries and circuit breaking for every upstream Gemini call
+    return ResilientCaller(
+        limiter=TokenBucket(GEMINI_RPM / 60, capacity=GEMINI_BURST, max_wait=LLM_RATE_LIMIT_MAX_WAIT) if GEMINI_RPM else None,
+        breaker=CircuitBreaker(failure_threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET),
+        retry=RetryPolicy(max_retries=LLM_MAX_RETRIES, base_delay=LLM_RETRY_BASE_DELAY, max_delay=LLM_RETRY_MAX_DELAY)
+    )
+
+# Everything below is created on first use, once per process
+_models = ProcessLocal(_create_models)
+_upstream = ProcessLocal(_create_upstream)
+# Priority classes, per-session fair queuing and the concurrency cap for upstream calls
+_scheduler = ProcessLocal(lambda: create_scheduler(
+    LLM_SCHEDULER_ENABLED, max_concurrency=LLM_MAX_CONCURRENCY, reserved=LLM_RESERVED_INTERACTIVE, max_wait=LLM_QUEUE_MAX_WAIT
+))
+_response_cache = ProcessLocal(
+    lambda: create_cache(LLM_CACHE_BACKEND, LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL or None, path=LLM_CACHE_PATH)
+)
+# Identical requests that are already in flight share one upstream call
+_inflight = ProcessLocal(SingleFlight)
+_inflight_async = ProcessLocal(AsyncSingleFlight)
+
+def get_model(system_instruction=None):
+    """The LLM backend for this process and `system_instruction`, created on first use."""
+    return _models.get().get(system_instruction)
+
+def set_model(model):
+    """Replaces the LLM backend for this process, e.g. with a fake model in tests; it serves every system instruction."""
+    _models.set(ModelPool(lambda system_instruction: model))
+
+def model_stats():
+    """Pooled models and live context caches of this process."""
+    return _models.get().stats()
+
+def cache_stats():
+    """Returns hit/miss counters and size information for the response cache."""
+    stats = _response_cache.get().stats()
+    stats["coalesced"] = _inflight.get().coalesced + _inflight_async.get().coalesced
+    return stats
+
+def _cache_key(prompt_key, final_prompt, max_output_tokens):
+    """Returns the cache key for a request, or None if `prompt_key` opts out of caching."""
+    prompt = PROMPT_REGISTRY[prompt_key]
+    if not prompt.cache:
+        return None
+    return make_cache_key(
+        prompt_key, final_prompt, max_output_tokens, getattr(get_model(), "model_name", ""), prompt.system_instruction
+    )
+
+def _cache_get(prompt_key, cache_key):
+    cached = _response_cache.get().get(cache_key)
+    LLM_CACHE_LOOKUPS.inc(prompt_key=prompt_key, result="miss" if cached is None else "hit")
+    return cached
+
+async def _cache_get_async(prompt_key, cache_key):
+    """`_cache_get` for the event loop; lookups in a disk-backed cache run in a worker thread."""
+    if _response_cache.get().blocking:
+        return await asyncio.to_thread(_cache_get, prompt_key, cache_key)
+    return _cache_get(prompt_key, cache_key)
+
+async def _cache_set_async(cache_key, text):
+    cache = _response_cache.get()
+    if cache.blocking:
+        await asyncio.to_thread(cache.set, cache_key, text)
+    else:
+        cache.set(cache_key, text)
+
+def _observe(prompt_key, result, start):
+    LLM_LATENCY.observe(time.perf_counter() - start, prompt_key=prompt_key, result=result)
+
+def _summarize_chunks(chunks):
+    """Map step of the `map_reduce` budget strategy, shared with the hierarchical summarizer."""
+    # Imported here because summarizer builds on this module
+    from summarizer import summarize_chunks
+    return summarize_chunks(chunks)
+
+def _fit_budget(prompt_key, context_vars):
+    """Returns `context_vars` with the budgeted field compacted if the prompt exceeds its input budget."""
+    over = plan(PROMPT_REGISTRY[prompt_key], context_vars)
+    return context_vars if over is None else _compact(prompt_key, context_vars, over)
+
+def _compact(prompt_key, context_vars, over):
+    """Compacts the field named by `over`, a `plan` result; may call the LLM for the `map_reduce` strategy."""
+    field, field_tokens, budget = over
+    strategy = budget.get("strategy", "extract")
+    with stage("prompt_compaction", prompt_key=prompt_key, strategy=strategy):
+        query = context_vars.get(budget["query_field"]) if budget.get("query_field") else None
+        text = compact(context_vars[field], field_tokens, budget, query=query, map_fn=_summarize_chunks)
+    PROMPT_COMPACTIONS.inc(prompt_key=prompt_key, strategy=strategy)
+    return {**context_vars, field: text}
+
+def _build_request(prompt_key, context_vars=None, max_tok=None):
+    """
+    Renders the compiled prompt for `prompt_key` and resolves its output token limit.
+
+    Inputs over the prompt's token budget are compacted first, see `token_budget`.
+
+    Returns:
+        tuple: (final_prompt, max_output_tokens, prefix_len), where the first
+        `prefix_len` characters may be served from a context cache
+    """
+    PROMPT_REGISTRY[prompt_key].check(context_vars)
+    return _render(prompt_key, _fit_budget(prompt_key, context_vars), max_tok)
+
+async def _build_request_async(prompt_key, context_vars=None, max_tok=None):
+    """Async variant of `_build_request`; compaction runs in a worker thread to keep the event loop free."""
+    prompt = PROMPT_REGISTRY[prompt_key]
+    prompt.check(context_vars)
+    over = plan(prompt, context_vars)
+    if over is not None:
+        context_vars = await asyncio.to_thread(_compact, prompt_key, context_vars, over)
+    return _render(prompt_key, context_vars, max_tok)
+
+def _render(prompt_key, context_vars, max_tok):
+    """The `_build_request` tuple for `context_vars` that already fit the budget."""
+    prompt = PROMPT_REGISTRY[prompt_key]
+    with stage("prompt_format", prompt_key=prompt_key):
+        final_prompt, prefix_len = prompt.split(context_vars)
+
+    max_output_tokens = max_tok if max_tok is not None else prompt.max_tokens
+    return final_prompt, max_output_tokens, prefix_len
+
+def _response_text(response):
+    try:
+        return response.text.strip()
+    except ValueError as e:
+        # Raised when the response has no text parts, e.g. blocked by safety filters
+        raise LLMError(f"The Gemini API returned no text: {e}") from e
+
+def scheduler_stats():
+    """Running and queued upstream calls of the scheduler, see llm_scheduler.py."""
+    return _scheduler.get().stats()
+
+def _slot(prompt_key, final_prompt, max_output_tokens):
+    # Calls are weighed by their estimated size, so long generations take proportionally more turns
+    return _scheduler.get().slot(PROMPT_REGISTRY[prompt_key].priority, estimate_tokens(final_prompt) + max_output_tokens)
+
+def _slot_async(prompt_key, final_prompt, max_output_tokens):
+    return _scheduler.get().slot_async(PROMPT_REGISTRY[prompt_key].priority, estimate_tokens(final_prompt) + max_output_tokens)
+
+def _resolve(prompt_key, final_prompt, prefix_len):
+    """(model, contents): the pooled model for the prompt's system instruction, or a context cache and the rest of the prompt."""
+    return _models.get().resolve(PROMPT_REGISTRY[prompt_key].system_instruction, final_prompt, prefix_len)
+
+def _resolve_async(prompt_key, final_prompt, prefix_len):
+    return _models.get().resolve_async(PROMPT_REGISTRY[prompt_key].system_instruction, final_prompt, prefix_len)
+
+def _generate(prompt_key, final_prompt, max_output_tokens, cache_key=None, prefix_len=0):
+    with _slot(prompt_key, final_prompt, max_output_tokens):
+        model, contents = _resolve(prompt_key, final_prompt, prefix_len)
+        with stage("llm_call", prompt_key=prompt_key):
+            response = _upstream.get().call(lambda: model.generate_content(
+                contents,
+                generation_config={"max_output_tokens": max_output_tokens}
+            ))
+    record_usage(prompt_key, getattr(response, "usage_metadata", None))
+    text = _response_text(response)
+    if cache_key:
+        _response_cache.get().set(cache_key, text)
+    return text
+
+async def _generate_async(prompt_key, final_prompt, max_output_tokens, cache_key=None, timeout=LLM_TIMEOUT, prefix_len=0):
+    async def attempt():
+        try:
+            return await asyncio.wait_for(
+                model.generate_content_async(
+                    contents,
+                    generation_config={"max_output_tokens": max_output_tokens}
+                ),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"The Gemini API did not respond within {timeout} seconds.")
+
+    async with _slot_async(prompt_key, final_prompt, max_output_tokens):
+        model, contents = await _resolve_async(prompt_key, final_prompt, prefix_len)
+        with stage("llm_call", prompt_key=prompt_key):
+            response = await _upstream.get().call_async(attempt)
+    record_usage(prompt_key, getattr(response, "usage_metadata", None))
+    text = _response_text(response)
+    if cache_key:
+        await _cache_set_async(cache_key, text)
+    return text
+
+def generate(prompt_key, context_vars=None, max_tok=None):
+    """
+    Generates text for a structured prompt, raising on failure.
+
+    Same arguments as `call_gemini`. Raises an `LLMError` subclass whose
+    `status_code` tells API routes how to report the failure.
+    """
+    start = time.perf_counter()
+    try:
+        final_prompt, max_output_tokens, prefix_len = _build_request(prompt_key, context_vars, max_tok)
+
+        cache_key = _cache_key(prompt_key, final_prompt, max_output_tokens)
+        if not cache_key:
+            text = _generate(prompt_key, final_prompt, max_output_tokens, prefix_len=prefix_len)
+        else:
+            cached = _cache_get(prompt_key, cache_key)
+            if cached is not None:
+                _observe(prompt_key, "cache_hit", start)
+                return cached
+            # Concurrent callers with the same request wait on the first one's result (or error)
+            text = _inflight.get().do(
+                cache_key, lambda: _generate(prompt_key, final_prompt, max_output_tokens, cache_key, prefix_len)
+            )
+    except Exception:
+        _observe(prompt_key, "error", start)
+        raise
+    _observe(prompt_key, "ok", start)
+    return text
+
+async def generate_async(prompt_key, context_vars=None, max_tok=None, timeout=LLM_TIMEOUT):
+    """Async variant of `generate`. `timeout` applies to each upstream attempt."""
+    start = time.perf_counter()
+    try:
+        final_prompt, max_output_tokens, prefix_len = await _build_request_async(prompt_key, context_vars, max_tok)
+
+        cache_key = _cache_key(prompt_key, final_prompt, max_output_tokens)
+        if not cache_key:
+            text = await _generate_async(prompt_key, final_prompt, max_output_tokens, timeout=timeout, prefix_len=prefix_len)
+        else:
+            cached = await _cache_get_async(prompt_key, cache_key)
+            if cached is not None:
+                _observe(prompt_key, "cache_hit", start)
+                return cached
+            # Concurrent callers with the same request wait on the first one's result (or error)
+            text = await _inflight_async.get().do(
+                cache_key, lambda: _generate_async(prompt_key, final_prompt, max_output_tokens, cache_key, timeout, prefix_len)
+            )
+    except Exception:
+        _observe(prompt_key, "error", start)
+        raise
+    _observe(prompt_key, "ok", start)
+    return text
+
+ERROR_PREFIX = "⚠️"
+
+def _error_message(error):
+    if isinstance(error, PromptNotFoundError):
+        return f"{ERROR_PREFIX} Error: {error}"
+    return f"{ERROR_PREFIX} An error occurred with the Gemini API: {error}"
+
+def is_error_reply(text):
+    """Whether `text` is an error message from `call_gemini` / `stream_gemini` rather than model output."""
+    return text.startswith(ERROR_PREFIX)
 
 def call_gemini(prompt_key, context_vars=None, max_tok=None):
     """
@@ -14,24 +302,134 @@ def call_gemini(prompt_key, context_vars=None, max_tok=None):
         str: The generated text from the model or an error message.
     """
     try:
-        if prompt_key not in PROMPTS:
-            return f"⚠️ Error: Prompt key '{prompt_key}' not found."
+        return generate(prompt_key, context_vars, max_tok)
+    except Exception as e:
+        return _error_message(e)
 
-        prompt_config = PROMPTS[prompt_key]
-        prompt_template = prompt_config["prompt"]
-        
-        # Format the prompt with context variables if provided
-        final_prompt = prompt_template.format(**context_vars) if context_vars else prompt_template
+async def call_gemini_async(prompt_key, context_vars=None, max_tok=None, timeout=LLM_TIMEOUT):
+    """
+    Non-blocking variant of `call_gemini` for use inside an asyncio event loop.
 
-        # Determine max tokens
-        max_output_tokens = max_tok if max_tok is not None else prompt_config["max_tokens"]
+    Args:
+        prompt_key (str): The key for the desired prompt in the PROMPTS dictionary.
+        context_vars (dict, optional): Variables to format the prompt string. Defaults to None.
+        max_tok (int, optional): Overrides the default max_output_tokens. Defaults to None.
+        timeout (float, optional): Seconds to wait for the model before giving up.
+            Defaults to LLM_TIMEOUT; None waits indefinitely.
 
-        # Generate content
-        response = model.generate_content(
-            final_prompt,
-            generation_config={"max_output_tokens": max_output_tokens}
-        )
-        return response.text.strip()
+    Returns:
+        str: The generated text from the model or an error message.
+    """
+    try:
+        return await generate_async(prompt_key, context_vars, max_tok, timeout)
+    except Exception as e:
+        return _error_message(e)
+
+def stream_gemini(prompt_key, context_vars=None, max_tok=None):
+    """
+    Streaming variant of `call_gemini`.
+
+    Yields text chunks as the model produces them, so the first words can be
+    shown before generation finishes. Cached responses are yielded as one chunk,
+    and errors are yielded as a final error-message chunk. Retries only cover
+    opening the stream, never a stream that has already produced text.
+    """
+    try:
+        yield from generate_stream(prompt_key, context_vars, max_tok)
+    except Exception as e:
+        yield _error_message(e)
+
+def generate_stream(prompt_key, context_vars=None, max_tok=None):
+    """
+    Streaming variant of `generate`: yields text chunks, raising on failure.
+
+    Closing the generator early stops reading the model's response.
+    """
+    start = time.perf_counter()
+    try:
+        final_prompt, max_output_tokens, prefix_len = _build_request(prompt_key, context_vars, max_tok)
+
+        cache_key = _cache_key(prompt_key, final_prompt, max_output_tokens)
+        if cache_key:
+            cached = _cache_get(prompt_key, cache_key)
+            if cached is not None:
+                _observe(prompt_key, "cache_hit", start)
+                yield cached
+                return
+
+        # The slot is held until the stream ends or is closed
+        with _slot(prompt_key, final_prompt, max_output_tokens):
+            model, contents = _resolve(prompt_key, final_prompt, prefix_len)
+            with stage("llm_call", prompt_key=prompt_key):
+                response = _upstream.get().call(lambda: model.generate_content(
+                    contents,
+                    generation_config={"max_output_tokens": max_output_tokens},
+                    stream=True
+                ))
+            parts = []
+            chunk = None
+            for chunk in response:
+                if not parts:
+                    LLM_TIME_TO_FIRST_CHUNK.observe(time.perf_counter() - start, prompt_key=prompt_key)
+                parts.append(chunk.text)
+                yield chunk.text
+        # Every chunk carries the running usage totals; the last one has the final counts
+        record_usage(prompt_key, getattr(chunk, "usage_metadata", None))
+        if cache_key:
+            _response_cache.get().set(cache_key, "".join(parts).strip())
+        _observe(prompt_key, "ok", start)
+
+    except Exception:
+        _observe(prompt_key, "error", start)
+        raise
+
+async def stream_gemini_async(prompt_key, context_vars=None, max_tok=None, timeout=LLM_TIMEOUT):
+    """
+    Async streaming variant of `call_gemini`. See `stream_gemini`.
+
+    `timeout` bounds the wait for the stream to start, not the whole generation.
+    """
+    start = time.perf_counter()
+    try:
+        final_prompt, max_output_tokens, prefix_len = await _build_request_async(prompt_key, context_vars, max_tok)
+
+        cache_key = _cache_key(prompt_key, final_prompt, max_output_tokens)
+        if cache_key:
+            cached = await _cache_get_async(prompt_key, cache_key)
+            if cached is not None:
+                _observe(prompt_key, "cache_hit", start)
+                yield cached
+                return
+
+        async def attempt():
+            try:
+                return await asyncio.wait_for(
+                    model.generate_content_async(
+                        contents,
+                        generation_config={"max_output_tokens": max_output_tokens},
+                        stream=True
+                    ),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"The Gemini API did not respond within {timeout} seconds.")
+
+        async with _slot_async(prompt_key, final_prompt, max_output_tokens):
+            model, contents = await _resolve_async(prompt_key, final_prompt, prefix_len)
+            with stage("llm_call", prompt_key=prompt_key):
+                response = await _upstream.get().call_async(attempt)
+            parts = []
+            chunk = None
+            async for chunk in response:
+                if not parts:
+                    LLM_TIME_TO_FIRST_CHUNK.observe(time.perf_counter() - start, prompt_key=prompt_key)
+                parts.append(chunk.text)
+                yield chunk.text
+        record_usage(prompt_key, getattr(chunk, "usage_metadata", None))
+        if cache_key:
+            await _cache_set_async(cache_key, "".join(parts).strip())
+        _observe(prompt_key, "ok", start)
 
     except Exception as e:
-        return f"⚠️ An error occurred with the Gemini API: {e}"
\ No newline at end of file
+        _observe(prompt_key, "error", start)
+        yield _error_message(e)
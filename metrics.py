@@ -0,0 +1,327 @@
+"""
+In-process metrics in the Prometheus text format, plus optional tracing.
+
+Every service exposes `REGISTRY.render()` on `/metrics`. Metrics live in
+memory per process; with several workers, scrape each one (or aggregate in
+Prometheus). `REGISTRY.get_sample_value` reads a single sample, which is all
+a test needs to check what was recorded.
+
+`span(name, **attributes)` opens an OpenTelemetry span when
+`opentelemetry-api` is installed and TRACING_ENABLED is not "false";
+otherwise it does nothing. Spans go wherever the configured TracerProvider
+sends them, e.g. the SDK's InMemorySpanExporter in tests.
+
+`stage(name)` times one step of the request pipeline (intent routing,
+document lookup, prompt formatting, the LLM call) into `pipeline_stage_seconds`
+and wraps it in a span.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in labels.items()) + "}" if labels else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered.")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def get_sample_value(self, name, labels=None):
+        """Value of one sample, e.g. ("llm_cache_lookups_total", {"prompt_key": "summary", "result": "hit"}), or None."""
+        wanted = {k: str(v) for k, v in (labels or {}).items()}
+        for metric in list(self._metrics.values()):
+            if not name.startswith(metric.name):
+                continue
+            for sample_name, sample_labels, value in metric.samples():
+                if sample_name == name and sample_labels == wanted:
+                    return value
+        return None
+
+REGISTRY = Registry()
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _labels(self, key, **extra):
+        return {**dict(zip(self.labelnames, key)), **extra}
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}_total", self._labels(key), value
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        """Reads the value from `fn()` at scrape time, e.g. the size of a store."""
+        self._functions[self._key(labels)] = fn
+
+    def samples(self):
+        values = dict(self._values)
+        for key, fn in list(self._functions.items()):
+            try:
+                values[key] = fn()
+            except Exception:
+                # A backend that cannot be reached right now must not break the whole scrape
+                continue
+        for key, value in sorted(values.items()):
+            yield self.name, self._labels(key), value
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: ([*counts[0]], counts[1], counts[2]) for key, counts in self._values.items()}
+        for key, (buckets, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                yield f"{self.name}_bucket", self._labels(key, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", self._labels(key), total
+            yield f"{self.name}_count", self._labels(key), count
+
+# === Metrics shared by the services ===
+
+LLM_LATENCY = Histogram("llm_request_seconds", "Time to a complete LLM reply by prompt and result (ok, cache_hit, error).", ["prompt_key", "result"])
+LLM_TIME_TO_FIRST_CHUNK = Histogram("llm_time_to_first_chunk_seconds", "Time to the first streamed chunk.", ["prompt_key"])
+LLM_INPUT_TOKENS = Histogram("llm_input_tokens", "Prompt tokens per upstream call (usage_metadata).", ["prompt_key"], buckets=TOKEN_BUCKETS)
+LLM_OUTPUT_TOKENS = Histogram("llm_output_tokens", "Output tokens per upstream call (usage_metadata).", ["prompt_key"], buckets=TOKEN_BUCKETS)
+LLM_CACHED_INPUT_TOKENS = Histogram("llm_cached_input_tokens", "Prompt tokens served from a Gemini context cache per upstream call.", ["prompt_key"], buckets=TOKEN_BUCKETS)
+LLM_CONTEXT_CACHES = Counter("llm_context_caches", "Gemini context cache use by result (hit, created, failed, evicted).", ["result"])
+LLM_CACHE_LOOKUPS = Counter("llm_cache_lookups", "Response cache lookups by prompt and result (hit, miss).", ["prompt_key", "result"])
+PROMPT_COMPACTIONS = Counter("prompt_compactions", "Prompts compacted to fit their input token budget.", ["prompt_key", "strategy"])
+SUMMARY_CHUNKS = Counter("summary_chunks", "Chunks of hierarchical summaries by result (cached, generated).", ["result"])
+INTENT_ROUTES = Counter("intent_routes", "Chat messages by detected intent and how it was decided.", ["intent", "source"])
+SPECULATIONS = Counter("speculations", "Article writer speculations by prompt and outcome (hit, miss, cancelled, wasted).", ["prompt_key", "result"])
+SPECULATION_WASTED_TOKENS = Counter("speculation_wasted_tokens", "Estimated prompt and output tokens of unused speculations.", ["prompt_key"])
+SEMANTIC_CACHE_LOOKUPS = Counter("semantic_cache_lookups", "question_answering lookups in the semantic answer cache by result (hit, miss).", ["result"])
+SEMANTIC_CACHE_SIMILARITY = Histogram(
+    "semantic_cache_similarity", "Similarity of the closest cached question per lookup.",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99, 1.0)
+)
+SEMANTIC_CACHE_AUDITS = Counter("semantic_cache_audits", "Sampled cache hits answered again, by result (agree, disagree = false hit).", ["result"])
+JOBS = Counter("jobs", "Article jobs by outcome (queued, rejected, succeeded, failed, cancelled, retried).", ["result"])
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Jobs waiting for a worker.", ["service"])
+JOB_WAIT = Histogram("job_wait_seconds", "Time from submitting a job to a worker starting it.")
+LLM_QUEUE_DEPTH = Gauge("llm_queue_depth", "LLM calls waiting for a scheduler slot, by priority class.", ["priority"])
+LLM_QUEUE_WAIT = Histogram("llm_queue_wait_seconds", "Time LLM calls waited for a scheduler slot, by priority class.", ["priority"])
+LLM_QUEUE_DROPPED = Counter("llm_queue_dropped", "Queued LLM calls dropped before reaching the model, by priority and reason (deadline, cancelled).", ["priority", "reason"])
+LLM_INFLIGHT = Gauge("llm_inflight", "Upstream LLM calls holding a scheduler slot.")
+PIPELINE_STAGE_LATENCY = Histogram("pipeline_stage_seconds", "Time spent in each step of request handling.", ["stage"])
+HTTP_LATENCY = Histogram("http_request_seconds", "HTTP request latency until the response starts.", ["service", "method", "route", "status"])
+SESSIONS_ACTIVE = Gauge("chat_sessions", "Chat sessions currently held by the session store.", ["service"])
+
+def record_usage(prompt_key, usage_metadata):
+    """Records token counts from a Gemini `usage_metadata` (missing on some responses)."""
+    if usage_metadata is None:
+        return
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None)
+    output_tokens = getattr(usage_metadata, "candidates_token_count", None)
+    if prompt_tokens is not None:
+        LLM_INPUT_TOKENS.observe(prompt_tokens, prompt_key=prompt_key)
+    if output_tokens is not None:
+        LLM_OUTPUT_TOKENS.observe(output_tokens, prompt_key=prompt_key)
+    # Included in prompt_token_count; billed at the lower cached rate
+    cached_tokens = getattr(usage_metadata, "cached_content_token_count", None)
+    if cached_tokens:
+        LLM_CACHED_INPUT_TOKENS.observe(cached_tokens, prompt_key=prompt_key)
+
+# === Tracing ===
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+
+try:
+    from opentelemetry import trace as _trace
+except ImportError:
+    _trace = None
+
+@contextmanager
+def span(name, **attributes):
+    """An OpenTelemetry span if tracing is available, otherwise a no-op."""
+    if _trace is None or not TRACING_ENABLED:
+        yield None
+        return
+    tracer = _trace.get_tracer("community-chatbot")
+    attributes = {k: v for k, v in attributes.items() if v is not None}
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+@contextmanager
+def stage(name, **attributes):
+    """Times a pipeline stage into `pipeline_stage_seconds` and traces it as a span."""
+    start = time.perf_counter()
+    try:
+        with span(name, **attributes) as current:
+            yield current
+    finally:
+        PIPELINE_STAGE_LATENCY.observe(time.perf_counter() - start, stage=name)
+
+# === HTTP instrumentation ===
+
+def instrument_flask(app, service):
+    """Adds `/metrics` and per-route request latency to a Flask app."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_LATENCY.observe(
+                time.perf_counter() - start,
+                service=service, method=request.method, route=route, status=response.status_code
+            )
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(REGISTRY.render(), mimetype=CONTENT_TYPE)
+
+    return app
+
+def serve_metrics(port, host="0.0.0.0"):
+    """Serves `/metrics` from a daemon thread, for processes without a web app (e.g. job workers)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+def instrument_fastapi(app, service):
+    """Adds `/metrics` and per-route request latency to a FastAPI app."""
+    from fastapi import Request
+    from fastapi.responses import Response
+
+    @app.middleware("http")
+    async def observe_request_latency(request: Request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        HTTP_LATENCY.observe(
+            time.perf_counter() - start,
+            service=service, method=request.method, route=route.path if route else "unmatched", status=response.status_code
+        )
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Prometheus metrics for this worker process."""
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    return app
@@ -1,10 +1,22 @@
 
-from flask import Flask, request, jsonify
-from pymongo import MongoClient
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from pymongo.errors import ServerSelectionTimeoutError, ConfigurationError
 from bson import ObjectId
-from llm_service import call_gemini
+from article_repository import create_client, create_repository, json_default
+from document_registry import article_text
+from summarizer import summarize
+from summary_worker import (
+    SummaryStore, batch_concurrency, create_summary, get_or_create_summary, summary_collection_name, summary_is_fresh
+)
+from lazy import ProcessLocal
+from llm_scheduler import scope_flask
+from metrics import instrument_flask, stage
+from llm_resilience import LLMError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+import contextvars
+import json
 import os
 import logging
 
@@ -15,60 +27,88 @@ logging.basicConfig(
 )
 
 # === Flask App Init ===
+class MongoJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that writes ObjectIds as strings, in a single encoding pass."""
+    default = staticmethod(json_default)
+
 app = Flask(__name__)
+# Serializes ObjectIds while encoding, so documents are returned as-is
+app.json = MongoJSONProvider(app)
+# /metrics and per-route request latency
+instrument_flask(app, "mongodb_api")
+# Priority and fair-share flow of the LLM calls made for each request
+scope_flask(app)
 load_dotenv()
 
 # === Load Environment Variables ===
 MONGO_URI = os.getenv("MONGO_URI")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
+SUMMARY_BATCH_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_CONCURRENCY", "8"))
+SUMMARY_BATCH_MAX_ITEMS = int(os.getenv("SUMMARY_BATCH_MAX_ITEMS", "100"))
+# "meta" summarizes title and meta description; "full" the whole article text
+SUMMARIZE_MODES = ("meta", "full")
 
-if not MONGO_URI:
-    logging.critical("MONGO_URI not found in environment variables")
-    exit(1)
+# === MongoDB Setup ===
+# The client is created on first use, so importing this module (tests, gunicorn --preload)
+# needs no environment and does no network I/O; `python mongodb_api.py` still checks the
+# connection before serving.
+
+def _create_client():
+    for name, value in (("MONGO_URI", MONGO_URI), ("DATABASE_NAME", DATABASE_NAME), ("COLLECTION_NAME", COLLECTION_NAME)):
+        if not value:
+            raise RuntimeError(f"{name} not found in environment variables")
+    logging.info(f"Connecting to MongoDB at: {MONGO_URI}")
+    # Pool size and timeouts come from the MONGO_* settings in article_repository
+    return create_client(MONGO_URI)
+
+_client = ProcessLocal(_create_client)
+# Projected, cached article reads shared by all routes
+_articles = ProcessLocal(lambda: create_repository(get_collection()))
+# Precomputed summaries written by summary_worker.py
+_summary_store = ProcessLocal(
+    lambda: SummaryStore(get_client()[DATABASE_NAME][summary_collection_name(COLLECTION_NAME)])
+)
 
-if not DATABASE_NAME:
-    logging.critical("DATABASE_NAME not found in environment variables")
-    exit(1)
+def get_client():
+    return _client.get()
 
-if not COLLECTION_NAME:
-    logging.critical("COLLECTION_NAME not found in environment variables")
-    exit(1)
+def get_collection():
+    return get_client()[DATABASE_NAME][COLLECTION_NAME]
 
-logging.info(f"Connecting to MongoDB at: {MONGO_URI}")
+def get_summary_store():
+    return _summary_store.get()
 
-# === MongoDB Setup ===
-try:
-    client = MongoClient(
-        MONGO_URI,
-        tlsAllowInvalidCertificates=True,
-        serverSelectionTimeoutMS=5000
-    )
-    client.admin.command("ping")
-    logging.info("MongoDB connection successful.")
-
-    db = client[DATABASE_NAME]
-    mycol = db[COLLECTION_NAME]
+def get_articles():
+    return _articles.get()
 
+def check_connection():
+    """Pings MongoDB and logs a sample document. Returns False if the database is unreachable."""
     try:
-        sample = mycol.find_one()
+        get_client().admin.command("ping")
+        logging.info("MongoDB connection successful.")
+    except (ServerSelectionTimeoutError, ConfigurationError, RuntimeError) as e:
+        logging.critical(f"MongoDB connection failed: {e}")
+        return False
+
+    try:
+        sample = get_collection().find_one()
         if sample:
             logging.info(f"Sample document from collection: {sample.get('_id', 'unknown')}")
         else:
             logging.warning("No documents found in collection.")
     except Exception as e:
         logging.warning(f"Error fetching sample document: {e}")
-
-except (ServerSelectionTimeoutError, ConfigurationError, Exception) as e:
-    logging.critical(f"MongoDB connection failed: {e}")
-    exit(1)
+    return True
 
 # === Helper Functions ===
 
-def get_article_by_id(article_id):
+def get_article_by_id(article_id, view="details"):
+    """Fetches the fields of `view` (see article_repository.PROJECTIONS). Returns None if missing or invalid."""
     try:
         logging.info(f"Looking up article ID: {article_id}")
-        article = mycol.find_one({"_id": ObjectId(article_id)})
+        with stage("get_article_by_id", article_id=str(article_id), view=view):
+            article = get_articles().get(article_id, view)
         if article:
             logging.info("Article found.")
         else:
@@ -78,14 +118,10 @@ def get_article_by_id(article_id):
         logging.error(f"Error in get_article_by_id: {e}")
         return None
 
-def convert_objectid_to_string(obj):
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    if isinstance(obj, dict):
-        return {k: convert_objectid_to_string(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [convert_objectid_to_string(i) for i in obj]
-    return obj
+def llm_error_response(e):
+    """Maps a failed LLM call to an error response with a matching status code (429, 503, 504, ...)."""
+    logging.warning(f"LLM call failed with {type(e).__name__}: {e}")
+    return jsonify({"error": f"Summary generation failed: {e}"}), e.status_code
 
 # === Routes ===
 
@@ -96,22 +132,25 @@ def home():
         "version": "1.0",
         "endpoints": {
             "GET /health": "Health check",
+            "GET /metrics": "Prometheus metrics",
             "POST /article-details": "Get full article details by ID",
             "POST /article-summary": "Get article details with AI summary",
-            "POST /summarize": "Get title and summary only"
+            "POST /summarize": "Get title and summary only (mode: meta, or full for the whole article text)",
+            "POST /summarize/batch": "Stream titles and summaries for many articles as NDJSON"
         }
     })
 
 @app.route("/health", methods=["GET"])
 def health_check():
     try:
-        client.admin.command("ping")
+        get_client().admin.command("ping")
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {e}"
     return jsonify({
         "status": "healthy",
-        "database": db_status
+        "database": db_status,
+        "article_cache": get_articles().cache_stats() if _articles.initialized() else None
     })
 
 @app.route("/article-details", methods=["POST"])
@@ -127,8 +166,7 @@ def get_article_details():
         if not article:
             return jsonify({"error": f"Article with ID {article_id} not found"}), 404
 
-        article_json = convert_objectid_to_string(article)
-        return jsonify({"success": True, "article": article_json})
+        return jsonify({"success": True, "article": article})
 
     except Exception as e:
         logging.exception("Error in get_article_details")
@@ -151,12 +189,11 @@ def get_article_with_summary():
         meta_desc = article.get("meta", {}).get("description", "")
         combined_text = f"{title} {meta_desc}".strip()
 
-        logging.info(f"Generating summary for article: {article_id}")
-        summary = call_gemini("summary", context_vars={"text": combined_text}) if combined_text else "No content to summarize."
+        summary = get_or_create_summary(get_summary_store(), article) if combined_text else "No content to summarize."
 
         response = {
             "success": True,
-            "article": convert_objectid_to_string(article),
+            "article": article,
             "extracted_data": {
                 "title": title,
                 "meta_description": meta_desc,
@@ -166,6 +203,8 @@ def get_article_with_summary():
         }
         return jsonify(response)
 
+    except LLMError as e:
+        return llm_error_response(e)
     except Exception as e:
         logging.exception("Error in get_article_with_summary")
         return jsonify({"error": f"Internal server error: {e}"}), 500
@@ -178,22 +217,127 @@ def summarize_article():
         if not article_id:
             logging.warning("No article_id provided.")
             return jsonify({"error": "article_id is required"}), 400
+        mode = data.get("mode", "meta")
+        if mode not in SUMMARIZE_MODES:
+            return jsonify({"error": f"mode must be one of: {', '.join(SUMMARIZE_MODES)}"}), 400
+        if mode == "full":
+            return summarize_full_article(article_id)
 
-        article = get_article_by_id(article_id)
+        article = get_article_by_id(article_id, view="summary")
         if not article:
             return jsonify({"error": f"Article with ID {article_id} not found"}), 404
 
         title = article.get("title", "")
         meta_desc = article.get("meta", {}).get("description", "")
-        summary_meta = call_gemini("summary", context_vars={"text": f"{title} {meta_desc}"}) if (title or meta_desc) else "No data to summarize."
+        # The stored summary is served only while it matches the article's current title and description
+        summary_meta = get_or_create_summary(get_summary_store(), article) if (title or meta_desc) else "No data to summarize."
 
         return jsonify({"title": title, "summary": summary_meta})
 
+    except LLMError as e:
+        return llm_error_response(e)
     except Exception as e:
         logging.exception("Error in summarize_article")
         return jsonify({"error": f"Internal server error: {e}"}), 500
 
+def summarize_full_article(article_id):
+    """Summarizes the whole article text, chunk by chunk when it is long (see summarizer.py)."""
+    article = get_article_by_id(article_id, view="full_text")
+    if not article:
+        return jsonify({"error": f"Article with ID {article_id} not found"}), 404
+    text = article_text(article)
+    with stage("summarize_full_article", text_chars=len(text)):
+        summary = summarize(text, mode="auto") if text else "No content to summarize."
+    return jsonify({"title": article.get("title", ""), "summary": summary, "mode": "full"})
+
+@app.route("/summarize/batch", methods=["POST"])
+def summarize_articles_batch():
+    data = request.get_json(force=True, silent=True) or {}
+    article_ids = data.get("article_ids")
+    if not isinstance(article_ids, list) or not article_ids:
+        return jsonify({"error": "article_ids must be a non-empty list"}), 400
+    if len(article_ids) > SUMMARY_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {SUMMARY_BATCH_MAX_ITEMS} article_ids per request"}), 400
+
+    try:
+        concurrency = batch_concurrency(data.get("concurrency"), SUMMARY_BATCH_CONCURRENCY)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return Response(_summarize_batch_lines(article_ids, concurrency), mimetype="application/x-ndjson")
+
+def _summarize_batch_lines(article_ids, concurrency):
+    """Yields one NDJSON line per article as its summary becomes available."""
+    def line(item):
+        return json.dumps(item) + "\n"
+
+    ids = {}
+    for article_id in dict.fromkeys(map(str, article_ids)):
+        try:
+            ids[ObjectId(article_id)] = article_id
+        except Exception:
+            yield line({"article_id": article_id, "error": "Invalid article_id"})
+    if not ids:
+        return
+
+    # The articles' current text and their stored summaries, in one $in read each
+    try:
+        found = get_articles().get_many(list(ids), view="summary")
+    except Exception as e:
+        logging.error(f"Error fetching articles for batch summary: {e}")
+        for oid in ids:
+            yield line({"article_id": ids[oid], "error": "Database error"})
+        return
+    try:
+        stored = get_summary_store().get_many(list(found))
+    except Exception as e:
+        logging.error(f"Error reading stored summaries: {e}")
+        stored = {}
+
+    # Stored summaries that are still fresh first; stale or missing ones are regenerated
+    articles = []
+    for oid, article_id in ids.items():
+        article = found.get(oid)
+        if article is None:
+            yield line({"article_id": article_id, "error": f"Article with ID {article_id} not found"})
+        elif summary_is_fresh(stored.get(oid), article):
+            yield line({"article_id": article_id, "title": stored[oid].get("title", ""), "summary": stored[oid]["summary"]})
+        else:
+            articles.append(article)
+    if not articles:
+        return
+
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        # Copies of this request's context, so the summaries are scheduled as this client's batch calls
+        futures = {
+            pool.submit(contextvars.copy_context().run, _summarize_for_batch, article): article for article in articles
+        }
+        for future in as_completed(futures):
+            article = futures[future]
+            item = {"article_id": ids[article["_id"]], "title": article.get("title", "")}
+            try:
+                item["summary"] = future.result()
+            except LLMError as e:
+                logging.warning(f"LLM call failed with {type(e).__name__}: {e}")
+                item.update({"error": f"Summary generation failed: {e}", "status": e.status_code})
+            except Exception as e:
+                logging.exception("Error summarizing article in batch")
+                item.update({"error": f"Internal server error: {e}", "status": 500})
+            yield line(item)
+    finally:
+        # Stop queued work if the client disconnects mid-stream
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _summarize_for_batch(article):
+    title = article.get("title", "")
+    meta_desc = article.get("meta", {}).get("description", "")
+    return create_summary(get_summary_store(), article) if (title or meta_desc) else "No data to summarize."
+
 # === Start Server ===
 if __name__ == "__main__":
+    if not check_connection():
+        exit(1)
     logging.info("Starting Flask app on port 8002...")
-    app.run(host="0.0.0.0", port=8002, debug=True)
+    # The debugger and reloader are opt-in (FLASK_DEBUG=true); never enable them in production
+    app.run(host="0.0.0.0", port=8002, debug=os.getenv("FLASK_DEBUG", "false").lower() == "true", threaded=True)
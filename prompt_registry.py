@@ -0,0 +1,114 @@
+"""
+Compiled prompt registry.
+
+The entries of `prompts.PROMPTS` are checked and compiled once, when this
+module is imported, so a malformed template or a budget pointing at a field
+the template does not have stops the process at startup (PromptTemplateError)
+instead of failing a request. Each template is parsed into literal text and
+placeholder names; rendering joins the pieces after one set check for
+missing values (PromptVariableError, never a bare KeyError).
+
+Entries may set `"context_field"`: the prompt up to and including that
+placeholder is its cacheable prefix, which `llm_backends.ModelPool` can serve
+from a Gemini context cache when the same article is asked about repeatedly.
+"""
+from string import Formatter
+
+from llm_resilience import PromptNotFoundError, PromptTemplateError, PromptVariableError
+from llm_scheduler import PRIORITY_WEIGHTS
+from prompts import PROMPTS
+
+def _segments(key, template):
+    """(literal, field) pairs of `template`; field is None after the last placeholder."""
+    segments = []
+    try:
+        parsed = list(Formatter().parse(template))
+    except ValueError as e:
+        raise PromptTemplateError(f"Prompt '{key}' has a malformed template: {e}") from e
+    for literal, field, format_spec, conversion in parsed:
+        if field is not None and (not field.isidentifier() or format_spec or conversion):
+            # Only plain {name} placeholders, so rendering never needs str.format
+            raise PromptTemplateError(f"Prompt '{key}' has an unsupported placeholder '{{{field}}}'.")
+        segments.append((literal, field))
+    return tuple(segments)
+
+def _render(segments, context_vars):
+    parts = []
+    for literal, field in segments:
+        parts.append(literal)
+        if field is not None:
+            value = context_vars[field]
+            parts.append(value if type(value) is str else format(value))
+    return "".join(parts)
+
+class CompiledPrompt:
+    """One validated entry of PROMPTS."""
+    def __init__(self, key, config):
+        self.key = key
+        self.config = config
+        if not isinstance(config.get("prompt"), str):
+            raise PromptTemplateError(f"Prompt '{key}' has no template.")
+        if not isinstance(config.get("max_tokens"), int) or config["max_tokens"] <= 0:
+            raise PromptTemplateError(f"Prompt '{key}' needs a positive max_tokens.")
+        self.template = config["prompt"]
+        self.system_instruction = config.get("system_instruction") or None
+        self.max_tokens = config["max_tokens"]
+        self.cache = config.get("cache", True)
+        self.priority = config.get("priority")
+        if self.priority is not None and self.priority not in PRIORITY_WEIGHTS:
+            raise PromptTemplateError(f"Prompt '{key}' has an unknown priority '{self.priority}'.")
+
+        self._segments = _segments(key, self.template)
+        self.fields = frozenset(field for _, field in self._segments if field is not None)
+        referenced = [config.get("context_field")]
+        if config.get("budget"):
+            referenced += [config["budget"].get("field", "text"), config["budget"].get("query_field")]
+        for name in referenced:
+            if name and name not in self.fields:
+                raise PromptTemplateError(f"Prompt '{key}' refers to '{name}', which its template does not use.")
+
+        # Everything through the context field is the cacheable prefix
+        self.context_field = config.get("context_field")
+        split = next((i + 1 for i, (_, field) in enumerate(self._segments) if field == self.context_field), 0)
+        self._prefix = self._segments[:split]
+        self._suffix = self._segments[split:]
+
+    def check(self, context_vars):
+        """Raises PromptVariableError unless every placeholder has a value."""
+        missing = self.fields.difference(context_vars or ())
+        if missing:
+            raise PromptVariableError(f"Prompt '{self.key}' is missing values for: {', '.join(sorted(missing))}.")
+
+    def render(self, context_vars=None):
+        """The prompt text for `context_vars`."""
+        if not self.fields:
+            return self.template
+        self.check(context_vars)
+        return _render(self._segments, context_vars)
+
+    def split(self, context_vars=None):
+        """(prompt text, length of its cacheable prefix); the length is 0 without a context field."""
+        if not self._prefix:
+            return self.render(context_vars), 0
+        self.check(context_vars)
+        prefix = _render(self._prefix, context_vars)
+        return prefix + _render(self._suffix, context_vars), len(prefix)
+
+class PromptRegistry:
+    """Compiled prompts by key; compiling validates every entry."""
+    def __init__(self, prompts):
+        self._prompts = {key: CompiledPrompt(key, config) for key, config in prompts.items()}
+
+    def __getitem__(self, key):
+        try:
+            return self._prompts[key]
+        except KeyError:
+            raise PromptNotFoundError(f"Prompt key '{key}' not found.") from None
+
+    def __contains__(self, key):
+        return key in self._prompts
+
+    def __iter__(self):
+        return iter(self._prompts)
+
+PROMPT_REGISTRY = PromptRegistry(PROMPTS)
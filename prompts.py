@@ -2,12 +2,20 @@ PROMPTS = {
     "summary": {
         "system_instruction": "You are a helpful assistant specialized in summarizing text.",
         "prompt": "Summarize the following text that should be an article or an insightful comment in 3–5 concise bullet points and for insightful comment as comment are short so you just give brief about it., focusing on the main arguments and conclusions.\n\nText:\n---\n{text}\n---",
-        "max_tokens": 150
+        "max_tokens": 150,
+        # Long articles are summarized chunk by chunk (see token_budget)
+        "budget": {"input_tokens": 12000, "field": "text", "strategy": "map_reduce", "chunk_tokens": 3000}
+    },
+    "summarize_chunk": {
+        "system_instruction": "You are a helpful assistant specialized in summarizing text.",
+        "prompt": "The following text is one part of a longer article. Write 3–6 concise bullet points with the key facts, arguments and conclusions of this part only.\n\nPART:\n---\n{text}\n---",
+        "max_tokens": 200,
+        "cache": False  # Cached per chunk hash by summarizer.py
     },
     "suggest_topics": {
     "system_instruction": "You are a content strategist.",
     "prompt": (
-        "Act as a content strategist. Based on the following article, suggest 5 new, engaging blog post topics. "
+        "Based on the following article, suggest 5 new, engaging blog post topics. "
         "For each topic, provide:\n"
         "1. The topic as a bolded title.\n"
         "2. A brief (1-2 sentence) explanation of the angle or what it would cover.\n\n"
@@ -22,17 +30,23 @@ PROMPTS = {
         "Dont include anything else in the output like explaining and details, just the topics.\n\n"
         "ARTICLE:\n---\n{text}\n---"
     ),
-    "max_tokens": 200
+    "max_tokens": 200,
+    "budget": {"input_tokens": 12000, "field": "text", "strategy": "extract"},
+    "context_field": "text"
 },
     "question_answering": {
         "system_instruction": "You are an expert Q&A assistant.",
-        "prompt": "You are a helpful assistant. Answer the following question based *only* on the provided article context. If the answer is not in the article, state that clearly and do not provide an answer from your own knowledge.\n\nARTICLE:\n---\n{text}\n---\n\nQUESTION: {question}",
-        "max_tokens": 150
+        "prompt": "Answer the following question based *only* on the provided article context. If the answer is not in the article, state that clearly and do not provide an answer from your own knowledge.\n\nARTICLE:\n---\n{text}\n---\n\nQUESTION: {question}",
+        "max_tokens": 150,
+        # Sentences that mention the question's words are kept first
+        "budget": {"input_tokens": 8000, "field": "text", "strategy": "extract", "query_field": "question"},
+        # Everything up to the article is the same for every question about it (see prompt_registry)
+        "context_field": "text"
     },
     "generate_titles": {
     "system_instruction": "You are an expert SEO copywriter.",
     "prompt": (
-        "You are an expert SEO copywriter. Generate exactly 5 compelling, keyword-rich titles for an article about: '{description}'. "
+        "Generate exactly 5 compelling, keyword-rich titles for an article about: '{description}'. "
         "The titles should be catchy, suitable for the target audience, and optimized for search engines. "
         "Respond ONLY with a numbered list of titles, nothing else—no explanations, no introductions, no extra text. "
         "Format:\n"
@@ -42,12 +56,13 @@ PROMPTS = {
         "4. Title Four\n"
         "5. Title Five"
     ),
-    "max_tokens": 150
+    "max_tokens": 150,
+    "cache": False  # Article writer output should vary between runs
 },
     "generate_blog_ideas": {
     "system_instruction": "You are a senior content planner.",
     "prompt": (
-        "Act as a senior content planner. Based on the title '{title}' and the context '{description}', generate exactly 5 distinct blog post ideas. "
+        "Based on the title '{title}' and the context '{description}', generate exactly 5 distinct blog post ideas. "
         "Each idea should present a unique angle or structure. "
         "Respond ONLY with a numbered list, no introductions or explanations. "
         "Format each item as:\n"
@@ -57,11 +72,12 @@ PROMPTS = {
         "4. **Idea Title**: Brief explanation\n"
         "5. **Idea Title**: Brief explanation"
     ),
-    "max_tokens": 500
+    "max_tokens": 500,
+    "cache": False
 },
     "generate_article": {
-        "system_instruction": "You are a professional blog writer.",
-        "prompt": """Act as an expert blog writer with strong SEO knowledge. Your task is to write a complete, high-quality blog post.
+        "system_instruction": "You are a professional blog writer with strong SEO knowledge.",
+        "prompt": """Your task is to write a complete, high-quality blog post.
 
 Follow these instructions carefully:
 1.  Use the provided Title and chosen Blog Idea as your primary guide.
@@ -77,6 +93,7 @@ CHOSEN BLOG IDEA: {blog_idea}
 ---
 
 Begin writing the article now.""",
-        "max_tokens": 2048 # Increased for full article generation
+        "max_tokens": 2048, # Increased for full article generation
+        "cache": False
     }
 }
@@ -0,0 +1,158 @@
+"""
+Retrieval stage for question answering over long articles.
+
+Instead of pasting the whole article into the `question_answering` prompt,
+the article is split into overlapping chunks, the chunks are embedded, and
+only the chunks most relevant to the question are sent to the model. Indexes
+are cached per document hash, so follow-up questions about the same article
+only pay for embedding the question.
+
+The default `HashingEmbedder` is a TF-IDF weighted hashing-trick embedder:
+it works offline and needs no model download. Any object with an
+`embed(texts) -> np.ndarray` method can be used instead.
+"""
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from document_registry import document_id
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+STOPWORDS = frozenset(
+    "a an and are as at be been but by can could did do does for from had has have how i if in into is it its "
+    "me my no not of on or our so than that the their them then there these they this to was we were what when "
+    "where which who why will with would you your".split()
+)
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def split_into_chunks(text, chunk_chars=800, overlap_sentences=1):
+    """
+    Splits text into chunks of roughly `chunk_chars`, on sentence boundaries.
+
+    Consecutive chunks share `overlap_sentences` sentences so an answer that
+    straddles a boundary is still retrievable.
+    """
+    sentences = [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+    pieces = []
+    for sentence in sentences:
+        # Hard-split sentences that are longer than a whole chunk
+        while len(sentence) > chunk_chars:
+            pieces.append(sentence[:chunk_chars])
+            sentence = sentence[chunk_chars:]
+        if sentence:
+            pieces.append(sentence)
+
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        if current and size + len(piece) > chunk_chars:
+            chunks.append(" ".join(current))
+            current = current[-overlap_sentences:] if overlap_sentences else []
+            size = sum(len(p) + 1 for p in current)
+        current.append(piece)
+        size += len(piece) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+class HashingEmbedder:
+    """Bag-of-words hashing embedder; `idf = True` tells the index to apply per-document IDF weights."""
+    idf = True
+
+    def __init__(self, dim=2048):
+        self.dim = dim
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                h = zlib.crc32(token.encode("utf-8"))
+                # The sign bit halves the damage done by hash collisions
+                matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        # Sub-linear term frequency
+        return np.sign(matrix) * np.log1p(np.abs(matrix))
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class VectorIndex:
+    """Dense in-memory index over the chunks of one document."""
+    def __init__(self, chunks, embedder):
+        self.chunks = chunks
+        self.embedder = embedder
+        vectors = embedder.embed(chunks)
+        self.weights = None
+        if getattr(embedder, "idf", False):
+            df = np.count_nonzero(vectors, axis=0)
+            self.weights = (np.log((1 + len(chunks)) / (1 + df)) + 1).astype(np.float32)
+            vectors = vectors * self.weights
+        self.vectors = _normalize(vectors).astype(np.float32)
+
+    def search(self, query, k=4):
+        """Returns the indices of the `k` chunks most similar to `query`, best first."""
+        q = self.embedder.embed([query])[0]
+        if self.weights is not None:
+            q = q * self.weights
+        scores = self.vectors @ _normalize(q)
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])].tolist()
+
+class IndexCache:
+    """LRU cache of VectorIndex objects keyed by document hash."""
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                return index
+        index = build()
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+class Retriever:
+    """Selects the parts of a document that are relevant to a question."""
+    def __init__(self, embedder=None, top_k=4, chunk_chars=800, min_chars=4000, cache_entries=128):
+        self.embedder = embedder or HashingEmbedder()
+        self.top_k = top_k
+        self.chunk_chars = chunk_chars
+        self.min_chars = min_chars
+        self.cache = IndexCache(cache_entries)
+
+    def index_for(self, text):
+        return self.cache.get_or_build(
+            document_id(text), lambda: VectorIndex(split_into_chunks(text, self.chunk_chars), self.embedder)
+        )
+
+    def context_for(self, text, question):
+        """
+        Returns the text to put in the prompt for `question`.
+
+        Documents shorter than `min_chars` are returned whole, since retrieval
+        would save little. Otherwise the top-k chunks are returned in document
+        order, separated by ellipses.
+        """
+        if not text or len(text) < self.min_chars:
+            return text
+        index = self.index_for(text)
+        if len(index.chunks) <= self.top_k:
+            return text
+        selected = sorted(index.search(question, self.top_k))
+        return "\n...\n".join(index.chunks[i] for i in selected)
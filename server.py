@@ -0,0 +1,70 @@
+"""
+One ASGI service for everything that used to run as four processes.
+
+Mounts the chat routes of `api.py` (`/chat`, `/documents`) and the article
+routes of `mongodb_api.py` / `summaryapi.py` (`/article-details`,
+`/article-summary`, `/summarize`, `/summarize/batch`, `/health`) on a single
+FastAPI app. Every route shares one LLM client, one response cache, one
+session store and one async MongoDB client and article cache per worker
+process. Request and response shapes are those of the original services,
+so clients only need to point at one port.
+
+    python server.py                      # port SERVER_PORT (8000), SERVER_WORKERS processes
+    uvicorn server:app --workers 4
+"""
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI
+
+import api
+import articles_api
+from llm_scheduler import scope_fastapi
+from metrics import instrument_fastapi
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await articles_api.close()
+
+app = FastAPI(
+    title="Community Chatbot",
+    description="Chat, article details and article summaries in one service.",
+    version="1.0.0",
+    lifespan=lifespan
+)
+# /metrics and per-route request latency
+instrument_fastapi(app, "server")
+# Priority and fair-share flow of the LLM calls made for each request
+scope_fastapi(app)
+app.include_router(api.router)
+app.include_router(articles_api.router)
+
+@app.get("/")
+def read_root():
+    return {
+        "message": "Welcome to the Gemini Chatbot API. Please use the /docs endpoint to see the API documentation.",
+        "version": "1.0",
+        "endpoints": {
+            "POST /chat": "Chat about an article or write a new one",
+            "POST /documents": "Register an article once and refer to it by doc_id",
+            "GET /jobs/{job_id}": "Status and result of an article job (/chat with job: true)",
+            "DELETE /jobs/{job_id}": "Cancel an article job",
+            "GET /health": "Health check",
+            "GET /metrics": "Prometheus metrics",
+            "POST /article-details": "Get full article details by ID",
+            "POST /article-summary": "Get article details with AI summary",
+            "POST /summarize": "Get title and summary only (mode: meta, or full for the whole article text)",
+            "POST /summarize/batch": "Stream titles and summaries for many articles as NDJSON"
+        }
+    }
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    uvicorn.run("server:app", host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS)
@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+def _dumps(state):
+    return json.dumps(state, separators=(",", ":"), ensure_ascii=False)
+
+class MemorySessionStore:
+    """
+    In-process session store bounded by entry count, with an idle TTL.
+
+    States are kept serialized, so callers always get an independent copy and
+    behaviour matches the Redis store.
+    """
+    # Calls never wait on the network, so async servers make them inline
+    blocking = False
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # session_id -> (serialized state, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[session_id]
+                return None
+            # Reading a session counts as activity
+            self._entries[session_id] = (data, self._expires_at())
+            self._entries.move_to_end(session_id)
+        return json.loads(data)
+
+    def put(self, session_id, state):
+        data = _dumps(state)
+        with self._lock:
+            self._entries[session_id] = (data, self._expires_at())
+            self._entries.move_to_end(session_id)
+            self._evict()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            self._evict()
+            return len(self._entries)
+
+    def _expires_at(self):
+        return time.monotonic() + self.ttl if self.ttl else None
+
+    def _evict(self):
+        # Entries are ordered by last activity, so expired ones are at the front
+        now = time.monotonic()
+        while self._entries:
+            _, expires_at = next(iter(self._entries.values()))
+            if len(self._entries) > self.max_entries or (expires_at is not None and expires_at <= now):
+                self._entries.popitem(last=False)
+            else:
+                break
+
+class RedisSessionStore:
+    """
+    Session store on a Redis-protocol server, shared by every worker and node.
+
+    Keys expire after `ttl` seconds of inactivity, so abandoned sessions are
+    reclaimed by the server. Calls block on the network; async servers make
+    them in a worker thread.
+    """
+    blocking = True
+
+    def __init__(self, client, ttl=3600, prefix="chatbot:session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, session_id):
+        key = self.prefix + session_id
+        data = self.client.get(key)
+        if data is None:
+            return None
+        if self.ttl:
+            self.client.expire(key, int(self.ttl))
+        return json.loads(data)
+
+    def put(self, session_id, state):
+        self.client.set(self.prefix + session_id, _dumps(state), ex=int(self.ttl) if self.ttl else None)
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+    def __len__(self):
+        # SCAN walks the keyspace; fine for monitoring, not for the request path
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*", count=1000))
+
+def create_session_store(backend, max_entries=10000, ttl=3600, redis_url=None):
+    """Builds the session store named by `backend` ("memory" or "redis")."""
+    if backend == "memory":
+        return MemorySessionStore(max_entries=max_entries, ttl=ttl)
+    if backend == "redis":
+        import redis  # Only needed when sessions are shared through Redis
+        return RedisSessionStore(redis.Redis.from_url(redis_url), ttl=ttl)
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,132 @@
+"""
+Speculative pre-generation for the article writer workflow.
+
+While the user reads a list of titles (or blog ideas), the next step is
+generated in the background for the most likely picks. When the user
+chooses, the matching speculation is used if it exists and the others are
+cancelled: not-yet-started calls are dropped, calls already running are
+left to finish and their estimated tokens are counted as wasted.
+
+Speculations are held per session in a bounded, process-local
+`SpeculationCache`, keyed on the step's prompt and the exact option text.
+A session handled by another worker process simply misses and generates as
+usual.
+
+Metrics: `speculations_total{prompt_key,result}` with `hit` / `miss` for
+choices and `cancelled` / `wasted` for unused speculations, and
+`speculation_wasted_tokens_total{prompt_key}`.
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_resilience import LLMError
+from llm_scheduler import request_context
+from llm_service import generate
+from metrics import SPECULATION_WASTED_TOKENS, SPECULATIONS
+from prompt_registry import PROMPT_REGISTRY
+from token_budget import estimate_tokens
+
+_OPTION_RE = re.compile(r"^\s*\d+[.)]\s+(.+?)\s*$", re.MULTILINE)
+_DECORATION_RE = re.compile(r"[*_`\"'“”‘’]+")
+
+def parse_options(text):
+    """The items of a numbered list ("1. Title"), in order."""
+    return _OPTION_RE.findall(text or "")
+
+def _normalize(text):
+    text = _DECORATION_RE.sub("", text.lower())
+    text = re.sub(r"^\s*\d+[.)]\s*", "", text)
+    return " ".join(text.split()).strip(" .:;-")
+
+def match_option(choice, options):
+    """
+    The option the user picked, or None.
+
+    Users paste an option with or without its number and markdown, or only
+    the part before ':' for "**Idea**: explanation" items.
+    """
+    wanted = _normalize(choice)
+    if not wanted:
+        return None
+    for option in options:
+        if wanted in (_normalize(option), _normalize(option.split(":", 1)[0])):
+            return option
+    return None
+
+def _speculate(session, prompt_key, context_vars):
+    # Nobody has asked for this yet, so it only uses capacity that real requests leave idle
+    with request_context(priority="background", session=session):
+        return generate(prompt_key, context_vars)
+
+class SpeculationCache:
+    """Background generations per session, bounded per session and in number of sessions (LRU)."""
+    def __init__(self, max_workers=4, max_entries=4, max_sessions=1000):
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculate")
+        self._sessions = OrderedDict()  # session -> OrderedDict((prompt_key, option) -> (future, context_vars))
+        self._lock = threading.Lock()
+
+    def start(self, session, prompt_key, option, context_vars):
+        """Starts generating `prompt_key` for `option` unless it is already speculated."""
+        key = (prompt_key, option)
+        evicted = []
+        with self._lock:
+            entries = self._sessions.get(session)
+            if entries is None:
+                entries = self._sessions[session] = OrderedDict()
+            self._sessions.move_to_end(session)
+            if key in entries:
+                return
+            entries[key] = (self._pool.submit(_speculate, session, prompt_key, context_vars), context_vars)
+            while len(entries) > self.max_entries:
+                evicted.append(entries.popitem(last=False))
+            while len(self._sessions) > self.max_sessions:
+                evicted.extend(self._sessions.popitem(last=False)[1].items())
+        for (evicted_prompt_key, _), (future, evicted_vars) in evicted:
+            self._discard(evicted_prompt_key, future, evicted_vars)
+
+    def take(self, session, prompt_key, option):
+        """
+        Returns the future for `option` (or None) and cancels the session's other `prompt_key` speculations.
+        """
+        with self._lock:
+            entries = self._sessions.get(session, {})
+            taken = entries.pop((prompt_key, option), None) if option is not None else None
+            others = [(key, entries.pop(key)) for key in list(entries) if key[0] == prompt_key]
+        SPECULATIONS.inc(prompt_key=prompt_key, result="hit" if taken else "miss")
+        for _, (future, context_vars) in others:
+            self._discard(prompt_key, future, context_vars)
+        return taken[0] if taken else None
+
+    def discard(self, session):
+        """Cancels everything speculated for `session`."""
+        with self._lock:
+            entries = self._sessions.pop(session, {})
+        for (prompt_key, _), (future, context_vars) in entries.items():
+            self._discard(prompt_key, future, context_vars)
+
+    def _discard(self, prompt_key, future, context_vars):
+        if future.cancel():
+            SPECULATIONS.inc(prompt_key=prompt_key, result="cancelled")
+            return
+        # Already running: a thread cannot be interrupted, so count what it costs once it ends
+        future.add_done_callback(lambda f: self._count_waste(prompt_key, f, context_vars))
+
+    @staticmethod
+    def _count_waste(prompt_key, future, context_vars):
+        SPECULATIONS.inc(prompt_key=prompt_key, result="wasted")
+        if future.exception() is not None:
+            return
+        try:
+            prompt = PROMPT_REGISTRY[prompt_key].render(context_vars)
+        except LLMError as e:
+            logging.warning(f"Could not estimate wasted tokens for '{prompt_key}': {e}")
+            prompt = ""
+        SPECULATION_WASTED_TOKENS.inc(estimate_tokens(prompt) + estimate_tokens(future.result()), prompt_key=prompt_key)
+
+    def __len__(self):
+        return sum(len(entries) for entries in list(self._sessions.values()))
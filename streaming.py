@@ -0,0 +1,9 @@
+import json
+
+# Headers that stop proxies (e.g. nginx) from buffering a server-sent-events stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(data, event=None):
+    """Formats one server-sent event with a JSON payload."""
+    message = f"event: {event}\n" if event else ""
+    return f"{message}data: {json.dumps(data)}\n\n"
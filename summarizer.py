@@ -0,0 +1,114 @@
+"""
+Hierarchical (map-reduce) summarization of long texts.
+
+The single-pass `summary` prompt is sized for a title and meta description.
+For full article bodies and long comment threads the text is split into
+content-defined chunks (`token_budget.split_for_map`), each chunk is
+summarized with the `summarize_chunk` prompt on a bounded, process-wide
+worker pool, and the joined partial summaries go through one final `summary`
+pass. If the partials are themselves too long, they are chunked and
+summarized again, level by level.
+
+Partial summaries are cached by chunk hash. Chunk boundaries depend only on
+nearby content, so after an edit only the chunks around the change are sent
+to the model again.
+
+Modes:
+- `single`: one `summary` pass over the text (oversized input is still
+  compacted by the prompt's budget).
+- `map_reduce`: always summarize chunk by chunk when the text is longer than one chunk.
+- `auto`: `map_reduce` for texts over SUMMARY_SINGLE_PASS_TOKENS, else `single`.
+"""
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    SUMMARY_CHUNK_TOKENS, SUMMARY_CONCURRENCY, SUMMARY_MAX_LEVELS, SUMMARY_SINGLE_PASS_TOKENS,
+    SUMMARY_CHUNK_CACHE_BACKEND, SUMMARY_CHUNK_CACHE_TTL, SUMMARY_CHUNK_CACHE_MAX_BYTES, SUMMARY_CHUNK_CACHE_PATH
+)
+from lazy import ProcessLocal
+from llm_cache import create_cache, make_cache_key
+from llm_resilience import LLMError
+from llm_service import generate, get_model
+from metrics import SUMMARY_CHUNKS, stage
+from prompt_registry import PROMPT_REGISTRY
+from token_budget import estimate_tokens, extract_sentences, split_for_map
+
+MODES = ("auto", "single", "map_reduce")
+
+_chunk_cache = ProcessLocal(lambda: create_cache(
+    SUMMARY_CHUNK_CACHE_BACKEND, SUMMARY_CHUNK_CACHE_MAX_BYTES, ttl=SUMMARY_CHUNK_CACHE_TTL or None, path=SUMMARY_CHUNK_CACHE_PATH
+))
+# Shared by all requests, so concurrent long summaries cannot exceed SUMMARY_CONCURRENCY upstream calls
+_pool = ProcessLocal(lambda: ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY, thread_name_prefix="summarize-chunk"))
+
+def chunk_cache_stats():
+    return _chunk_cache.get().stats()
+
+def _chunk_key(chunk):
+    prompt = PROMPT_REGISTRY["summarize_chunk"]
+    # The rendered prompt and model are part of the key, so editing the prompt invalidates old partials
+    return make_cache_key(
+        "summarize_chunk", prompt.render({"text": chunk}), prompt.max_tokens, getattr(get_model(), "model_name", ""),
+        prompt.system_instruction
+    )
+
+def _summarize_chunk(chunk):
+    """Returns (summary, cacheable); a failed call degrades to an extract that is not cached."""
+    try:
+        return generate("summarize_chunk", context_vars={"text": chunk}), True
+    except LLMError as e:
+        # One failed chunk should not fail the whole summary; keep its most informative sentences instead
+        logging.warning(f"Chunk summary failed, using an extract instead: {e}")
+        return extract_sentences(chunk, PROMPT_REGISTRY["summarize_chunk"].max_tokens), False
+
+def summarize_chunks(chunks):
+    """Map step: partial summaries for `chunks`, from the chunk cache or generated in parallel."""
+    cache = _chunk_cache.get()
+    keys = [_chunk_key(chunk) for chunk in chunks]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    SUMMARY_CHUNKS.inc(len(chunks) - len(missing), result="cached")
+    SUMMARY_CHUNKS.inc(len(missing), result="generated")
+    if not missing:
+        return results
+
+    if len(missing) == 1:
+        generated = [_summarize_chunk(chunks[missing[0]])]
+    else:
+        # Each chunk runs in a copy of the caller's context, so it is scheduled as the caller's request
+        pool = _pool.get()
+        futures = [pool.submit(contextvars.copy_context().run, _summarize_chunk, chunks[i]) for i in missing]
+        generated = [future.result() for future in futures]
+    for i, (summary, cacheable) in zip(missing, generated):
+        results[i] = summary
+        if cacheable:
+            cache.set(keys[i], summary)
+    return results
+
+def reduce_text(text, chunk_tokens=SUMMARY_CHUNK_TOKENS, max_levels=SUMMARY_MAX_LEVELS):
+    """
+    Replaces `text` by its joined partial summaries until it fits in one chunk.
+
+    Returns the text for the final `summary` pass.
+    """
+    for level in range(max_levels):
+        if estimate_tokens(text) <= chunk_tokens:
+            break
+        chunks = split_for_map(text, chunk_tokens)
+        with stage("summary_map", level=level, chunks=len(chunks)):
+            text = "\n\n".join(s for s in summarize_chunks(chunks) if s)
+    return text
+
+def summary_input(text, mode="auto"):
+    """The text to send to the `summary` prompt for `mode` (see the module docstring)."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown summary mode '{mode}'. Available: {', '.join(MODES)}")
+    if mode == "single" or (mode == "auto" and estimate_tokens(text) <= SUMMARY_SINGLE_PASS_TOKENS):
+        return text
+    return reduce_text(text)
+
+def summarize(text, mode="auto"):
+    """Summarizes `text`. Raises LLMError if the final pass fails."""
+    return generate("summary", context_vars={"text": summary_input(text, mode)})
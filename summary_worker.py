@@ -0,0 +1,311 @@
+"""
+Background batch summarization of the article collection.
+
+Summaries are generated with the `summary` prompt and stored in a side
+collection keyed by the article `_id`, together with a hash of the text they
+were generated from. The API routes can then serve a summary with a single
+`_id` lookup instead of calling Gemini on the request path.
+
+Run once (full scan on first run, then incremental):
+    python summary_worker.py
+Keep running and follow changes:
+    python summary_worker.py --watch
+"""
+import argparse
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from llm_resilience import LLMError
+from llm_scheduler import request_context
+from llm_service import generate, generate_async
+
+# Only the fields the summary is generated from
+SUMMARY_SOURCE_PROJECTION = {"title": 1, "meta.description": 1}
+WORKER_STATE_ID = "summary_worker"
+
+def summary_source_text(article):
+    """The text an article's summary is generated from."""
+    title = article.get("title", "")
+    meta_desc = (article.get("meta") or {}).get("description", "")
+    return f"{title} {meta_desc}".strip()
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def summary_is_fresh(stored, article):
+    """Whether a stored summary document was generated from `article`'s current text."""
+    return bool(stored) and stored.get("content_hash") == content_hash(summary_source_text(article))
+
+def batch_concurrency(value, limit):
+    """
+    Parallelism for a `/summarize/batch` request: `value` capped at `limit`, or `limit` if not given.
+
+    Raises ValueError unless `value` is a positive integer.
+    """
+    if value is None:
+        return limit
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit() or int(value) < 1:
+        raise ValueError("concurrency must be a positive integer")
+    return min(int(value), limit)
+
+def generate_summary(text):
+    """Summarizes `text`, returning None if the model call failed."""
+    try:
+        with request_context(priority="background", client="summary_worker"):
+            return generate("summary", context_vars={"text": text})
+    except LLMError as e:
+        logging.warning(f"Summary generation failed: {e}")
+        return None
+
+class SummaryStore:
+    """Precomputed summaries in a side collection, one document per article `_id`."""
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, article_id):
+        return self.collection.find_one({"_id": article_id})
+
+    def get_fresh(self, article):
+        """Returns the stored summary for `article` if it matches the article's current text."""
+        stored = self.get(article["_id"])
+        return stored if summary_is_fresh(stored, article) else None
+
+    def get_many(self, article_ids):
+        """Returns {article_id: stored document} for the ids that have a stored summary."""
+        return {doc["_id"]: doc for doc in self.collection.find({"_id": {"$in": article_ids}})}
+
+    def hashes(self, article_ids):
+        cursor = self.collection.find({"_id": {"$in": article_ids}}, {"content_hash": 1})
+        return {doc["_id"]: doc.get("content_hash") for doc in cursor}
+
+    def put(self, article_id, title, summary, digest):
+        self.collection.update_one({"_id": article_id}, {"$set": self._fields(title, summary, digest)}, upsert=True)
+
+    @staticmethod
+    def _fields(title, summary, digest):
+        return {
+            "title": title,
+            "summary": summary,
+            "content_hash": digest,
+            "summarized_at": datetime.now(timezone.utc),
+        }
+
+def get_or_create_summary(store, article):
+    """
+    Returns the stored summary for `article`, generating and storing it if missing or stale.
+
+    Raises LLMError if the summary had to be generated and the model call failed.
+    """
+    stored = store.get_fresh(article)
+    if stored:
+        return stored["summary"]
+    return create_summary(store, article)
+
+def create_summary(store, article):
+    """Generates and stores a summary for `article`. Raises LLMError if the model call failed."""
+    text = summary_source_text(article)
+    summary = generate("summary", context_vars={"text": text})
+    store.put(article["_id"], article.get("title", ""), summary, content_hash(text))
+    return summary
+
+class AsyncSummaryStore(SummaryStore):
+    """`SummaryStore` on an async collection (see article_repository.create_async_client)."""
+    async def get(self, article_id):
+        return await self.collection.find_one({"_id": article_id})
+
+    async def get_fresh(self, article):
+        stored = await self.get(article["_id"])
+        return stored if summary_is_fresh(stored, article) else None
+
+    async def get_many(self, article_ids):
+        return {doc["_id"]: doc async for doc in self.collection.find({"_id": {"$in": article_ids}})}
+
+    async def hashes(self, article_ids):
+        cursor = self.collection.find({"_id": {"$in": article_ids}}, {"content_hash": 1})
+        return {doc["_id"]: doc.get("content_hash") async for doc in cursor}
+
+    async def put(self, article_id, title, summary, digest):
+        await self.collection.update_one({"_id": article_id}, {"$set": self._fields(title, summary, digest)}, upsert=True)
+
+async def get_or_create_summary_async(store, article):
+    """Async variant of `get_or_create_summary` for an `AsyncSummaryStore`."""
+    stored = await store.get_fresh(article)
+    if stored:
+        return stored["summary"]
+    return await create_summary_async(store, article)
+
+async def create_summary_async(store, article):
+    """Async variant of `create_summary`. Raises LLMError if the model call failed."""
+    text = summary_source_text(article)
+    summary = await generate_async("summary", context_vars={"text": text})
+    await store.put(article["_id"], article.get("title", ""), summary, content_hash(text))
+    return summary
+
+class SummaryWorker:
+    """
+    Scans the article collection and keeps the SummaryStore up to date.
+
+    Articles are only re-summarized when the hash of their title and meta
+    description changes. If a `state` collection is given, the highest
+    `version_field` (ARTICLE_VERSION_FIELD) seen is saved as a watermark so
+    later runs only scan newer documents; an index on that field keeps the
+    query cheap.
+    """
+    def __init__(self, articles, store, state=None, concurrency=4, batch_size=100, summarize=generate_summary,
+                 version_field="updatedAt"):
+        self.articles = articles
+        self.store = store
+        self.state = state
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.summarize = summarize
+        self.version_field = version_field
+
+    def run_once(self, full=False):
+        """Processes all articles changed since the watermark (or every article if `full`)."""
+        watermark = None if full else self._load_watermark()
+        query = {self.version_field: {"$gt": watermark}} if watermark is not None else {}
+        cursor = self.articles.find(query, {**SUMMARY_SOURCE_PROJECTION, self.version_field: 1})
+        if watermark is not None:
+            cursor = cursor.sort(self.version_field, 1)
+
+        totals = {"scanned": 0, "summarized": 0, "unchanged": 0, "failed": 0}
+        # Highest version that is safe to resume from; stops advancing after the first failure
+        # in sorted (incremental) mode so failed articles are retried on the next pass
+        safe_watermark = None
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            batch = []
+            for article in cursor:
+                batch.append(article)
+                if len(batch) >= self.batch_size:
+                    safe_watermark = self._run_batch(batch, pool.map, totals, safe_watermark)
+                    batch = []
+            if batch:
+                safe_watermark = self._run_batch(batch, pool.map, totals, safe_watermark)
+
+        if safe_watermark is not None and (watermark is not None or not totals["failed"]):
+            self._save_watermark(safe_watermark)
+        logging.info(f"Summary worker pass finished: {totals}")
+        return totals
+
+    def _run_batch(self, batch, map_fn, totals, safe_watermark):
+        already_failed = totals["failed"] > 0
+        counts = self._process(batch, map_fn)
+        for key, value in counts.items():
+            totals[key] += value
+        if already_failed or counts["failed"]:
+            return safe_watermark
+        updated = [a[self.version_field] for a in batch if a.get(self.version_field) is not None]
+        if updated and (safe_watermark is None or max(updated) > safe_watermark):
+            return max(updated)
+        return safe_watermark
+
+    def watch(self, poll_interval=30):
+        """Runs forever, following a change stream or polling the watermark if streams are unavailable."""
+        self.run_once()
+        while True:
+            try:
+                self._follow_changes()
+            except OperationFailure as e:
+                # Change streams need a replica set; fall back to polling the watermark
+                logging.warning(f"Change stream unavailable ({e}); polling every {poll_interval}s.")
+                break
+            except PyMongoError as e:
+                # Lost connection or failover: catch up on what the stream missed, then reopen it
+                logging.warning(f"Change stream interrupted ({e}); reopening in {poll_interval}s.")
+                time.sleep(poll_interval)
+                self._run_logged()
+        while True:
+            time.sleep(poll_interval)
+            self._run_logged()
+
+    def _follow_changes(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        with self.articles.watch(pipeline, full_document="updateLookup") as stream:
+            logging.info("Following article change stream.")
+            for change in stream:
+                article = change.get("fullDocument")
+                if article:
+                    self._process([article], map)
+
+    def _run_logged(self):
+        """`run_once` that outlives a database outage; the next pass retries."""
+        try:
+            self.run_once()
+        except PyMongoError as e:
+            logging.warning(f"Summary worker pass failed: {e}")
+
+    def _process(self, articles, map_fn):
+        counts = {"scanned": len(articles), "summarized": 0, "unchanged": 0, "failed": 0}
+        stored_hashes = self.store.hashes([a["_id"] for a in articles])
+
+        pending = []
+        for article in articles:
+            text = summary_source_text(article)
+            digest = content_hash(text)
+            if not text or stored_hashes.get(article["_id"]) == digest:
+                counts["unchanged"] += 1
+            else:
+                pending.append((article, text, digest))
+
+        summaries = map_fn(self.summarize, [text for _, text, _ in pending])
+        for (article, _, digest), summary in zip(pending, summaries):
+            if summary is None:
+                counts["failed"] += 1
+            else:
+                self.store.put(article["_id"], article.get("title", ""), summary, digest)
+                counts["summarized"] += 1
+        return counts
+
+    def _load_watermark(self):
+        if self.state is None:
+            return None
+        doc = self.state.find_one({"_id": WORKER_STATE_ID})
+        return doc.get("watermark") if doc else None
+
+    def _save_watermark(self, value):
+        if self.state is None:
+            return
+        current = self._load_watermark()
+        if current is None or value > current:
+            self.state.update_one({"_id": WORKER_STATE_ID}, {"$set": {"watermark": value}}, upsert=True)
+
+def summary_collection_name(collection_name):
+    return os.getenv("SUMMARY_COLLECTION_NAME") or f"{collection_name}_summaries"
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from article_repository import ARTICLE_VERSION_FIELD, create_client
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Precompute article summaries.")
+    parser.add_argument("--full", action="store_true", help="Ignore the watermark and check every article.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and summarize articles as they change.")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("SUMMARY_WORKER_CONCURRENCY", "4")))
+    parser.add_argument("--poll-interval", type=float, default=30)
+    args = parser.parse_args()
+
+    collection_name = os.getenv("COLLECTION_NAME")
+    client = create_client(os.getenv("MONGO_URI"))
+    db = client[os.getenv("DATABASE_NAME")]
+    summaries = db[summary_collection_name(collection_name)]
+
+    worker = SummaryWorker(
+        db[collection_name],
+        SummaryStore(summaries),
+        state=db[f"{summaries.name}_state"],
+        concurrency=args.concurrency,
+        version_field=ARTICLE_VERSION_FIELD,
+    )
+    if args.watch:
+        worker.watch(poll_interval=args.poll_interval)
+    else:
+        worker.run_once(full=args.full)
@@ -1,25 +1,35 @@
 from flask import Flask, request, jsonify
-from pymongo import MongoClient
 from bson import ObjectId
-from llm_service import call_gemini
+from article_repository import create_client, create_repository
+from lazy import ProcessLocal
+from llm_scheduler import scope_flask
+from metrics import instrument_flask, stage
+from llm_resilience import LLMError
+from summary_worker import SummaryStore, get_or_create_summary, summary_collection_name
 from dotenv import load_dotenv
 import os
 app = Flask(__name__)
+instrument_flask(app, "summaryapi")
+# Priority and fair-share flow of the LLM calls made for each request
+scope_flask(app)
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
-# MongoDB setup (adjust URI and db/collection names as needed)
-client = MongoClient(MONGO_URI,tlsAllowInvalidCertificates=True)
-db = client[DATABASE_NAME]
-mycol = db[COLLECTION_NAME]
+# MongoDB setup (adjust URI and db/collection names as needed); connects on first use
+_db = ProcessLocal(lambda: create_client(MONGO_URI)[DATABASE_NAME])
+_summary_store = ProcessLocal(lambda: SummaryStore(_db.get()[summary_collection_name(COLLECTION_NAME)]))
+# Cached reads of the title and meta description only
+_articles = ProcessLocal(lambda: create_repository(get_collection()))
 
-print(mycol.find_one())  # Debugging line to check if connection works
+def get_collection():
+    return _db.get()[COLLECTION_NAME]
 
 def get_article_by_id(article_id):
     try:
         print(ObjectId(article_id))
-        article = mycol.find_one({"_id": ObjectId(article_id)})
+        with stage("get_article_by_id", article_id=str(article_id)):
+            article = _articles.get().get(article_id, view="summary")
         print("Article fetched:", article)  # Debugging line
         return article
     except Exception:
@@ -40,8 +50,11 @@ def summarize_article():
     title = article.get("title", "")
     meta_desc = article.get("meta", {}).get("description", "")
 
-    # Summarize meta description
-    summary_meta = call_gemini("summary", context_vars={"text":title+meta_desc}) if meta_desc else ""
+    # Serve the summary stored by summary_worker.py while it matches the current title and description
+    try:
+        summary_meta = get_or_create_summary(_summary_store.get(), article) if meta_desc else ""
+    except LLMError as e:
+        return jsonify({"error": f"Summary generation failed: {e}"}), e.status_code
 
     response = {
         "title": title,
@@ -50,4 +63,6 @@ def summarize_article():
     return jsonify(response)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8001, debug=True)
\ No newline at end of file
+    print(get_collection().find_one())  # Debugging line to check if connection works
+    # The debugger and reloader are opt-in (FLASK_DEBUG=true); never enable them in production
+    app.run(host="0.0.0.0", port=8001, debug=os.getenv("FLASK_DEBUG", "false").lower() == "true", threaded=True)
\ No newline at end of file
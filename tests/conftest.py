@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# Tests never call Gemini: the fake backend answers instantly unless a test sets a latency
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY", "fixed:0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class AsyncCollection:
+    """Just enough of PyMongo's async collection over a mongomock one."""
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+    async def find(self, *args, **kwargs):
+        for document in self.collection.find(*args, **kwargs):
+            yield document
+
+    async def update_one(self, *args, **kwargs):
+        return self.collection.update_one(*args, **kwargs)
+
+@pytest.fixture
+def async_collection():
+    return AsyncCollection
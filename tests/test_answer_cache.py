@@ -0,0 +1,70 @@
+import pytest
+
+from answer_cache import SemanticAnswerCache
+
+QUESTION = "What is the main takeaway of the article?"
+ANSWER = "Weekly moderation reviews kept the forum healthy."
+
+def test_paraphrase_hits_above_the_threshold():
+    cache = SemanticAnswerCache(threshold=0.85)
+    cache.put("doc", QUESTION, ANSWER)
+    match = cache.lookup("doc", "What's the key point?")
+    assert match is not None
+    assert match.answer == ANSWER and match.question == QUESTION and match.score >= 0.85
+    assert cache.lookup("doc", "Who wrote the article?") is None
+    assert cache.lookup("other-doc", QUESTION) is None
+
+@pytest.mark.parametrize("cached, asked", [
+    ("What happened in 2020?", "What happened in 2021?"),                       # Different numbers
+    ("Does the article mention moderation?", "Does the article not mention moderation?"),  # Negation
+    ("When was the forum founded?", "Why was the forum founded?"),              # Question word
+])
+def test_incompatible_questions_never_match(cached, asked):
+    # With no similarity threshold, only the guards keep these apart
+    cache = SemanticAnswerCache(threshold=0.0)
+    cache.put("doc", cached, ANSWER)
+    assert cache.lookup("doc", asked) is None
+    assert cache.lookup("doc", cached).answer == ANSWER
+
+def test_question_without_a_question_word_fits_any():
+    cache = SemanticAnswerCache()
+    cache.put("doc", QUESTION, ANSWER)
+    assert cache.lookup("doc", "main takeaway?").answer == ANSWER
+
+def test_least_recently_used_question_is_evicted_per_document():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.put("doc", "Who founded the forum?", "Two volunteers.")
+    cache.put("doc", "Where is the meetup held?", "At the library.")
+    cache.put("other-doc", "How many members joined?", "Four hundred.")
+    assert cache.lookup("doc", "Who founded the forum?") is not None
+    cache.put("doc", "When are posts reviewed?", "Every Monday.")
+    assert cache.lookup("doc", "Where is the meetup held?") is None
+    assert cache.lookup("doc", "Who founded the forum?").answer == "Two volunteers."
+    assert cache.lookup("doc", "When are posts reviewed?").answer == "Every Monday."
+    # Other documents keep their own entries
+    assert cache.lookup("other-doc", "How many members joined?").answer == "Four hundred."
+    assert cache.stats()["entries"] == 3
+
+def test_least_recently_used_document_is_evicted():
+    cache = SemanticAnswerCache(max_documents=2)
+    for doc in ("a", "b"):
+        cache.put(doc, QUESTION, ANSWER)
+    cache.lookup("a", QUESTION)
+    cache.put("c", QUESTION, ANSWER)
+    assert cache.lookup("b", QUESTION) is None
+    assert cache.lookup("a", QUESTION) is not None
+
+def test_audit_replaces_the_answer_on_disagreement():
+    cache = SemanticAnswerCache()
+    cache.put("doc", QUESTION, ANSWER)
+    asked = "What's the key point?"
+    match = cache.lookup("doc", asked)
+
+    assert cache.audit("doc", asked, match, "Weekly moderation reviews keep the forum healthy.") is True
+    assert cache.lookup("doc", asked).question == QUESTION
+
+    fresh = "Paid staff replaced the volunteer moderators in March."
+    assert cache.audit("doc", asked, match, fresh) is False
+    # The fresh answer is now the closest match for this wording
+    match = cache.lookup("doc", asked)
+    assert (match.answer, match.question) == (fresh, asked)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+from article_repository import ArticleCache, ArticleRepository, AsyncArticleRepository, json_default
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_json_default_matches_the_flask_services():
+    from flask import Flask
+    from mongodb_api import MongoJSONProvider
+
+    document = {
+        "_id": ObjectId("6650f0000000000000000000"),
+        "publishedAt": datetime(2024, 5, 1, 12, 30),
+        "localTime": datetime(2024, 5, 1, 12, 30, tzinfo=timezone(timedelta(hours=2))),
+        "day": date(2024, 5, 1),
+        "tags": ["a", "b"],
+    }
+    flask_json = MongoJSONProvider(Flask(__name__)).dumps(document)
+    assert json.loads(flask_json) == json.loads(json.dumps(document, default=json_default))
+    assert json.loads(flask_json)["_id"] == "6650f0000000000000000000"
+
+def test_asgi_server_does_not_import_flask():
+    env = {**os.environ, "MONGO_URI": "mongodb://10.255.255.1:27017", "DATABASE_NAME": "test", "COLLECTION_NAME": "articles"}
+    probe = "import sys, server; print('flask' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "False"
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+@pytest.fixture
+def articles():
+    return mongomock.MongoClient().db.articles
+
+@pytest.mark.parametrize("versioned", [True, False], ids=["with-updatedAt", "without-updatedAt"])
+def test_polling_invalidates_updated_articles(articles, caplog, versioned):
+    first = {"title": "Old title", "content": "Text"}
+    if versioned:
+        first["updatedAt"] = utcnow() - timedelta(days=1)
+    oid = articles.insert_one(first).inserted_id
+    repository = ArticleRepository(articles, ArticleCache(100, ttl=300), invalidation="poll", poll_interval=0.05)
+    try:
+        with caplog.at_level(logging.WARNING):
+            assert repository.get(oid)["title"] == "Old title"
+            time.sleep(0.1)
+        # Without any updatedAt yet, polling starts from its own start time and says so
+        assert any("No article has 'updatedAt'" in r.message for r in caplog.records) is not versioned
+
+        articles.update_one({"_id": oid}, {"$set": {"title": "New title", "updatedAt": utcnow()}})
+        assert wait_for(lambda: repository.get(oid)["title"] == "New title")
+    finally:
+        repository.close()
+
+def test_async_polling_invalidates_updated_articles(articles, async_collection):
+    oid = articles.insert_one({"title": "Old title"}).inserted_id
+    repository = AsyncArticleRepository(
+        async_collection(articles), ArticleCache(100, ttl=300), invalidation="poll", poll_interval=0.05
+    )
+
+    async def scenario():
+        assert (await repository.get(oid))["title"] == "Old title"
+        await asyncio.sleep(0.1)
+        articles.update_one({"_id": oid}, {"$set": {"title": "New title", "updatedAt": utcnow()}})
+        for _ in range(100):
+            if (await repository.get(oid))["title"] == "New title":
+                return True
+            await asyncio.sleep(0.02)
+        return False
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        repository.close()
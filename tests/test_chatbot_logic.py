@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+
+import chatbot_logic
+import llm_service
+from answer_cache import SemanticAnswerCache
+from chatbot_logic import ArticleWriterModule, get_bot_response, get_bot_response_async, stream_bot_response_async
+from llm_backends import FakeModel
+
+ARTICLE = "Moderators review reported posts every week and publish a summary for members. " * 80
+
+class RecordingRetriever:
+    """Records the thread each retrieval runs on."""
+    def __init__(self):
+        self.threads = []
+
+    def context_for(self, text, question):
+        self.threads.append(threading.get_ident())
+        return text[:200]
+
+@pytest.fixture
+def qa(monkeypatch):
+    model = FakeModel()
+    llm_service.set_model(model)
+    retriever = RecordingRetriever()
+    cache = SemanticAnswerCache()
+    lookups = []
+    lookup = cache.lookup
+
+    def recording_lookup(doc_key, question):
+        lookups.append(threading.get_ident())
+        return lookup(doc_key, question)
+
+    monkeypatch.setattr(cache, "lookup", recording_lookup)
+    monkeypatch.setattr(chatbot_logic, "RAG_ENABLED", True)
+    monkeypatch.setattr(chatbot_logic, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(chatbot_logic.retriever, "get", lambda: retriever)
+    monkeypatch.setattr(chatbot_logic.answer_cache, "get", lambda: cache)
+    return model, retriever, cache, lookups
+
+def test_async_question_does_retrieval_and_cache_lookup_off_the_loop(qa):
+    model, retriever, cache, lookups = qa
+
+    async def ask(question):
+        return threading.get_ident(), await get_bot_response_async(question, ARTICLE, ArticleWriterModule(speculative=False))
+
+    loop_thread, first = asyncio.run(ask("How often are reported posts reviewed?"))
+    assert retriever.threads and loop_thread not in retriever.threads
+    assert lookups and loop_thread not in lookups
+    assert cache.stats()["entries"] == 1
+
+    # The same question again is answered from the cache, still off the loop and without the model
+    calls = model.calls
+    loop_thread, second = asyncio.run(ask("How often are reported posts reviewed?"))
+    assert second == first
+    assert model.calls == calls
+    assert len(lookups) == 2 and loop_thread not in lookups
+    assert cache.stats()["entries"] == 1
+
+def test_cached_answer_is_served_by_every_path(qa):
+    model, retriever, cache, lookups = qa
+    question = "Who publishes the weekly summary?"
+    answer = get_bot_response(question, ARTICLE, ArticleWriterModule(speculative=False))
+    calls = model.calls
+
+    async def stream():
+        return "".join([chunk async for chunk in stream_bot_response_async(question, ARTICLE, ArticleWriterModule(speculative=False))])
+
+    assert get_bot_response(question, ARTICLE, ArticleWriterModule(speculative=False)) == answer
+    assert asyncio.run(stream()) == answer
+    assert model.calls == calls
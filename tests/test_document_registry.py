@@ -0,0 +1,35 @@
+import asyncio
+
+import fakeredis
+from fastapi.testclient import TestClient
+
+import api
+from document_registry import MemoryDocumentRegistry, RedisDocumentRegistry, document_id
+
+TEXT = "Moderators review reported posts every week."
+
+def test_redis_registry_round_trip_and_ttl():
+    client = fakeredis.FakeRedis()
+    registry = RedisDocumentRegistry(client, ttl=60)
+    doc_id = registry.register(TEXT)
+    assert doc_id == document_id(TEXT) == MemoryDocumentRegistry().register(TEXT)
+    client.expire(registry.prefix + doc_id, 5)
+    assert registry.get(doc_id) == TEXT
+    assert client.ttl(registry.prefix + doc_id) > 5
+    assert registry.get("missing") is None
+
+def test_chat_reads_redis_documents_off_the_event_loop(monkeypatch):
+    on_loop = []
+
+    class RecordingRedis(fakeredis.FakeRedis):
+        def execute_command(self, *args, **kwargs):
+            on_loop.append(asyncio._get_running_loop() is not None)
+            return super().execute_command(*args, **kwargs)
+
+    registry = RedisDocumentRegistry(RecordingRedis(), ttl=60)
+    doc_id = registry.register(TEXT)
+    on_loop.clear()
+    monkeypatch.setattr(api.DOCUMENTS, "get", lambda: registry)
+    response = TestClient(api.app).post("/chat", json={"session_id": "doc-1", "message": "How often are posts reviewed?", "doc_id": doc_id})
+    assert response.status_code == 200
+    assert on_loop and not any(on_loop)
@@ -0,0 +1,26 @@
+import pytest
+
+from intent_classifier import LocalIntentClassifier, TRAINING_EXAMPLES
+
+@pytest.fixture(scope="module")
+def classifier():
+    return LocalIntentClassifier()
+
+def test_training_examples_are_classified_as_labelled(classifier):
+    wrong = [
+        (text, intent, classifier.classify(text).name)
+        for intent, texts in TRAINING_EXAMPLES.items() for text in texts
+        if classifier.classify(text).name != intent
+    ]
+    assert wrong == []
+
+@pytest.mark.parametrize("message, intent", [
+    ("Can you give me a summary of the article?", "summary"),
+    ("summarize this please", "summary"),
+    ("tl;dr", "summary"),
+    ("what does the summary say about pricing", "qa"),
+    ("ok thanks, bye", "goodbye"),
+    ("great, thank you", "thanks"),
+])
+def test_request_phrasing_decides_the_intent(classifier, message, intent):
+    assert classifier.classify(message).name == intent
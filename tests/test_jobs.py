@@ -0,0 +1,105 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from jobs import JobQueue, JobWorker, QueueFull, validate_callback_url
+
+CONTEXT = {"text": "Moderators review reported posts every week.", "question": "How often are posts reviewed?"}
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_queued=2, lease=30, max_attempts=2)
+    yield queue
+    queue.close()
+
+def expire_lease(queue, job_id):
+    """What the queue sees once a worker died: a running job nobody renewed."""
+    queue._conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+
+def test_submit_raises_queue_full(queue):
+    queue.submit("question_answering", CONTEXT)
+    queue.submit("question_answering", CONTEXT)
+    with pytest.raises(QueueFull):
+        queue.submit("question_answering", CONTEXT)
+    assert queue.depth() == 2
+    # Claimed jobs no longer count against the limit
+    queue.claim()
+    queue.submit("question_answering", CONTEXT)
+
+def test_chat_answers_429_when_the_queue_is_full(queue, monkeypatch):
+    async def submit_bot_response_async(user_msg, text, writer_module, submit):
+        return None, submit(SimpleNamespace(prompt_key="question_answering", context_vars=CONTEXT, prefix=""))
+
+    monkeypatch.setattr(api, "submit_bot_response_async", submit_bot_response_async)
+    monkeypatch.setattr(api.JOBS, "get", lambda: queue)
+    client = TestClient(api.app)
+    body = {"session_id": "jobs-1", "message": "Write the article", "text": CONTEXT["text"], "job": True}
+    assert client.post("/chat", json=body).status_code == 202
+    assert client.post("/chat", json=body).status_code == 202
+    response = client.post("/chat", json=body)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"]
+
+def test_expired_lease_is_claimed_again_up_to_max_attempts(queue):
+    job_id = queue.submit("question_answering", CONTEXT)["job_id"]
+    first = queue.claim()
+    assert first["id"] == job_id and first["attempts"] == 1
+    assert queue.claim() is None  # Leased to the first worker
+
+    expire_lease(queue, job_id)
+    second = queue.claim()
+    assert second["id"] == job_id and second["attempts"] == 2
+    # The first worker lost the job: it is told to stop and cannot record an outcome
+    assert queue.renew(job_id, 1, 10) is True
+    assert queue.finish(job_id, 1, "succeeded", result="late") is None
+
+    expire_lease(queue, job_id)
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2
+    assert "Worker stopped" in job["error"]
+
+def test_cancel_a_queued_job(queue):
+    job_id = queue.submit("question_answering", CONTEXT)["job_id"]
+    assert queue.cancel(job_id)["status"] == "cancelled"
+    assert queue.claim() is None
+    assert queue.cancel("missing") is None
+
+def test_cancel_a_running_job(queue):
+    job_id = queue.submit("question_answering", CONTEXT)["job_id"]
+    job = queue.claim()
+    cancelled = queue.cancel(job_id)
+    assert cancelled["status"] == "running" and cancelled["cancel_requested"]
+    # The worker learns on its next renewal and records the cancellation
+    assert queue.renew(job_id, job["attempts"], 5) is True
+    assert queue.finish(job_id, job["attempts"], "cancelled")["status"] == "cancelled"
+
+def test_cancelled_job_of_a_dead_worker_is_not_run_again(queue):
+    job_id = queue.submit("question_answering", CONTEXT)["job_id"]
+    queue.claim()
+    queue.cancel(job_id)
+    expire_lease(queue, job_id)
+    assert queue.claim() is None
+    assert queue.get(job_id)["status"] == "cancelled"
+
+def test_worker_runs_a_job(queue):
+    job_id = queue.submit("question_answering", CONTEXT, prefix="Answer: ")["job_id"]
+    assert JobWorker(queue).run_once() is True
+    job = queue.get(job_id)
+    assert job["status"] == "succeeded"
+    assert job["response"].startswith("Answer: ") and len(job["response"]) > len("Answer: ")
+
+def test_validate_callback_url():
+    validate_callback_url("https://hooks.example.com/done", allowed_hosts="hooks.example.com")
+    validate_callback_url("http://anything.test/x", allowed_hosts="*")
+    for url, hosts in [
+        ("https://hooks.example.com/done", ""),               # Callbacks disabled
+        ("ftp://hooks.example.com/done", "hooks.example.com"),
+        ("https:///done", "hooks.example.com"),
+        ("https://evil.example.com/done", "hooks.example.com"),
+    ]:
+        with pytest.raises(ValueError):
+            validate_callback_url(url, allowed_hosts=hosts)
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+import llm_service
+from llm_backends import FakeModel
+from llm_cache import ResponseCache, SQLiteCache
+from llm_resilience import ResilientCaller, RetryPolicy
+from llm_scheduler import NullScheduler
+
+def value(n=249):
+    return "x" * n
+
+def stored_bytes(cache):
+    return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+def keys(cache):
+    return {row[0] for row in cache._conn.execute("SELECT key FROM llm_cache")}
+
+def test_response_cache_is_abstract():
+    with pytest.raises(TypeError):
+        ResponseCache()
+
+def test_sqlite_running_total_tracks_the_table(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SQLiteCache(path, max_bytes=1000)
+    assert cache._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    cache.set("a", value())
+    cache.set("b", value())
+    cache.set("a", value(99))  # Replacing a row counts its new size only
+    assert cache.current_bytes == stored_bytes(cache) == 350
+    for key in "cdefg":
+        cache.set(key, value())
+    assert cache.current_bytes == stored_bytes(cache) <= 1000
+    assert SQLiteCache(path, max_bytes=1000).current_bytes == cache.current_bytes
+
+def test_sqlite_eviction_counts_expired_rows_as_freed(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_bytes=1100)
+    for key in "abcd":
+        cache.set(key, value())
+    # The most recently used row has expired; dropping it frees enough room
+    cache._conn.execute("UPDATE llm_cache SET expires_at = 1 WHERE key = 'd'")
+    cache._conn.commit()
+    cache.set("e", value())
+    assert keys(cache) == {"a", "b", "c", "e"}
+    assert cache.current_bytes == stored_bytes(cache) == 1000
+
+def test_sqlite_hits_update_recency_without_a_write_per_hit(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_bytes=600)
+    cache.set("a", value())
+    cache.set("b", value())
+    (before,) = cache._conn.execute("SELECT accessed_at FROM llm_cache WHERE key = 'a'").fetchone()
+    assert cache.get("a") == value()
+    assert cache._conn.execute("SELECT accessed_at FROM llm_cache WHERE key = 'a'").fetchone()[0] == before
+    # The deferred access time is written with the next insert, so "b" is the least recently used
+    cache.set("c", value())
+    assert keys(cache) == {"a", "c"}
+
+def test_async_calls_use_a_sqlite_cache_off_the_event_loop(tmp_path):
+    on_loop = []
+
+    class RecordingCache(SQLiteCache):
+        def _get(self, key):
+            on_loop.append(asyncio._get_running_loop() is not None)
+            return super()._get(key)
+
+        def _set(self, key, value):
+            on_loop.append(asyncio._get_running_loop() is not None)
+            super()._set(key, value)
+
+    saved = llm_service._upstream.get(), llm_service._scheduler.get(), llm_service._response_cache.get()
+    model = FakeModel(latency="fixed:0")
+    llm_service.set_model(model)
+    llm_service._upstream.set(ResilientCaller(retry=RetryPolicy(max_retries=0)))
+    llm_service._scheduler.set(NullScheduler())
+    llm_service._response_cache.set(RecordingCache(str(tmp_path / "cache.sqlite3")))
+    try:
+        context = {"text": "Moderators review reported posts weekly.", "question": "How often are posts reviewed?"}
+        first = asyncio.run(llm_service.generate_async("question_answering", context))
+        assert asyncio.run(llm_service.generate_async("question_answering", context)) == first
+    finally:
+        llm_service.set_model(FakeModel())
+        llm_service._upstream.set(saved[0])
+        llm_service._scheduler.set(saved[1])
+        llm_service._response_cache.set(saved[2])
+    assert model.calls == 1
+    assert len(on_loop) == 3 and not any(on_loop)
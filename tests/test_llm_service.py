@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+
+import llm_service
+from llm_backends import FakeModel
+from llm_cache import create_cache
+from llm_resilience import LLMTimeoutError, ResilientCaller, RetryPolicy
+from llm_scheduler import NullScheduler
+
+@pytest.fixture
+def fake_llm():
+    saved = llm_service._upstream.get(), llm_service._scheduler.get(), llm_service._response_cache.get()
+    model = FakeModel(latency="fixed:0.2")
+    llm_service.set_model(model)
+    llm_service._upstream.set(ResilientCaller(retry=RetryPolicy(max_retries=0)))
+    llm_service._scheduler.set(NullScheduler())
+    llm_service._response_cache.set(create_cache("memory", 1 << 20))
+    yield model
+    llm_service.set_model(FakeModel())
+    llm_service._upstream.set(saved[0])
+    llm_service._scheduler.set(saved[1])
+    llm_service._response_cache.set(saved[2])
+
+def question(n):
+    return {"text": "The forum grew through weekly moderation reviews.", "question": f"What happened in week {n}?"}
+
+def test_async_calls_run_concurrently_on_one_loop(fake_llm):
+    async def scenario():
+        start = time.perf_counter()
+        replies = await asyncio.gather(*(llm_service.generate_async("question_answering", question(n)) for n in range(10)))
+        return replies, time.perf_counter() - start
+
+    replies, elapsed = asyncio.run(scenario())
+    assert len(set(replies)) == 10
+    assert fake_llm.calls == 10
+    # Ten 0.2s calls overlap instead of queueing behind each other
+    assert elapsed < 1.0
+
+def test_identical_async_calls_share_one_upstream_call(fake_llm):
+    async def scenario():
+        return await asyncio.gather(*(llm_service.generate_async("question_answering", question(0)) for _ in range(5)))
+
+    replies = asyncio.run(scenario())
+    assert len(set(replies)) == 1
+    assert fake_llm.calls == 1
+    assert asyncio.run(llm_service.generate_async("question_answering", question(0))) == replies[0]
+    assert fake_llm.calls == 1
+
+def test_async_timeout(fake_llm):
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(llm_service.generate_async("question_answering", question(1), timeout=0.05))
+    reply = asyncio.run(llm_service.call_gemini_async("question_answering", question(2), timeout=0.05))
+    assert llm_service.is_error_reply(reply)
+
+def test_async_request_plans_once_and_compacts_off_the_loop(fake_llm, monkeypatch):
+    plans, on_loop = [], []
+    real_plan, real_compact = llm_service.plan, llm_service.compact
+
+    def counting_plan(*args):
+        plans.append(1)
+        return real_plan(*args)
+
+    def recording_compact(*args, **kwargs):
+        on_loop.append(asyncio._get_running_loop() is not None)
+        return real_compact(*args, **kwargs)
+
+    monkeypatch.setattr(llm_service, "plan", counting_plan)
+    monkeypatch.setattr(llm_service, "compact", recording_compact)
+    long_text = " ".join(f"Sentence {n} is about forum moderation and weekly reviews." for n in range(4000))
+    final_prompt, _, _ = asyncio.run(llm_service._build_request_async(
+        "question_answering", {"text": long_text, "question": "How often are reviews held?"}
+    ))
+    assert len(final_prompt) < len(long_text)
+    assert plans == [1]
+    assert on_loop == [False]
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from llm_resilience import (
+    CircuitBreaker, CircuitOpenError, LLMRateLimitError, LLMUnavailableError, LocalRateLimitError,
+    ResilientCaller, RetryPolicy, TokenBucket,
+)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class ServerError(Exception):
+    code = 503
+
+def flaky(failures, result="ok"):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ServerError("backend overloaded")
+        return result
+    fn.calls = calls
+    return fn
+
+def test_retries_a_retryable_error():
+    sleeps = []
+    caller = ResilientCaller(retry=RetryPolicy(max_retries=3, sleep=sleeps.append))
+    fn = flaky(2)
+    assert caller.call(fn) == "ok"
+    assert len(fn.calls) == 3
+    assert len(sleeps) == 2
+    assert caller.breaker.state == "closed"
+
+def test_breaker_opens_and_then_fails_fast():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    caller = ResilientCaller(breaker=breaker, retry=RetryPolicy(max_retries=5, sleep=lambda s: None))
+    fn = flaky(10)
+    with pytest.raises(CircuitOpenError):
+        caller.call(fn)
+    assert len(fn.calls) == 3
+    assert breaker.state == "open"
+
+    clock.now = 31
+    assert breaker.state == "half_open"
+    assert caller.call(flaky(0)) == "ok"
+    assert breaker.state == "closed"
+
+def test_local_rate_limit_is_not_retried():
+    clock = Clock()
+    sleeps = []
+    limiter = TokenBucket(rate=1, capacity=1, max_wait=0.5, clock=clock)
+    caller = ResilientCaller(limiter=limiter, retry=RetryPolicy(max_retries=3, sleep=sleeps.append))
+    fn = flaky(0)
+    assert caller.call(fn) == "ok"
+    with pytest.raises(LocalRateLimitError) as raised:
+        caller.call(fn)
+    assert isinstance(raised.value, LLMRateLimitError) and raised.value.status_code == 429
+    assert sleeps == []
+    assert len(fn.calls) == 1
+    assert caller.breaker.state == "closed"
+
+def test_async_retries_and_local_rate_limit():
+    clock = Clock()
+    sleeps = []
+
+    async def record(seconds):
+        sleeps.append(seconds)
+
+    limiter = TokenBucket(rate=1, capacity=2, max_wait=0.5, clock=clock)
+    caller = ResilientCaller(limiter=limiter, retry=RetryPolicy(max_retries=3, async_sleep=record))
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise LLMUnavailableError("try again")
+        return "ok"
+
+    assert asyncio.run(caller.call_async(fn)) == "ok"
+    assert len(sleeps) == 1
+    with pytest.raises(LocalRateLimitError):
+        asyncio.run(caller.call_async(fn))
+    assert len(sleeps) == 1
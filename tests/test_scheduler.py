@@ -0,0 +1,178 @@
+import asyncio
+import importlib.util
+import os
+import threading
+from argparse import Namespace
+
+import pytest
+
+import llm_service
+from llm_backends import FakeModel
+from llm_resilience import LLMTimeoutError
+from llm_scheduler import PRIORITY_WEIGHTS, FairScheduler, request_context
+from metrics import REGISTRY
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "bench_scheduler.py")
+
+def load_bench():
+    spec = importlib.util.spec_from_file_location("bench_scheduler", BENCH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def slow_model():
+    scheduler = llm_service._scheduler.get()
+    llm_service.set_model(FakeModel(latency="fixed:0.05"))
+    yield
+    llm_service.set_model(FakeModel())
+    llm_service._scheduler.set(scheduler)
+
+def dropped(priority, reason):
+    return REGISTRY.get_sample_value("llm_queue_dropped_total", {"priority": priority, "reason": reason}) or 0
+
+def test_interactive_p95_stays_bounded_under_batch_load(slow_model):
+    bench = load_bench()
+    args = Namespace(duration=1.5, concurrency=2, reserved=1, batch_threads=12, sessions=3, think=0.1)
+    fifo = bench.run("fifo", args)
+    fair = bench.run("fair", args)
+    assert fair["turns"] > 0 and fair["batch_rps"] > 0
+    # 0.05s per call: a chat turn waits for at most a few calls, not for the batch client's backlog
+    assert fair["p95"] < 0.25
+    assert fair["p95"] < fifo["p95"]
+
+def test_queued_call_past_its_deadline_is_dropped():
+    scheduler = FairScheduler(max_concurrency=1, max_wait=0)
+    before = dropped("batch", "deadline")
+    errors = []
+
+    def late_call():
+        with request_context(priority="batch", client="bulk", timeout=0.05):
+            try:
+                with scheduler.slot():
+                    pass
+            except LLMTimeoutError as e:
+                errors.append(e)
+
+    with scheduler.slot():
+        thread = threading.Thread(target=late_call)
+        thread.start()
+        thread.join()
+    assert len(errors) == 1
+    assert dropped("batch", "deadline") == before + 1
+    assert scheduler.stats()["running"] == 0
+    assert scheduler.stats()["waiting"]["batch"] == 0
+
+def test_slot_granted_as_the_wait_times_out_is_released(monkeypatch):
+    scheduler = FairScheduler(max_concurrency=1)
+    holder = scheduler.slot()
+    holder.__enter__()
+
+    class GrantedAtTimeout:
+        """The holder finishes, and the slot is granted, just as the wait gives up."""
+        def __init__(self):
+            self.flag = False
+
+        def set(self):
+            self.flag = True
+
+        def wait(self, timeout=None):
+            holder.__exit__(None, None, None)
+            assert self.flag
+            return False
+
+    monkeypatch.setattr("llm_scheduler.threading.Event", GrantedAtTimeout)
+    with pytest.raises(LLMTimeoutError):
+        with scheduler.slot():
+            pass
+    assert scheduler.stats()["running"] == 0
+
+def test_cancelled_while_queued_gives_up_its_place():
+    scheduler = FairScheduler(max_concurrency=1)
+    before = dropped("interactive", "cancelled")
+
+    async def scenario():
+        with scheduler.slot():
+            task = asyncio.create_task(enter(scheduler))
+            await asyncio.sleep(0)
+            assert scheduler.stats()["waiting"]["interactive"] == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert scheduler.stats() == {"running": 0, "waiting": dict.fromkeys(PRIORITY_WEIGHTS, 0), "flows": 1}
+
+    asyncio.run(scenario())
+    assert dropped("interactive", "cancelled") == before + 1
+
+def test_cancelled_after_the_grant_releases_the_slot():
+    scheduler = FairScheduler(max_concurrency=1)
+
+    async def scenario():
+        holder = scheduler.slot()
+        holder.__enter__()
+        task = asyncio.create_task(enter(scheduler))
+        await asyncio.sleep(0)
+        # Granted, but cancelled before the task resumes to take the slot
+        holder.__exit__(None, None, None)
+        assert scheduler.stats()["running"] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(scenario())
+
+async def enter(scheduler, priority="interactive", entered=None, name=None, done=None):
+    with request_context(priority=priority, client=name):
+        async with scheduler.slot_async():
+            if entered is not None:
+                entered.append(name)
+            if done is not None:
+                await done.wait()
+
+def test_reserved_slots_only_go_to_interactive_calls():
+    scheduler = FairScheduler(max_concurrency=2, reserved=1)
+
+    async def settle():
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def scenario():
+        entered = []
+        calls = {"batch-1": "batch", "batch-2": "batch", "chat": "interactive"}
+        done = {name: asyncio.Event() for name in calls}
+        tasks = {name: asyncio.create_task(enter(scheduler, priority, entered, name, done[name]))
+                 for name, priority in calls.items()}
+        try:
+            await settle()
+            # One batch call runs; the second would take the reserved slot, the chat call may
+            assert entered == ["batch-1", "chat"]
+            assert scheduler.stats()["waiting"]["batch"] == 1
+            done["batch-1"].set()
+            await settle()
+            assert entered == ["batch-1", "chat"]
+            done["chat"].set()
+            await settle()
+            assert entered == ["batch-1", "chat", "batch-2"]
+        finally:
+            for event in done.values():
+                event.set()
+            await asyncio.gather(*tasks.values())
+
+    asyncio.run(scenario())
+    assert scheduler.stats()["running"] == 0
+
+def test_idle_flows_are_pruned_past_max_flows():
+    scheduler = FairScheduler(max_concurrency=1, max_flows=3)
+    for client in ("a", "b", "c"):
+        with request_context(priority="interactive", client=client):
+            with scheduler.slot(cost=8):
+                pass
+    assert scheduler.stats()["flows"] == 3
+    # A busy flow moves virtual time past the finish tags of the idle ones
+    with request_context(priority="interactive", client="busy"):
+        for _ in range(10):
+            with scheduler.slot(cost=8):
+                pass
+    assert scheduler.stats()["flows"] == 1
+    assert list(scheduler._finish_tags) == [("interactive", "busy")]
@@ -0,0 +1,73 @@
+import asyncio
+
+import fakeredis
+import pytest
+import redis
+from fastapi.testclient import TestClient
+
+import api
+
+from session_store import MemorySessionStore, RedisSessionStore, create_session_store
+
+STATE = {"state": "awaiting_topic", "history": [{"role": "user", "text": "Écris un article"}], "article": None}
+
+@pytest.fixture
+def server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", classmethod(lambda cls, url: fakeredis.FakeRedis(server=server)))
+    return server
+
+def test_redis_round_trip_is_shared_between_workers(server):
+    first = create_session_store("redis", ttl=60, redis_url="redis://localhost:6379/0")
+    second = create_session_store("redis", ttl=60, redis_url="redis://localhost:6379/0")
+    assert isinstance(first, RedisSessionStore)
+    assert first.get("abc") is None
+    first.put("abc", STATE)
+    assert second.get("abc") == STATE
+    assert len(second) == 1
+    second.delete("abc")
+    assert first.get("abc") is None
+    assert len(first) == 0
+
+def test_redis_ttl_is_set_and_refreshed_on_read(server):
+    client = fakeredis.FakeRedis(server=server)
+    store = RedisSessionStore(client, ttl=60)
+    store.put("abc", STATE)
+    key = store.prefix + "abc"
+    assert 0 < client.ttl(key) <= 60
+    client.expire(key, 5)
+    assert store.get("abc") == STATE
+    assert client.ttl(key) > 5
+
+def test_redis_without_ttl_keeps_sessions(server):
+    client = fakeredis.FakeRedis(server=server)
+    store = RedisSessionStore(client, ttl=0)
+    store.put("abc", STATE)
+    assert store.get("abc") == STATE
+    assert client.ttl(store.prefix + "abc") == -1
+
+def test_memory_store_returns_copies_and_evicts_oldest():
+    store = MemorySessionStore(max_entries=2, ttl=60)
+    store.put("a", STATE)
+    store.get("a")["history"].append({"role": "bot", "text": "changed"})
+    assert store.get("a") == STATE
+    store.put("b", STATE)
+    store.put("c", STATE)
+    assert store.get("a") is None
+    assert len(store) == 2
+
+def test_api_keeps_redis_session_calls_off_the_event_loop(server, monkeypatch):
+    on_loop = []
+
+    class RecordingRedis(fakeredis.FakeRedis):
+        def execute_command(self, *args, **kwargs):
+            on_loop.append(asyncio._get_running_loop() is not None)
+            return super().execute_command(*args, **kwargs)
+
+    store = RedisSessionStore(RecordingRedis(server=server), ttl=60)
+    monkeypatch.setattr(api.SESSIONS, "get", lambda: store)
+    client = TestClient(api.app)
+    for message in ("Hi", "What is the article about?"):
+        response = client.post("/chat", json={"session_id": "redis-1", "message": message, "text": "A forum post."})
+        assert response.status_code == 200
+    assert on_loop and not any(on_loop)
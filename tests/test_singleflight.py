@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+N = 8
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+def run_threads(flight, fn):
+    results, errors = [], []
+
+    def caller():
+        try:
+            results.append(flight.do("key", fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(N)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+def test_concurrent_threads_make_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        # Hold the call open until every other thread has joined it
+        wait_for(lambda: flight.coalesced == N - 1)
+        return "reply"
+
+    results, errors = run_threads(flight, fn)
+    assert results == ["reply"] * N and not errors
+    assert len(calls) == 1
+    assert flight._calls == {}
+
+def test_threads_all_receive_the_error():
+    flight = SingleFlight()
+    error = RuntimeError("upstream down")
+
+    def fn():
+        wait_for(lambda: flight.coalesced == N - 1)
+        raise error
+
+    results, errors = run_threads(flight, fn)
+    assert not results
+    assert len(errors) == N and all(e is error for e in errors)
+    # The next call starts afresh
+    assert flight.do("key", lambda: "recovered") == "recovered"
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+def test_concurrent_tasks_make_one_call():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await release.wait()
+            return "reply"
+
+        tasks = [asyncio.ensure_future(flight.do("key", fn)) for _ in range(N)]
+        await settle()
+        release.set()
+        results = await asyncio.gather(*tasks)
+        return results, calls, flight
+
+    results, calls, flight = asyncio.run(scenario())
+    assert results == ["reply"] * N
+    assert len(calls) == 1 and flight.coalesced == N - 1
+    assert flight._tasks == {}
+
+def test_tasks_all_receive_the_error():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        error = RuntimeError("upstream down")
+
+        async def fn():
+            await release.wait()
+            raise error
+
+        tasks = [asyncio.ensure_future(flight.do("key", fn)) for _ in range(N)]
+        await settle()
+        release.set()
+        return error, await asyncio.gather(*tasks, return_exceptions=True)
+
+    error, outcomes = asyncio.run(scenario())
+    assert len(outcomes) == N and all(o is error for o in outcomes)
+
+def test_cancelling_a_waiter_leaves_the_shared_call_running():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await release.wait()
+            return "reply"
+
+        # The first caller started the call; it disconnects before the reply
+        leader = asyncio.ensure_future(flight.do("key", fn))
+        follower = asyncio.ensure_future(flight.do("key", fn))
+        await settle()
+        leader.cancel()
+        await settle()
+        try:
+            assert not flight._tasks["key"].cancelled()
+        finally:
+            release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, calls
+
+    reply, calls = asyncio.run(scenario())
+    assert reply == "reply"
+    assert len(calls) == 1
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+import speculation
+from metrics import REGISTRY
+from prompt_registry import PROMPT_REGISTRY
+from speculation import SpeculationCache, match_option, parse_options
+from token_budget import estimate_tokens
+
+# Not one the writer workflow speculates, so its chat tests do not move these counters
+PROMPT = "generate_titles"
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, {"prompt_key": PROMPT, **labels}) or 0
+
+def titles_vars(description):
+    return {"description": description}
+
+@pytest.fixture
+def fake_speculate(monkeypatch):
+    """Speculations return at once, except the one for "Running", which waits for `release`."""
+    started, release = threading.Event(), threading.Event()
+
+    def speculate(session, prompt_key, context_vars):
+        if context_vars["description"] == "Running":
+            started.set()
+            release.wait(5)
+        return f"Titles for {context_vars['description']}"
+
+    monkeypatch.setattr(speculation, "_speculate", speculate)
+    yield started, release
+    release.set()
+
+def test_take_returns_the_choice_and_cancels_the_rest(fake_speculate):
+    started, release = fake_speculate
+    before = {name: sample("speculations_total", result=name) for name in ("hit", "cancelled", "wasted")}
+    wasted_tokens = sample("speculation_wasted_tokens_total")
+
+    # One worker: the first speculation runs while the others wait in the queue
+    cache = SpeculationCache(max_workers=1)
+    try:
+        for option in ("Running", "Chosen", "Queued"):
+            cache.start("s1", PROMPT, option, titles_vars(option))
+        assert started.wait(5)
+
+        future = cache.take("s1", PROMPT, "Chosen")
+        assert len(cache) == 0
+        release.set()
+        assert future.result(5) == "Titles for Chosen"
+    finally:
+        release.set()
+        cache._pool.shutdown(wait=True)
+
+    assert sample("speculations_total", result="hit") == before["hit"] + 1
+    assert sample("speculations_total", result="cancelled") == before["cancelled"] + 1
+    assert sample("speculations_total", result="wasted") == before["wasted"] + 1
+    # The running speculation finished unused: its prompt and output count as wasted
+    prompt = PROMPT_REGISTRY[PROMPT].render(titles_vars("Running"))
+    expected = estimate_tokens(prompt) + estimate_tokens("Titles for Running")
+    assert sample("speculation_wasted_tokens_total") == wasted_tokens + expected
+
+def test_take_without_a_match_is_a_miss(fake_speculate):
+    misses = sample("speculations_total", result="miss")
+    cache = SpeculationCache(max_workers=1)
+    try:
+        cache.start("s2", PROMPT, "Other", titles_vars("Other"))
+        assert cache.take("s2", PROMPT, match_option("Something else", ["Other"])) is None
+    finally:
+        cache._pool.shutdown(wait=True)
+    assert sample("speculations_total", result="miss") == misses + 1
+    assert len(cache) == 0
+
+def test_match_option_accepts_pasted_options():
+    options = parse_options("1. **Growing Tomatoes**: a guide\n2) Composting 101\n")
+    assert options == ["**Growing Tomatoes**: a guide", "Composting 101"]
+    assert match_option("growing tomatoes", options) == options[0]
+    assert match_option("2. Composting 101.", options) == options[1]
+    assert match_option("", options) is None
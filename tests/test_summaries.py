@@ -0,0 +1,192 @@
+import contextlib
+import json
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import articles_api
+import mongodb_api
+import summary_worker
+import summaryapi
+from article_repository import ArticleRepository, AsyncArticleRepository
+from summary_worker import (
+    AsyncSummaryStore, SummaryStore, SummaryWorker, batch_concurrency, content_hash, summary_source_text
+)
+
+T0 = datetime(2024, 5, 1)
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+def article(title, description, updated):
+    return {"title": title, "meta": {"description": description}, "updatedAt": updated}
+
+class Summarizer:
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+
+    def __call__(self, text):
+        self.calls.append(text)
+        return None if text in self.fail else f"Summary of {text}"
+
+def test_worker_resummarizes_only_changed_articles(db):
+    ids = db.articles.insert_many([article(f"Post {i}", "About the forum", T0 + timedelta(minutes=i)) for i in range(3)]).inserted_ids
+    summarize = Summarizer()
+    worker = SummaryWorker(db.articles, SummaryStore(db.summaries), state=db.state, concurrency=2, summarize=summarize)
+
+    assert worker.run_once() == {"scanned": 3, "summarized": 3, "unchanged": 0, "failed": 0}
+    assert db.state.find_one()["watermark"] == T0 + timedelta(minutes=2)
+
+    # Nothing newer than the watermark: nothing is scanned
+    assert worker.run_once()["scanned"] == 0
+
+    # A touched article with the same text keeps its summary; an edited one is resummarized
+    db.articles.update_one({"_id": ids[0]}, {"$set": {"updatedAt": T0 + timedelta(hours=1)}})
+    db.articles.update_one({"_id": ids[1]}, {"$set": {"title": "Post 1, edited", "updatedAt": T0 + timedelta(hours=2)}})
+    summarize.calls.clear()
+    assert worker.run_once() == {"scanned": 2, "summarized": 1, "unchanged": 1, "failed": 0}
+    assert summarize.calls == ["Post 1, edited About the forum"]
+    stored = db.summaries.find_one({"_id": ids[1]})
+    assert stored["summary"] == "Summary of Post 1, edited About the forum"
+    assert stored["content_hash"] == content_hash("Post 1, edited About the forum")
+    assert db.state.find_one()["watermark"] == T0 + timedelta(hours=2)
+
+def test_worker_keeps_the_watermark_before_a_failure(db):
+    db.articles.insert_many([article(f"Post {i}", "", T0 + timedelta(minutes=i)) for i in range(2)])
+    worker = SummaryWorker(db.articles, SummaryStore(db.summaries), state=db.state, summarize=Summarizer())
+    worker.run_once()
+
+    db.articles.insert_many([article("Broken", "", T0 + timedelta(hours=1)), article("Fine", "", T0 + timedelta(hours=2))])
+    worker.summarize = Summarizer(fail={"Broken"})
+    worker.batch_size = 1
+    assert worker.run_once()["failed"] == 1
+    # The failed article is newer than the watermark, so the next pass retries it
+    assert db.state.find_one()["watermark"] == T0 + timedelta(minutes=1)
+    worker.summarize = Summarizer()
+    assert worker.run_once()["summarized"] == 1
+
+def test_worker_uses_the_configured_version_field(db):
+    db.articles.insert_many([{"title": f"Post {i}", "modifiedAt": T0 + timedelta(minutes=i)} for i in range(2)])
+    worker = SummaryWorker(db.articles, SummaryStore(db.summaries), state=db.state, summarize=Summarizer(),
+                           version_field="modifiedAt")
+    assert worker.run_once()["summarized"] == 2
+    assert db.state.find_one()["watermark"] == T0 + timedelta(minutes=1)
+    db.articles.insert_one({"title": "Post 2", "modifiedAt": T0 + timedelta(hours=1)})
+    assert worker.run_once() == {"scanned": 1, "summarized": 1, "unchanged": 0, "failed": 0}
+
+class StopWatching(Exception):
+    pass
+
+class FlakyArticles:
+    """Articles whose change stream drops its connection once, then turns out to be unsupported."""
+    def __init__(self, collection, changes):
+        self.collection = collection
+        self.outcomes = [AutoReconnect("connection reset"), changes, OperationFailure("not a replica set")]
+
+    def find(self, *args, **kwargs):
+        return self.collection.find(*args, **kwargs)
+
+    def watch(self, pipeline, **kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return contextlib.nullcontext(iter(outcome))
+
+def test_watch_reopens_the_stream_after_a_connection_error(db, monkeypatch):
+    changed = article("Streamed", "", T0)
+    articles = FlakyArticles(db.articles, [{"fullDocument": {"_id": "streamed", **changed}}])
+    summarize = Summarizer()
+    worker = SummaryWorker(articles, SummaryStore(db.summaries), state=db.state, summarize=summarize)
+    runs = []
+    run_once = worker.run_once
+    monkeypatch.setattr(worker, "run_once", lambda: runs.append(1) or run_once())
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 3:
+            raise StopWatching
+
+    monkeypatch.setattr(summary_worker.time, "sleep", sleep)
+    with pytest.raises(StopWatching):
+        worker.watch(poll_interval=7)
+    # Initial pass; catch-up pass after the dropped connection; one poll after streams proved unavailable
+    assert len(runs) == 3 and sleeps == [7, 7, 7]
+    assert summarize.calls == ["Streamed"]
+    assert db.summaries.find_one({"_id": "streamed"})
+
+@pytest.fixture
+def flask_client(db):
+    mongodb_api._articles.set(ArticleRepository(db.articles))
+    mongodb_api._summary_store.set(SummaryStore(db.summaries))
+    return mongodb_api.app.test_client()
+
+@pytest.fixture
+def summaryapi_client(db):
+    summaryapi._articles.set(ArticleRepository(db.articles))
+    summaryapi._summary_store.set(SummaryStore(db.summaries))
+    return summaryapi.app.test_client()
+
+@pytest.fixture
+def asgi_client(db, async_collection):
+    articles_api._articles.set(AsyncArticleRepository(async_collection(db.articles)))
+    articles_api._summary_store.set(AsyncSummaryStore(async_collection(db.summaries)))
+    app = FastAPI()
+    app.include_router(articles_api.router)
+    return TestClient(app)
+
+def seed_stale(db):
+    """One article whose stored summary predates its current title, and one whose summary is current."""
+    edited = db.articles.insert_one(article("New title", "About moderation", T0)).inserted_id
+    current = db.articles.insert_one(article("Kept title", "About onboarding", T0)).inserted_id
+    db.summaries.insert_one({"_id": edited, "title": "Old title", "summary": "Stale summary",
+                             "content_hash": content_hash("Old title About moderation")})
+    db.summaries.insert_one({"_id": current, "title": "Kept title", "summary": "Stored summary",
+                             "content_hash": content_hash(summary_source_text(db.articles.find_one({"_id": current})))})
+    return edited, current
+
+@pytest.mark.parametrize("client", ["flask_client", "summaryapi_client", "asgi_client"])
+def test_summarize_regenerates_stale_summaries(request, db, client):
+    client = request.getfixturevalue(client)
+    edited, current = seed_stale(db)
+
+    body = json.loads(client.post("/summarize", json={"article_id": str(edited)}).text)
+    assert body["title"] == "New title"
+    assert body["summary"] not in ("", "Stale summary")
+    assert db.summaries.find_one({"_id": edited})["content_hash"] == content_hash("New title About moderation")
+
+    assert json.loads(client.post("/summarize", json={"article_id": str(current)}).text)["summary"] == "Stored summary"
+
+@pytest.mark.parametrize("client", ["flask_client", "asgi_client"])
+def test_summarize_batch_regenerates_stale_summaries(request, db, client):
+    client = request.getfixturevalue(client)
+    edited, current = seed_stale(db)
+
+    response = client.post("/summarize/batch", json={"article_ids": [str(edited), str(current)]})
+    items = {item["article_id"]: item for item in map(json.loads, response.text.splitlines())}
+    assert items[str(current)]["summary"] == "Stored summary"
+    assert items[str(edited)]["title"] == "New title"
+    assert items[str(edited)]["summary"] != "Stale summary"
+    assert db.summaries.find_one({"_id": edited})["content_hash"] == content_hash("New title About moderation")
+
+def test_batch_concurrency():
+    assert batch_concurrency(None, 8) == 8
+    assert batch_concurrency(3, 8) == 3
+    assert batch_concurrency("50", 8) == 8
+    for value in ("abc", 0, -2, 1.5, True, [4]):
+        with pytest.raises(ValueError):
+            batch_concurrency(value, 8)
+
+@pytest.mark.parametrize("client", ["flask_client", "asgi_client"])
+def test_summarize_batch_rejects_bad_concurrency(request, db, client):
+    client = request.getfixturevalue(client)
+    edited, _ = seed_stale(db)
+    response = client.post("/summarize/batch", json={"article_ids": [str(edited)], "concurrency": "abc"})
+    assert response.status_code == 400
+    assert "concurrency" in json.loads(response.text)["error"]
@@ -0,0 +1,40 @@
+import pytest
+
+from llm_resilience import PromptVariableError
+from prompt_registry import PROMPT_REGISTRY, CompiledPrompt
+from token_budget import estimate_tokens, field_budget, plan
+
+SYSTEM = "You are an expert Q&A assistant. " * 10
+
+def qa_prompt(system_instruction=SYSTEM, input_tokens=300):
+    return CompiledPrompt("qa", {
+        "prompt": "Answer from the context.\nContext:\n{text}\nQuestion: {question}",
+        "system_instruction": system_instruction,
+        "max_tokens": 100,
+        "budget": {"input_tokens": input_tokens, "field": "text", "query_field": "question"},
+    })
+
+def test_field_budget_counts_the_system_instruction():
+    context_vars = {"text": "", "question": "Who moderates the forum?"}
+    without = field_budget(qa_prompt(None), context_vars, "text", 300)
+    with_system = field_budget(qa_prompt(), context_vars, "text", 300)
+    assert without == 300 - estimate_tokens(qa_prompt().render(context_vars))
+    assert with_system == without - estimate_tokens(SYSTEM)
+
+def test_plan_compacts_when_only_the_system_instruction_overflows():
+    prompt = qa_prompt()
+    question = "Who moderates the forum?"
+    rest = 300 - estimate_tokens(prompt.render({"text": "", "question": question}))
+    text = "word " * int((rest - estimate_tokens(SYSTEM) // 2) * 3.5 / 5)
+    assert estimate_tokens(text) <= rest
+
+    assert plan(qa_prompt(None), {"text": text, "question": question}) is None
+    field, field_tokens, budget = plan(prompt, {"text": text, "question": question})
+    assert field == "text"
+    assert field_tokens == rest - estimate_tokens(SYSTEM)
+    assert budget["input_tokens"] == 300
+
+def test_plan_renders_through_the_compiled_prompt():
+    with pytest.raises(PromptVariableError):
+        plan(qa_prompt(), {"text": "Some article text"})
+    assert plan(PROMPT_REGISTRY["question_answering"], {"text": "Short.", "question": "Why?"}) is None
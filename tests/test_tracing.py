@@ -0,0 +1,48 @@
+import pytest
+from fastapi.testclient import TestClient
+
+pytest.importorskip("opentelemetry.sdk")
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+import api
+
+EXPORTER = InMemorySpanExporter()
+
+@pytest.fixture(scope="module", autouse=True)
+def tracer_provider():
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(EXPORTER))
+    trace.set_tracer_provider(provider)
+    yield
+    provider.shutdown()
+
+def test_chat_request_is_traced_stage_by_stage():
+    EXPORTER.clear()
+    response = TestClient(api.app).post("/chat", json={
+        "session_id": "tracing-1",
+        "message": "What does the article say about weekly moderation reviews?",
+        "text": "The forum grew through weekly moderation reviews and member interviews.",
+    })
+    assert response.status_code == 200
+
+    spans = EXPORTER.get_finished_spans()
+    by_name = {span.name: span for span in spans}
+    assert {"session_load", "intent_routing", "prompt_format", "llm_call", "session_save"} <= set(by_name)
+    assert by_name["llm_call"].attributes["prompt_key"] == "question_answering"
+    assert by_name["intent_routing"].attributes["writer_stage"] == "idle"
+
+    # The routing stage and the LLM call it leads to are both part of handling the message
+    parents = {span.context.span_id: span.parent.span_id if span.parent else None for span in spans}
+
+    def ancestors(span):
+        span_id = parents[span.context.span_id]
+        while span_id is not None:
+            yield span_id
+            span_id = parents.get(span_id)
+
+    for name in ("intent_routing", "prompt_format", "llm_call"):
+        assert by_name["get_bot_response"].context.span_id in ancestors(by_name[name])
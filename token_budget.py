@@ -0,0 +1,199 @@
+"""
+Input token budgets and prompt compaction.
+
+Each prompt in `prompts.PROMPTS` may declare a `budget`:
+
+    "budget": {"input_tokens": 8000, "field": "text", "strategy": "extract"}
+
+`input_tokens` caps the whole request (the rendered prompt and its system
+instruction), and `field` names the context variable that may be shortened to fit. When a prompt is over budget, the
+field is first cleaned (`trim`: whitespace and boilerplate lines), then, if
+still too long, shortened with the prompt's `strategy`:
+
+- `trim`: cleaning only; the prompt is sent even if it stays over budget.
+- `extract`: keep the highest-ranked sentences, in their original order.
+- `map_reduce`: summarize chunks in parallel with the `summarize_chunk`
+  prompt and use the joined notes, falling back to `extract` if even those
+  exceed the budget.
+
+Token counts are estimated locally (`estimate_tokens`), so checking a prompt
+costs no API call.
+"""
+import math
+import re
+import zlib
+from collections import Counter
+
+# Gemini averages about four characters per token on English prose; estimating
+# on the high side keeps real prompts inside their budget
+CHARS_PER_TOKEN = 3.5
+
+STRATEGIES = ("trim", "extract", "map_reduce")
+
+# Used to space content-defined chunk boundaries in `split_for_map`
+_AVERAGE_SENTENCE_CHARS = 120
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_INLINE_SPACE_RE = re.compile(r"[ \t\f\v ]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+_BOILERPLATE_RE = re.compile(
+    r"^\s*(share( this)?( on)?|follow us|subscribe|sign up|sign in|log in|advertisement|sponsored|"
+    r"related (articles|posts)|read more|click here|cookie|accept all|all rights reserved|©|copyright|"
+    r"https?://\S+$|(home|menu|search)\s*([|>»/]\s*\w+\s*)*$)",
+    re.IGNORECASE
+)
+
+def estimate_tokens(text):
+    """Fast upper-leaning token estimate; no tokenizer or network call."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def tokens_to_chars(tokens):
+    return int(tokens * CHARS_PER_TOKEN)
+
+def strip_boilerplate(text):
+    """Collapses whitespace and drops navigation/footer lines and repeated lines."""
+    seen = set()
+    lines = []
+    for line in text.splitlines():
+        line = _INLINE_SPACE_RE.sub(" ", line).strip()
+        if not line:
+            lines.append("")
+            continue
+        key = line.lower()
+        # Short lines that repeat (menus, bylines, share bars) carry no content the second time
+        if _BOILERPLATE_RE.match(line) or (len(line) < 120 and key in seen):
+            continue
+        seen.add(key)
+        lines.append(line)
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+
+def extract_sentences(text, max_tokens, query=None):
+    """
+    Extractive compaction: keeps the most informative sentences that fit in `max_tokens`.
+
+    Sentences are scored by the average document frequency of their content
+    words (words the article keeps returning to), with a bonus for the
+    opening sentences and for words shared with `query`. The kept sentences
+    are returned in their original order.
+    """
+    from retrieval import tokenize
+
+    sentences = split_sentences(text)
+    if not sentences:
+        return ""
+    tokenized = [tokenize(s) for s in sentences]
+    frequency = Counter(t for tokens in tokenized for t in set(tokens))
+    query_terms = set(tokenize(query)) if query else set()
+
+    scores = []
+    for i, tokens in enumerate(tokenized):
+        if not tokens:
+            scores.append(0.0)
+            continue
+        score = sum(frequency[t] for t in tokens) / len(tokens)
+        score += 3.0 * len(query_terms.intersection(tokens))
+        if i < 3:
+            score *= 1.5
+        scores.append(score)
+
+    budget_chars = tokens_to_chars(max_tokens)
+    keep, used = set(), 0
+    for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+        size = len(sentences[i]) + 1
+        if used + size > budget_chars:
+            continue
+        keep.add(i)
+        used += size
+    if not keep:
+        # Even the best sentence does not fit: cut it
+        return sentences[max(range(len(sentences)), key=lambda i: scores[i])][:budget_chars]
+    return " ".join(sentences[i] for i in sorted(keep))
+
+def split_for_map(text, chunk_tokens):
+    """
+    Chunks for the map step of `map_reduce`, on sentence boundaries.
+
+    Boundaries are content-defined: a chunk ends after a sentence whose hash
+    picks it as a cut point (once the chunk is at least half full), or when
+    it reaches `chunk_tokens`. A boundary depends only on the sentences just
+    before it, so editing one paragraph changes the chunks around the edit
+    and leaves the rest, and their cached summaries, as they were.
+    """
+    max_chars = tokens_to_chars(chunk_tokens)
+    min_chars = max_chars // 2
+    # About one cut point per max_chars / 4 characters of average prose
+    modulus = max(1, max_chars // (4 * _AVERAGE_SENTENCE_CHARS))
+
+    chunks, current, size = [], [], 0
+    for sentence in split_sentences(text):
+        # Hard-split sentences that are longer than a whole chunk
+        while len(sentence) > max_chars:
+            if current:
+                chunks.append(" ".join(current))
+                current, size = [], 0
+            chunks.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if not sentence:
+            continue
+        if current and size + len(sentence) > max_chars:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += len(sentence) + 1
+        if size >= min_chars and zlib.crc32(sentence.encode("utf-8")) % modulus == 0:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def field_budget(prompt, context_vars, field, input_tokens):
+    """Tokens left for `field` once the rest of the request is rendered, system instruction included."""
+    overhead = estimate_tokens(prompt.render({**context_vars, field: ""}))
+    if prompt.system_instruction:
+        overhead += estimate_tokens(prompt.system_instruction)
+    return max(0, input_tokens - overhead)
+
+def plan(prompt, context_vars):
+    """
+    Checks a compiled prompt (`prompt_registry.CompiledPrompt`) against its budget.
+
+    Returns None if the prompt fits (or has no budget), otherwise
+    (field, field_tokens, budget) where `field_tokens` is what `field` must
+    shrink to.
+    """
+    budget = prompt.config.get("budget")
+    if not budget or not context_vars:
+        return None
+    field = budget.get("field", "text")
+    value = context_vars.get(field)
+    if not isinstance(value, str):
+        return None
+    field_tokens = field_budget(prompt, context_vars, field, budget["input_tokens"])
+    if estimate_tokens(value) <= field_tokens:
+        return None
+    return field, field_tokens, budget
+
+def compact(text, field_tokens, budget, query=None, map_fn=None):
+    """
+    Shrinks `text` to about `field_tokens` with the budget's strategy.
+
+    `map_fn(chunks) -> list of summaries` runs the map step of `map_reduce`;
+    without it `map_reduce` falls back to `extract`.
+    """
+    strategy = budget.get("strategy", "extract")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown compaction strategy '{strategy}'. Available: {', '.join(STRATEGIES)}")
+
+    text = strip_boilerplate(text)
+    if strategy == "trim" or estimate_tokens(text) <= field_tokens:
+        return text
+    if strategy == "map_reduce" and map_fn is not None:
+        chunks = split_for_map(text, budget.get("chunk_tokens", 3000))
+        text = "\n\n".join(s for s in map_fn(chunks) if s)
+        if estimate_tokens(text) <= field_tokens:
+            return text
+    return extract_sentences(text, field_tokens, query=query)